@@ -1,16 +1,35 @@
 #!/usr/bin/env python3
 """
 Add page counter "Pag. {current}/{total}" to every page of PDFs in a folder.
-Saves modified files with a "_numbered" suffix.
+Saves modified files with an "_iloveVerum" suffix.
 """
 
+import argparse
 import io
+import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
 
 from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    ContentStream,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+)
+from reportlab.lib.rl_accel import fp_str
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
 
+import metrics
+from disk_cache import file_sha256
+
 # ---------- HEADER: page number location & size ----------
 # Placed in the header: top-right, 0.25 in from top, 1 in from right (clear of body margin).
 FONT_SIZE = 18
@@ -57,53 +76,316 @@ def create_page_number_overlay(width_pt: float, height_pt: float, current: int,
     return buffer.read()
 
 
-def add_numbers_to_pdf(input_path: Path, output_path: Path) -> None:
-    """Add 'Pag. n/total' to each page and save to output_path."""
-    reader = PdfReader(input_path)
-    total_pages = len(reader.pages)
-    writer = PdfWriter()
+def _add_object(writer: PdfWriter, obj) -> IndirectObject:
+    # Content streams must be indirect objects, and pypdf has no public call that adds
+    # one to a writer: PdfWriter._add_object is what its own page methods use. It has
+    # kept this signature since PyPDF2; requirements.txt pins the range checked (<7).
+    return writer._add_object(obj)
+
+
+class PageNumberStamper:
+    """
+    Stamp "Pag. n/total" directly into pages of a PdfWriter.
+
+    Equivalent to merging create_page_number_overlay() onto every page, without
+    building and re-parsing an overlay PDF per page: the font resource is created
+    once per writer and each page only gets a small text content stream appended.
+    """
+
+    _CHARSET = "Pag. 0123456789/"
+    FONT_KEY = NameObject("/FPagNum")
+
+    def __init__(self, writer: PdfWriter):
+        self.writer = writer
+        # Shared by every stamped page: the header font and the q / Q streams that wrap
+        # the original content.
+        self.font_ref, self._encoding = self._make_font(writer)
+        self.push_ref = _add_object(writer, self._stream(b"q\n"))
+        self.pop_ref = _add_object(writer, self._stream(b"Q\n"))
+        self._layout: dict[tuple[float, float], tuple[float, float]] = {}
+
+    @staticmethod
+    def _stream(data: bytes) -> DecodedStreamObject:
+        stream = DecodedStreamObject()
+        stream.set_data(data)
+        return stream
+
+    @classmethod
+    def _make_font(cls, writer: PdfWriter) -> tuple[IndirectObject, dict[str, int]]:
+        # Let reportlab emit the font once (this also handles registered TrueType
+        # subsets such as Arial), then reuse its font object and character codes.
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer)
+        c.setFont(FONT_NAME, FONT_SIZE)
+        c.drawString(0, 0, cls._CHARSET)
+        c.save()
+        page = PdfReader(io.BytesIO(buffer.getvalue())).pages[0]
+
+        font_key, codes = None, b""
+        for operands, operator in ContentStream(page.get_contents(), page.pdf).operations:
+            if operator == b"Tf":
+                font_key = operands[0]
+            elif operator == b"Tj":
+                text = operands[0]
+                codes = text.get_original_bytes() if hasattr(text, "get_original_bytes") else bytes(text)
+        fonts = page["/Resources"]["/Font"].get_object()
+        font_ref = fonts.raw_get(font_key).clone(writer)
+        return font_ref, dict(zip(cls._CHARSET, codes))
+
+    def _position(self, width_pt: float, height_pt: float) -> tuple[float, float]:
+        key = (width_pt, height_pt)
+        pos = self._layout.get(key)
+        if pos is None:
+            pos = self._layout[key] = (width_pt - HEADER_RIGHT_MARGIN_PT, height_pt - HEADER_TOP_PT)
+        return pos
 
-    for page_num in range(total_pages):
-        page = reader.pages[page_num]
+    def _encode(self, text: str) -> bytes:
+        raw = bytes(self._encoding[ch] for ch in text)
+        return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+    def content(self, width_pt: float, height_pt: float, current: int, total: int) -> bytes:
+        """Content-stream operators drawing the header on a page of the given size."""
+        x_right, baseline_y = self._position(width_pt, height_pt)
+        text = f"Pag. {current}/{total}"
+        x = x_right - stringWidth(text, FONT_NAME, FONT_SIZE)
+        return b"BT %s %s Tf 1 0 0 1 %s %s Tm (%s) Tj ET\n" % (
+            self.FONT_KEY.encode(), fp_str(FONT_SIZE).encode(),
+            fp_str(x).encode(), fp_str(baseline_y).encode(), self._encode(text),
+        )
+
+    def stamp(self, page, current: int, total: int) -> None:
+        """Add the header to `page`, which must already belong to this stamper's writer."""
         mediabox = page.mediabox
-        width_pt = float(mediabox.width)
-        height_pt = float(mediabox.height)
+        ops = self.content(float(mediabox.width), float(mediabox.height), current, total)
+
+        if "/Resources" not in page:
+            page[NameObject("/Resources")] = DictionaryObject()
+        resources = page["/Resources"].get_object()
+        if "/Font" not in resources:
+            resources[NameObject("/Font")] = DictionaryObject()
+        resources["/Font"].get_object()[self.FONT_KEY] = self.font_ref
+
+        # Keep the original content in its own graphics state, as merge_page does.
+        parts = []
+        if "/Contents" in page:
+            contents = page.raw_get("/Contents")
+            resolved = contents.get_object()
+            if isinstance(resolved, ArrayObject):
+                parts = list(resolved)
+            elif isinstance(contents, IndirectObject):
+                parts = [contents]
+            else:
+                parts = [_add_object(self.writer, resolved)]
+        page[NameObject("/Contents")] = ArrayObject(
+            [self.push_ref, *parts, self.pop_ref, _add_object(self.writer, self._stream(ops))]
+        )
+
+
+def add_numbers_to_pdf(input_path: Path, output_path: Path) -> int:
+    """Add 'Pag. n/total' to each page and save to output_path. Returns the page count."""
+    with metrics.STAGE_SECONDS.time(stage="add_numbers_to_pdf"):
+        reader = PdfReader(input_path)
+        total_pages = len(reader.pages)
+        writer = PdfWriter()
+        stamper = PageNumberStamper(writer)
+
+        stamp_s = 0.0
+        for page_num in range(total_pages):
+            page = writer.add_page(reader.pages[page_num])
+            t = time.perf_counter()
+            stamper.stamp(page, page_num + 1, total_pages)
+            stamp_s += time.perf_counter() - t
+        metrics.STAGE_SECONDS.observe(stamp_s, stage="number")
+
+        with open(output_path, "wb") as f, metrics.STAGE_SECONDS.time(stage="write"):
+            writer.write(f)
+    metrics.PAGES.inc(total_pages, stage="add_numbers_to_pdf")
+    metrics.BYTES.inc(Path(output_path).stat().st_size, stage="add_numbers_to_pdf", direction="out")
+    return total_pages
 
-        overlay_pdf_bytes = create_page_number_overlay(
-            width_pt, height_pt, page_num + 1, total_pages
+
+OUTPUT_SUFFIX = "_iloveVerum"
+MANIFEST_NAME = ".iloveverum-manifest.json"
+MANIFEST_SAVE_INTERVAL_S = 10
+
+
+@dataclass
+class BatchResult:
+    numbered: int = 0
+    skipped: int = 0
+    failed: int = 0
+    pages: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        rate = f"{self.numbered / self.seconds:.1f} files/s, {self.pages / self.seconds:.1f} pages/s" if self.seconds else "-"
+        return (
+            f"Numbered {self.numbered} file(s), {self.pages} page(s) in {self.seconds:.1f} s ({rate}); "
+            f"skipped {self.skipped} unchanged, {self.failed} failed"
         )
-        overlay_reader = PdfReader(io.BytesIO(overlay_pdf_bytes))
-        overlay_page = overlay_reader.pages[0]
 
-        page.merge_page(overlay_page)
-        writer.add_page(page)
 
-    with open(output_path, "wb") as f:
-        writer.write(f)
+def _is_output(path: Path) -> bool:
+    return path.stem.endswith(OUTPUT_SUFFIX) or path.stem.endswith("_numbered")
+
+
+def _load_manifest(path: Path) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_manifest(path: Path, manifest: dict) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _number_file(pdf_path: str, output_path: str, known_sha256: str | None) -> tuple[str, int | None]:
+    """
+    Batch worker: number one file unless its content matches known_sha256 and the
+    output still exists. Returns (sha256, pages) — pages is None when skipped.
+    """
+    digest = file_sha256(Path(pdf_path))
+    if digest == known_sha256 and os.path.exists(output_path):
+        return digest, None
+    partial = output_path + ".part"
+    try:
+        pages = add_numbers_to_pdf(Path(pdf_path), Path(partial))
+        os.replace(partial, output_path)
+    except BaseException:
+        Path(partial).unlink(missing_ok=True)
+        raise
+    return digest, pages
 
 
-def process_folder(folder: Path) -> None:
-    """Find all PDFs in folder (non-recursive) and add page numbers with _numbered suffix."""
+def process_folder(
+    folder: Path,
+    recursive: bool = False,
+    jobs: int = 1,
+    incremental: bool = False,
+) -> BatchResult:
+    """
+    Add page numbers to every PDF in folder, writing <name>_iloveVerum.pdf next to it.
+
+    recursive: also process PDFs in subfolders.
+    jobs: number files in up to this many worker processes.
+    incremental: keep a manifest (MANIFEST_NAME in folder) of input size, mtime and
+        SHA-256 → output, and skip inputs that have not changed since their output was made.
+    """
     folder = Path(folder).resolve()
     if not folder.is_dir():
         raise NotADirectoryError(f"Not a directory: {folder}")
 
-    pdf_files = sorted(folder.glob("*.pdf"))
-    # Skip already numbered files to avoid double numbering
-    pdf_files = [f for f in pdf_files if not f.stem.endswith("_numbered")]
+    pdf_files = sorted(folder.rglob("*.pdf") if recursive else folder.glob("*.pdf"))
+    # Skip our own outputs to avoid double numbering
+    pdf_files = [f for f in pdf_files if not _is_output(f)]
+
+    manifest_path = folder / MANIFEST_NAME
+    manifest = _load_manifest(manifest_path) if incremental else {}
+    result = BatchResult()
+    start = time.perf_counter()
 
+    todo = []
     for pdf_path in pdf_files:
-        out_name = f"{pdf_path.stem}_iloveVerum.pdf"
-        output_path = pdf_path.parent / out_name
-        add_numbers_to_pdf(pdf_path, output_path)
-        print(f"Created: {output_path}")
+        key = pdf_path.relative_to(folder).as_posix()
+        output_path = pdf_path.with_name(f"{pdf_path.stem}{OUTPUT_SUFFIX}.pdf")
+        st = pdf_path.stat()
+        entry = manifest.get(key)
+        if (
+            entry is not None
+            and entry["size"] == st.st_size
+            and entry["mtime_ns"] == st.st_mtime_ns
+            and output_path.exists()
+        ):
+            result.skipped += 1
+            continue
+        known = entry["sha256"] if entry is not None else None
+        todo.append((key, pdf_path, output_path, st, known))
 
+    last_save = time.monotonic()
+    finished = 0
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
+    def _done(item, digest: str | None, pages: int | None, error: Exception | None) -> None:
+        nonlocal last_save, finished
+        key, pdf_path, output_path, st, _ = item
+        finished += 1
+        if error is not None:
+            result.failed += 1
+            print(f"[{finished}/{len(todo)}] Failed: {pdf_path}: {error}", file=sys.stderr)
+        elif pages is None:
+            result.skipped += 1  # touched but identical content
+        else:
+            result.numbered += 1
+            result.pages += pages
+            print(f"[{finished}/{len(todo)}] Created: {output_path} ({pages} pages)")
+        if incremental and error is None:
+            manifest[key] = {
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "sha256": digest,
+                "output": output_path.relative_to(folder).as_posix(),
+            }
+            if time.monotonic() - last_save > MANIFEST_SAVE_INTERVAL_S:
+                _save_manifest(manifest_path, manifest)
+                last_save = time.monotonic()
+
+    try:
+        if jobs <= 1 or len(todo) <= 1:
+            for item in todo:
+                try:
+                    digest, pages = _number_file(str(item[1]), str(item[2]), item[4])
+                except Exception as e:
+                    _done(item, None, None, e)
+                else:
+                    _done(item, digest, pages, None)
+        else:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(todo))) as pool:
+                futures = {pool.submit(_number_file, str(item[1]), str(item[2]), item[4]): item for item in todo}
+                for fut in as_completed(futures):
+                    try:
+                        digest, pages = fut.result()
+                    except Exception as e:
+                        _done(futures[fut], None, None, e)
+                    else:
+                        _done(futures[fut], digest, pages, None)
+    finally:
+        if incremental:
+            # Forget inputs that no longer exist, then record what was done (even if interrupted).
+            for key in [k for k in manifest if not (folder / k).exists()]:
+                del manifest[key]
+            _save_manifest(manifest_path, manifest)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Add 'Pag. n/total' to every PDF in a folder (writes <name>_iloveVerum.pdf)."
+    )
+    parser.add_argument("folder", nargs="?", type=Path, help="Folder with PDFs (default: current directory)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Also process subfolders")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, metavar="N", help="Number files in N parallel processes (default: 1)"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"Skip files unchanged since the last run (tracked in {MANIFEST_NAME} in the folder)",
+    )
+    args = parser.parse_args()
+
+    folder = args.folder
+    if folder is None:
         folder = Path.cwd()
         print(f"No folder given; using current directory: {folder}")
-    else:
-        folder = Path(sys.argv[1])
+    result = process_folder(folder, recursive=args.recursive, jobs=args.jobs, incremental=args.incremental)
+    print(result.summary())
+    return 1 if result.failed else 0
 
-    process_folder(folder)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,26 +2,239 @@
 Web app: (1) Add page numbers to a PDF. (2) Merge PDF & Word and optionally add page numbers.
 """
 
+import functools
 import io
+import os
+import shutil
 import tempfile
 from pathlib import Path
 
-from flask import Flask, render_template, request, send_file
+from flask import Flask, Response, jsonify, render_template, request, send_file
 
+import metrics
+import profiling
 from add_page_numbers import add_numbers_to_pdf
-from pdf_pipeline import build_merged_pdf
+from blob_store import UploadError, get_store
+from disk_cache import file_sha256
+from merge_cache import cached_result, merge_cached, merge_key, result_cache
+from merge_jobs import get_runner
+from pdf_optimize import PROFILES, can_linearize
+from pdf_pipeline import backend_registry, conversion_cache, parse_page_ranges
+from scheduler import CONVERSIONS, REQUESTS, Cancelled, Deadline, DeadlineExceeded, Overloaded, cancel_on_disconnect
 
 app = Flask(__name__)
-app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024  # 50 MB
+# Uploads are spooled to disk and results streamed from disk, so memory per request
+# stays small and the limit only bounds temp disk usage.
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", 200)) * 1024 * 1024
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class _TempDirFile(io.FileIO):
+    """A read-only file that removes its temporary directory when it is closed."""
+
+    def __init__(self, path: Path, tmp_dir: Path):
+        super().__init__(path, "rb")
+        self.tmp_dir = tmp_dir
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def _send_pdf_and_cleanup(path: Path, tmp_dir: Path, download_name: str):
+    """Stream `path` to the client and remove tmp_dir once the response is closed."""
+    # The response passes the open file straight to the server (wsgi.file_wrapper, so
+    # sendfile where the server has it), and the server closes it once it is sent:
+    # that close is where the temp directory goes.
+    size = path.stat().st_size
+    file = _TempDirFile(path, tmp_dir)
+    try:
+        response = send_file(
+            file,
+            as_attachment=True,
+            download_name=download_name,
+            mimetype="application/pdf",
+            etag=False,  # a fresh temp file's mtime/size tag says nothing; callers set the cache key
+        )
+    except BaseException:
+        file.close()
+        raise
+    response.content_length = size  # send_file only knows the size of a path
+    return response
+
+
+def _uploaded_files():
+    """Return (files, error) for a merge form — "files", "files[]", or any file field."""
+    files = request.files.getlist("files") or request.files.getlist("files[]")
+    if not files:
+        files = [v for v in request.files.values() if v and getattr(v, "filename", None)]
+    files = [f for f in files if f and getattr(f, "filename", None)]
+    if not files:
+        return [], "No files uploaded. Select one or more PDF or DOCX files."
+    return files, None
+
+
+def _merge_inputs():
+    """
+    Return (count, save, error) for a merge form. Inputs are either file parts or, in
+    merge order, "blob_ids" of files sent earlier through /uploads (with optional
+    "names" for messages). save(upload_dir) puts them in upload_dir and returns paths.
+    """
+    blob_ids = request.form.getlist("blob_ids")
+    if not blob_ids:
+        files, error = _uploaded_files()
+        return len(files), lambda upload_dir: _save_uploads(files, upload_dir), error
+    store = get_store()
+    missing = [blob_id for blob_id in blob_ids if store.find(blob_id) is None]
+    if missing:
+        return 0, None, f"Unknown blob id(s): {', '.join(missing)}. Upload the file(s) again."
+    names = request.form.getlist("names")
+    return len(blob_ids), lambda upload_dir: _link_blobs(blob_ids, names, upload_dir), None
+
+
+def _safe_name(name: str | None) -> str:
+    """The last component of a client-supplied filename, so it cannot leave the upload dir."""
+    name = Path(name or "").name
+    return name if name not in ("", ".", "..") else "file"
+
+
+def _link_blobs(blob_ids: list[str], names: list[str], upload_dir: Path) -> list[Path]:
+    """
+    Hard-link stored blobs into upload_dir, one subdirectory each so names may repeat.
+    UploadError (409) if a blob was evicted after _merge_inputs found it.
+    """
+    paths = []
+    for i, blob_id in enumerate(blob_ids):
+        name = _safe_name(names[i] if i < len(names) else None)
+        (upload_dir / f"{i:04d}").mkdir()
+        try:
+            paths.append(get_store().link(blob_id, upload_dir / f"{i:04d}" / name))
+        except KeyError:
+            raise UploadError(f"Blob {blob_id} is no longer stored. Upload the file again.", 409) from None
+    return paths
+
+
+def _form_flag(name: str) -> bool:
+    return request.form.get(name, "false").lower() in ("1", "true", "yes")
+
+
+def _page_ranges(file_count: int):
+    """Return (page_ranges, error) from the optional "pages" fields, one per file in order."""
+    ranges = [r.strip() or None for r in request.form.getlist("pages")]
+    if not any(ranges):
+        return None, None
+    if len(ranges) != file_count:
+        return None, f"Got {len(ranges)} page ranges for {file_count} files; send one (possibly empty) per file."
+    try:
+        for spec in ranges:
+            if spec:
+                parse_page_ranges(spec)
+    except ValueError as e:
+        return None, str(e)
+    return ranges, None
+
+
+def _merge_options(file_count: int):
+    """
+    Return (enumerate, output_name, options, error) — options are extra
+    write_merged_pdf arguments.
+    """
+    enumerate_pages = _form_flag("enumerate")
+    output_name = (request.form.get("output_name", "").strip() or "merged_output")
+    if not output_name.endswith(".pdf"):
+        output_name += ".pdf"
+    options = {"dedupe": _form_flag("dedupe")}
+    optimize = request.form.get("optimize", "").strip()
+    if optimize:
+        if optimize not in PROFILES:
+            return enumerate_pages, output_name, options, f"Unknown optimization profile: {optimize}"
+        options["optimize"] = optimize
+    if _form_flag("linearize"):
+        if not can_linearize():
+            return enumerate_pages, output_name, options, "Linearized output needs pikepdf or qpdf on the server."
+        options["linearize"] = True
+    page_ranges, error = _page_ranges(file_count)
+    if page_ranges:
+        options["page_ranges"] = page_ranges
+    return enumerate_pages, output_name, options, error
+
+
+def _save_uploads(files, upload_dir: Path) -> list[Path]:
+    """Stream uploads into upload_dir in merge order, renaming duplicate filenames."""
+    paths = []
+    name_count = {}
+    for f in files:
+        base = _safe_name(f.filename)
+        if base not in name_count:
+            name_count[base] = 0
+        name_count[base] += 1
+        if name_count[base] > 1:
+            stem, ext = base.rsplit(".", 1) if "." in base else (base, "")
+            base = f"{stem}_{name_count[base]}.{ext}" if ext else f"{stem}_{name_count[base]}"
+        path = upload_dir / base
+        f.save(path, buffer_size=UPLOAD_CHUNK_SIZE)
+        paths.append(path)
+    return paths
+
+
+def _job_status(job: dict) -> dict:
+    status = {
+        "id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": {"done": job["done"], "total": job["total"]},
+        "error": job["error"],
+        "status_url": f"/jobs/{job['id']}",
+    }
+    if job["status"] == "done":
+        status["download_url"] = f"/jobs/{job['id']}/download"
+    return status
+
+
+def _profiled(view):
+    """
+    Profile the view (profiling.profiled) when the request carries the profiling token
+    in an X-Profile header or a "profile" query parameter; the report's file name is
+    returned in X-Profile-Report. Requests without a token run the view untouched.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get("X-Profile") or request.args.get("profile")
+        if not token:
+            return view(*args, **kwargs)
+        if not profiling.allowed(token):
+            return "Profiling is not enabled or the token is wrong", 403
+        with profiling.profiled(f"{request.method} {request.path}") as profile:
+            response = app.make_response(view(*args, **kwargs))
+        response.headers["X-Profile-Report"] = profile.stats_path.name
+        return response
+
+    return wrapper
+
+
+@app.errorhandler(Overloaded)
+def _overloaded(e: Overloaded):
+    return str(e), 429, {"Retry-After": str(e.retry_after)}
+
+
+@app.errorhandler(Cancelled)
+def _cancelled(e: Cancelled):
+    # 504 when the job ran out of time; 503 when it was cancelled (usually the client
+    # hung up, so nobody reads it, but proxies and access logs still get a standard code).
+    return str(e), 504 if isinstance(e, DeadlineExceeded) else 503
 
 
 @app.route("/")
 def index():
     # Main site shows only the merge UI
-    return render_template("merge.html")
+    return render_template("merge.html", can_linearize=can_linearize())
 
 
 @app.route("/process", methods=["POST"])
+@_profiled
 def process():
     if "pdf" not in request.files:
         return "No file uploaded", 400
@@ -31,66 +244,206 @@ def process():
     if not file.filename.lower().endswith(".pdf"):
         return "Only PDF files are allowed", 400
 
-    with tempfile.TemporaryDirectory() as tmp:
-        input_path = Path(tmp) / "input.pdf"
-        output_path = Path(tmp) / "output_numbered.pdf"
-        file.save(input_path)
-        add_numbers_to_pdf(input_path, output_path)
-        base = Path(file.filename).stem
-        download_name = f"{base}_iloveVerum.pdf"
-        return send_file(
-            output_path,
-            as_attachment=True,
-            download_name=download_name,
-            mimetype="application/pdf",
-        )
+    with REQUESTS.slot():
+        tmp = Path(tempfile.mkdtemp())
+        try:
+            input_path = tmp / "input.pdf"
+            output_path = tmp / "output_numbered.pdf"
+            file.save(input_path, buffer_size=UPLOAD_CHUNK_SIZE)
+            add_numbers_to_pdf(input_path, output_path)
+            base = Path(file.filename).stem
+            return _send_pdf_and_cleanup(output_path, tmp, f"{base}_iloveVerum.pdf")
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
 
 
 @app.route("/merge", methods=["GET", "POST"])
+@_profiled
 def merge():
     if request.method == "GET":
-        return render_template("merge.html")
-    # POST: merge files — support "files", "files[]", or any multi-part file field
-    files = request.files.getlist("files") or request.files.getlist("files[]")
-    if not files:
-        files = [v for v in request.files.values() if v and getattr(v, "filename", None)]
-    files = [f for f in files if f and getattr(f, "filename", None)]
-    if not files:
-        return "No files uploaded. Select one or more PDF or DOCX files.", 400
-    enumerate_pages = request.form.get("enumerate", "false").lower() in ("1", "true", "yes")
-    output_name = (request.form.get("output_name", "").strip() or "merged_output")
-    if not output_name.endswith(".pdf"):
-        output_name += ".pdf"
-    with tempfile.TemporaryDirectory() as tmp:
-        tmp = Path(tmp)
-        paths = []
-        name_count = {}
-        for f in files:
-            base = f.filename or "file"
-            if base not in name_count:
-                name_count[base] = 0
-            name_count[base] += 1
-            if name_count[base] > 1:
-                stem, ext = base.rsplit(".", 1) if "." in base else (base, "")
-                base = f"{stem}_{name_count[base]}.{ext}" if ext else f"{stem}_{name_count[base]}"
-            path = tmp / base
-            path.write_bytes(f.read())
-            paths.append(path)
+        return render_template("merge.html", can_linearize=can_linearize())
+    # Admission comes first, so a refused request costs no upload; 429 via _overloaded.
+    with Deadline() as deadline, REQUESTS.slot(deadline):
+        count, save_inputs, error = _merge_inputs()
+        if error:
+            return error, 400
+        enumerate_pages, output_name, options, error = _merge_options(count)
+        if error:
+            return error, 400
+        tmp = Path(tempfile.mkdtemp())
         try:
-            out_path = tmp / output_name
-            build_merged_pdf(paths, out_path, enumerate=enumerate_pages, temp_dir=tmp)
-            pdf_bytes = out_path.read_bytes()
-            return send_file(
-                io.BytesIO(pdf_bytes),
-                as_attachment=True,
-                download_name=output_name,
-                mimetype="application/pdf",
-            )
+            upload_dir = tmp / "uploads"
+            upload_dir.mkdir()
+            paths = save_inputs(upload_dir)
+            digests = None
+            # Only a cached result has stable bytes behind its key, so only then is it an ETag.
+            if result_cache().enabled:
+                # Blob ids are the inputs' SHA-256 already; file parts are hashed.
+                digests = request.form.getlist("blob_ids") or [file_sha256(p) for p in paths]
+                key = merge_key(digests, enumerate=enumerate_pages, **options)
+                if request.if_none_match.contains(key) and cached_result(key) is not None:
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    return "", 304, {"ETag": f'"{key}"'}
+            with cancel_on_disconnect(request.environ, deadline):
+                key, out_path = merge_cached(
+                    paths, tmp, enumerate=enumerate_pages, digests=digests, deadline=deadline,
+                    limiter=CONVERSIONS, **options,
+                )
+            response = _send_pdf_and_cleanup(out_path, tmp, output_name)
+            if key is not None:  # None: not cached (cache off, or a fallback converter was used)
+                response.set_etag(key)
+                response.headers["Content-Location"] = f"/merges/{key}"
+            return response
+        except Cancelled:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        except UploadError as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return str(e), e.status
+        except ValueError as e:  # the inputs don't fit the request, e.g. a page range past the end
+            shutil.rmtree(tmp, ignore_errors=True)
+            return str(e), 400
         except Exception as e:
+            shutil.rmtree(tmp, ignore_errors=True)
             return str(e), 500
 
 
-import os
+@app.route("/merges/<key>")
+def merge_result(key):
+    """
+    A cached merge result by its ETag, served inline: 304 for If-None-Match, 206 for
+    Range requests (how a viewer shows page 1 of a linearized file early), 404 once evicted.
+    """
+    path = cached_result(key)
+    if path is None:
+        return "Result not cached (any more); merge again", 404
+    return send_file(path, mimetype="application/pdf", etag=key, conditional=True, max_age=0)
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """Queue a merge in the background; poll GET /jobs/<id> and fetch /jobs/<id>/download."""
+    runner = get_runner()
+    runner.admit()  # 429 when too many jobs are waiting
+    count, save_inputs, error = _merge_inputs()
+    if error:
+        return error, 400
+    enumerate_pages, output_name, options, error = _merge_options(count)
+    if error:
+        return error, 400
+    job_id, upload_dir = runner.store.new_job_dir()
+    try:
+        paths = save_inputs(upload_dir)
+    except UploadError as e:
+        shutil.rmtree(runner.store.job_dir(job_id), ignore_errors=True)  # no job record exists yet
+        return str(e), e.status
+    except Exception:
+        shutil.rmtree(runner.store.job_dir(job_id), ignore_errors=True)
+        raise
+    runner.store.create(job_id, paths, enumerate_pages, output_name, options)
+    runner.submit(job_id)
+    return jsonify(_job_status(runner.store.get(job_id))), 202
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_runner().store.get(job_id)
+    if job is None:
+        return "Job not found", 404
+    return jsonify(_job_status(job))
+
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    """Cancel a queued or running job (202), or delete a finished one and its result (204)."""
+    runner = get_runner()
+    job = runner.store.get(job_id)
+    if job is None:
+        return "Job not found", 404
+    if runner.cancel(job_id):
+        return jsonify(_job_status(runner.store.get(job_id))), 202
+    runner.store.delete(job_id)
+    return "", 204
+
+
+@app.route("/jobs/<job_id>/download")
+def job_download(job_id):
+    store = get_runner().store
+    job = store.get(job_id)
+    if job is None:
+        return "Job not found", 404
+    if job["status"] != "done":
+        return f"Job is {job['status']}", 409
+    # Byte ranges and If-Range/ETag checks, so viewers can fetch a linearized result piecemeal.
+    return send_file(
+        store.result_path(job_id),
+        as_attachment=True,
+        download_name=job["output_name"],
+        mimetype="application/pdf",
+        conditional=True,
+    )
+
+
+def _upload_error(e: UploadError):
+    body = {"error": str(e)}
+    if e.offset is not None:
+        body["offset"] = e.offset
+    return jsonify(body), e.status
+
+
+@app.route("/uploads", methods=["POST"])
+def start_upload():
+    """
+    Announce a file as JSON {"sha256", "size"}. 200 with "blob_id" if the server has it
+    already; otherwise 201 with the "upload_id" and the "offset" to send chunks from.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        state = get_store().start(data.get("sha256"), data.get("size"))
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify(state.as_dict()), 200 if state.complete else 201
+
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    try:
+        return jsonify(get_store().status(upload_id).as_dict())
+    except UploadError as e:
+        return _upload_error(e)
+
+
+@app.route("/uploads/<upload_id>", methods=["PATCH"])
+def upload_chunk(upload_id):
+    """Append the request body at the Upload-Offset header; 409 with the right offset if it is stale."""
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+    except ValueError:
+        return jsonify({"error": "Upload-Offset header required"}), 400
+    try:
+        state = get_store().append(upload_id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify(state.as_dict())
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify({**conversion_cache().stats(), "results": result_cache().stats()})
+
+
+@app.route("/converters")
+def converters_status():
+    return jsonify(backend_registry.status())
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus text format; values are per worker process.
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 PORT = int(os.environ.get("PORT", 5050))
 
 if __name__ == "__main__":
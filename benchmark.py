@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the PDF pipeline.
+
+    python benchmark.py run -o results.json             # full suite, JSON report
+    python benchmark.py run --quick --compare base.json # smaller corpus, flag regressions
+    python benchmark.py numbering --pages 500           # stamping engine vs. overlays
+
+`run` builds a synthetic corpus locally (reportlab PDFs, python-docx documents) and
+times every stage on its own: each convert_docx_to_pdf backend, merge_pdfs,
+add_numbers_to_pdf and end-to-end build_merged_pdf. Each case runs in a fresh
+process so peak RSS belongs to that case alone. The conversion cache is disabled.
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import A4, landscape, letter
+from reportlab.pdfgen import canvas
+
+from add_page_numbers import add_numbers_to_pdf, create_page_number_overlay
+
+# Corpus sizes as (full, --quick).
+HUGE_PDF_PAGES = (1000, 200)
+MANY_SMALL_PDFS = (100, 20)
+DOCX_IMAGES = (12, 4)
+DOCX_TABLES = (60, 15)
+DOCX_REPORT_PAGES = (200, 40)
+DEFAULT_THRESHOLD = 0.15  # relative slow-down / growth reported as a regression
+MIN_WALL_DELTA_S = 0.05   # ignore timing noise on very fast cases
+
+
+# ---------- Synthetic corpus ----------
+
+def make_text_pdf(path: Path, pages: int) -> Path:
+    """Write a synthetic PDF with `pages` short text pages in mixed page sizes."""
+    sizes = [A4, letter, landscape(A4)]
+    c = canvas.Canvas(str(path))
+    for i in range(pages):
+        c.setPageSize(sizes[i % len(sizes)])
+        c.setFont("Helvetica", 12)
+        c.drawString(72, 400, f"Synthetic page {i + 1} of {pages}")
+        for line in range(20):
+            c.drawString(72, 380 - 14 * line, "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 2)
+        c.rect(72, 80, 200, 40)
+        c.showPage()
+    c.save()
+    return path
+
+
+def _photo_jpeg(rng: random.Random, width: int, height: int) -> bytes:
+    # Noise compresses badly, like camera photos do.
+    from PIL import Image
+
+    img = Image.frombytes("RGB", (width, height), rng.randbytes(width * height * 3))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def make_image_docx(path: Path, images: int, seed: int = 1) -> Path:
+    """Write a DOCX with `images` full-resolution photos between short paragraphs."""
+    from docx import Document
+    from docx.shared import Cm
+
+    rng = random.Random(seed)
+    doc = Document()
+    doc.add_heading("Image-heavy document", 1)
+    for i in range(images):
+        doc.add_paragraph(f"Photo {i + 1}: a full-resolution image printed a few centimetres wide.")
+        doc.add_picture(io.BytesIO(_photo_jpeg(rng, 1600, 1200)), width=Cm(8))
+    doc.save(str(path))
+    return path
+
+
+def make_report_docx(path: Path, pages: int, seed: int = 2) -> Path:
+    """Write a DOCX of `pages` pages, each with the same logo, text and (every 5th) a photo."""
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_BREAK
+    from docx.shared import Cm
+
+    rng = random.Random(seed)
+    logo = _photo_jpeg(rng, 800, 300)
+    doc = Document()
+    for i in range(pages):
+        doc.add_picture(io.BytesIO(logo), width=Cm(4))
+        doc.add_heading(f"Section {i + 1}", 2)
+        for _ in range(4):
+            p = doc.add_paragraph("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4)
+            p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+        if i % 5 == 0:
+            doc.add_picture(io.BytesIO(_photo_jpeg(rng, 1600, 1200)), width=Cm(8))
+        doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+    doc.save(str(path))
+    return path
+
+
+def make_table_docx(path: Path, tables: int) -> Path:
+    """Write a DOCX with `tables` 10x5 tables."""
+    from docx import Document
+
+    doc = Document()
+    doc.add_heading("Table-heavy document", 1)
+    for t in range(tables):
+        doc.add_paragraph(f"Table {t + 1}")
+        table = doc.add_table(rows=10, cols=5)
+        table.style = "Table Grid"
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                cell.text = f"R{r + 1}C{c + 1} value {t * 50 + r * 5 + c}"
+    doc.save(str(path))
+    return path
+
+
+def build_corpus(root: Path, quick: bool) -> Path:
+    """Create the benchmark corpus under `root` and return it."""
+    k = 1 if quick else 0
+    root.mkdir(parents=True, exist_ok=True)
+    make_text_pdf(root / "small.pdf", 3)
+    make_text_pdf(root / "huge.pdf", HUGE_PDF_PAGES[k])
+    many = root / "many"
+    many.mkdir(exist_ok=True)
+    for i in range(MANY_SMALL_PDFS[k]):
+        make_text_pdf(many / f"part_{i:03d}.pdf", 3)
+    make_image_docx(root / "images.docx", DOCX_IMAGES[k])
+    make_table_docx(root / "tables.docx", DOCX_TABLES[k])
+    make_report_docx(root / "report.docx", DOCX_REPORT_PAGES[k])
+    return root
+
+
+# ---------- Cases (each runs in its own process) ----------
+
+def _case_convert(corpus: Path, out: Path, backend: str, doc: str) -> Path | None:
+    import pdf_pipeline
+
+    try_backend = dict(pdf_pipeline._backend_chain())[backend]
+    pdf_path = out / f"{Path(doc).stem}.pdf"
+    return pdf_path if try_backend(corpus / doc, pdf_path) else None
+
+
+def _case_merge(corpus: Path, out: Path, which: str, streaming: bool = False) -> Path:
+    from pdf_pipeline import merge_pdfs
+
+    inputs = sorted((corpus / "many").glob("*.pdf")) if which == "many" else [corpus / "huge.pdf"]
+    merge_pdfs(inputs, out / "merged.pdf", streaming=streaming)
+    return out / "merged.pdf"
+
+
+def _case_numbers(corpus: Path, out: Path) -> Path:
+    add_numbers_to_pdf(corpus / "huge.pdf", out / "numbered.pdf")
+    return out / "numbered.pdf"
+
+
+def _case_build(corpus: Path, out: Path) -> Path:
+    from pdf_pipeline import build_merged_pdf
+
+    inputs = [corpus / "small.pdf", corpus / "tables.docx", corpus / "huge.pdf", corpus / "images.docx"]
+    return build_merged_pdf(inputs, out / "final.pdf", enumerate=True)
+
+
+def _cases() -> dict:
+    import pdf_pipeline
+
+    cases = {}
+    for backend, _ in pdf_pipeline._backend_chain():
+        for doc in ("images.docx", "tables.docx", "report.docx"):
+            cases[f"convert/{backend}/{Path(doc).stem}"] = (_case_convert, (backend, doc))
+    cases["merge_pdfs/many_small"] = (_case_merge, ("many",))
+    cases["merge_pdfs/huge"] = (_case_merge, ("huge",))
+    cases["merge_pdfs/huge_streaming"] = (_case_merge, ("huge", True))
+    cases["add_numbers_to_pdf/huge"] = (_case_numbers, ())
+    cases["build_merged_pdf/mixed"] = (_case_build, ())
+    return cases
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_case(name: str, corpus: str) -> dict:
+    os.environ["PDF_CACHE_MAX_MB"] = "0"
+    fn, args = _cases()[name]
+    with tempfile.TemporaryDirectory() as out:
+        start = time.perf_counter()
+        try:
+            result = fn(Path(corpus), Path(out), *args)
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+        wall = time.perf_counter() - start
+        if result is None:
+            return {"status": "unavailable"}
+        return {
+            "status": "ok",
+            "wall_s": round(wall, 4),
+            "peak_rss_mb": _peak_rss_mb(),
+            "output_bytes": Path(result).stat().st_size,
+        }
+
+
+def run_suite(corpus: Path, repeat: int, only: str | None = None) -> dict:
+    """Run every case `repeat` times in fresh processes; keep the best wall time."""
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name in _cases():
+        if only and only not in name:
+            continue
+        runs = []
+        for _ in range(repeat):
+            with ctx.Pool(1) as pool:
+                runs.append(pool.apply(_run_case, (name, str(corpus))))
+            if runs[-1]["status"] != "ok":
+                break
+        ok = [r for r in runs if r["status"] == "ok"]
+        if ok:
+            best = min(ok, key=lambda r: r["wall_s"])
+            rss = [r["peak_rss_mb"] for r in ok if r["peak_rss_mb"] is not None]
+            best = dict(best, peak_rss_mb=round(max(rss), 1) if rss else None)
+        else:
+            best = runs[-1]
+        results[name] = best
+        print(_format_row(name, best), flush=True)
+    return results
+
+
+def _format_row(name: str, r: dict) -> str:
+    if r["status"] != "ok":
+        return f"  {name:<42} {r['status']}"
+    rss = f"{r['peak_rss_mb']:8.1f} MB" if r["peak_rss_mb"] is not None else "        -  "
+    return f"  {name:<42} {r['wall_s']:8.3f} s {rss} {r['output_bytes']:>12} bytes"
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Return human-readable regressions of `current` against `baseline`."""
+    regressions = []
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None or base.get("status") != "ok":
+            continue
+        if cur["status"] != "ok":
+            regressions.append(f"{name}: was ok, now {cur['status']}")
+            continue
+        for metric in ("wall_s", "peak_rss_mb", "output_bytes"):
+            old, new = base.get(metric), cur.get(metric)
+            if metric == "wall_s" and old and new and new - old < MIN_WALL_DELTA_S:
+                continue
+            if old and new and new > old * (1 + threshold):
+                regressions.append(f"{name}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+# ---------- Page-number stamping vs. the previous overlay approach ----------
+
+def number_with_overlays(input_path: Path, output_path: Path) -> None:
+    """Previous add_numbers_to_pdf: render, re-parse and merge one overlay PDF per page."""
+    reader = PdfReader(input_path)
+    total_pages = len(reader.pages)
+    writer = PdfWriter()
+    for page_num, page in enumerate(reader.pages):
+        overlay = create_page_number_overlay(
+            float(page.mediabox.width), float(page.mediabox.height), page_num + 1, total_pages
+        )
+        page.merge_page(PdfReader(io.BytesIO(overlay)).pages[0])
+        writer.add_page(page)
+    with open(output_path, "wb") as f:
+        writer.write(f)
+
+
+def _time(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_numbering(pages: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        src = make_text_pdf(tmp / "input.pdf", pages)
+        overlay_out, stamp_out = tmp / "overlay.pdf", tmp / "stamped.pdf"
+        overlay_s = _time(number_with_overlays, src, overlay_out, repeat=repeat)
+        stamp_s = _time(add_numbers_to_pdf, src, stamp_out, repeat=repeat)
+        print(f"pages: {pages}  (best of {repeat})")
+        print(f"  overlay merge : {overlay_s:8.3f} s  {overlay_out.stat().st_size:>10} bytes")
+        print(f"  stamper       : {stamp_s:8.3f} s  {stamp_out.stat().st_size:>10} bytes")
+        print(f"  speed-up      : {overlay_s / stamp_s:8.1f}x")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark PDF pipeline stages.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run the stage benchmark suite")
+    p_run.add_argument("-o", "--output", type=Path, help="Write results as JSON to this file")
+    p_run.add_argument("--compare", type=Path, metavar="BASELINE", help="Flag regressions against a saved JSON run")
+    p_run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                       help=f"Relative increase counted as a regression (default: {DEFAULT_THRESHOLD})")
+    p_run.add_argument("--quick", action="store_true", help="Use a smaller corpus")
+    p_run.add_argument("--repeat", type=int, default=3, help="Runs per case; best wall time is kept (default: 3)")
+    p_run.add_argument("--only", metavar="SUBSTRING", help="Only run cases whose name contains SUBSTRING")
+    p_run.add_argument("--corpus", type=Path, help="Build/reuse the corpus in this directory instead of a temp dir")
+
+    p_num = sub.add_parser("numbering", help="Page-number stamping vs. per-page overlays")
+    p_num.add_argument("--pages", type=int, default=500, help="Pages in the synthetic PDF (default: 500)")
+    p_num.add_argument("--repeat", type=int, default=3, help="Runs per variant; best is reported (default: 3)")
+    args = parser.parse_args()
+
+    if args.command == "numbering":
+        bench_numbering(args.pages, args.repeat)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = args.corpus or Path(tmp) / "corpus"
+        if not (corpus / "huge.pdf").exists():
+            print(f"Building corpus in {corpus} ...", flush=True)
+            build_corpus(corpus, args.quick)
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "quick": args.quick,
+                "repeat": args.repeat,
+            },
+            "results": run_suite(corpus, args.repeat, args.only),
+        }
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"Results: {args.output}")
+    if args.compare:
+        regressions = compare(json.loads(args.compare.read_text()), report, args.threshold)
+        if regressions:
+            print(f"\nRegressions against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.compare}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
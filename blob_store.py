@@ -0,0 +1,263 @@
+"""
+Content-addressed store for uploaded files, with resumable chunked uploads.
+
+A client announces a file by its SHA-256 and size. If the store already holds that
+content the upload is skipped; otherwise the bytes are sent in chunks, each appended
+at the offset the server reports, so a dropped connection only costs the chunk in
+flight. Once complete the content is checked against the announced hash and kept as
+a blob whose id is that hash. Blobs live in a DiskCache (least recently used evicted
+first) and are hard-linked into a merge's input directory, so a blob evicted while a
+merge runs does not disappear from under it.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from disk_cache import DiskCache, file_sha256
+
+try:
+    import fcntl
+except ImportError:  # Windows: uploads are serialized per process only
+    fcntl = None
+
+# ---------- Upload settings (overridable through the environment) ----------
+BLOB_DIR = Path(os.environ.get("UPLOAD_BLOB_DIR", Path(tempfile.gettempdir()) / "pdf-master2-blobs"))
+BLOB_MAX_MB = int(os.environ.get("UPLOAD_BLOB_MAX_MB", 2048))
+MAX_FILE_MB = int(os.environ.get("UPLOAD_MAX_FILE_MB", 1024))
+UPLOAD_CHUNK_MB = int(os.environ.get("UPLOAD_CHUNK_MB", 8))
+UPLOAD_SESSION_TTL_S = int(os.environ.get("UPLOAD_SESSION_TTL", 24 * 3600))
+# ------------------------------------------------------------------
+
+_BLOB_ID = re.compile(r"^[0-9a-f]{64}$")
+_KINDS = (".pdf", ".docx")
+_COPY_CHUNK = 1024 * 1024
+
+
+class UploadError(Exception):
+    """A rejected upload request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400, offset: int | None = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+@dataclass
+class UploadState:
+    upload_id: str
+    size: int
+    offset: int
+    blob_id: str | None = None  # set once the blob is complete
+
+    @property
+    def complete(self) -> bool:
+        return self.blob_id is not None
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "complete": self.complete, "chunk_size": UPLOAD_CHUNK_MB * 1024 * 1024}
+
+
+def _kind(path: Path) -> str | None:
+    """".pdf" or ".docx" judged by content (uploads carry no trustworthy name), else None."""
+    with open(path, "rb") as f:
+        head = f.read(1024)
+    if b"%PDF-" in head:
+        return ".pdf"
+    if head.startswith(b"PK"):
+        try:
+            with zipfile.ZipFile(path) as z:
+                z.getinfo("word/document.xml")
+            return ".docx"
+        except (zipfile.BadZipFile, KeyError):
+            return None
+    return None
+
+
+class BlobStore:
+    """Blobs keyed by SHA-256 under root/blobs, upload sessions under root/uploads."""
+
+    def __init__(self, root: Path = BLOB_DIR, max_bytes: int = BLOB_MAX_MB * 1024 * 1024,
+                 max_file_bytes: int = MAX_FILE_MB * 1024 * 1024):
+        self.root = Path(root)
+        self.blobs = DiskCache(self.root / "blobs", max_bytes, suffix="")
+        self.uploads = self.root / "uploads"
+        self.uploads.mkdir(parents=True, exist_ok=True)
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+        self._upload_locks: dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def valid_id(blob_id: str) -> bool:
+        return bool(_BLOB_ID.match(blob_id or ""))
+
+    def find(self, blob_id: str) -> Path | None:
+        """Path of a stored blob, or None (also for malformed ids). Not counted as a cache hit or miss."""
+        if not self.valid_id(blob_id):
+            return None
+        found = self.blobs.lookup((blob_id + kind for kind in _KINDS), count=False)
+        return found[1] if found else None
+
+    def _part(self, upload_id: str) -> Path:
+        return self.uploads / f"{upload_id}.part"
+
+    def _meta(self, upload_id: str) -> Path:
+        return self.uploads / f"{upload_id}.json"
+
+    def start(self, sha256: str, size: int) -> UploadState:
+        """
+        Announce an upload. Returns a complete state if the blob is already stored,
+        otherwise the session (new or resumed) with the offset to continue from.
+        Uploads of the same content share one session: the hash is the upload id.
+        """
+        sha256 = (sha256 or "").lower()
+        if not self.valid_id(sha256):
+            raise UploadError("sha256 must be 64 hex digits")
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError("size must be a positive number of bytes")
+        if size > self.max_file_bytes:
+            raise UploadError(f"File too large (limit {self.max_file_bytes // (1024 * 1024)} MB)", 413)
+        if self.find(sha256) is not None:
+            return UploadState(sha256, size, size, blob_id=sha256)
+        self.cleanup()
+        with self._lock:
+            meta = self._meta(sha256)
+            if meta.exists() and json.loads(meta.read_text()).get("size") != size:
+                self._discard(sha256)  # announced with another size before: start over
+            if not meta.exists():
+                meta.write_text(json.dumps({"size": size, "created": time.time()}))
+                self._part(sha256).touch()
+        return self.status(sha256)
+
+    def status(self, upload_id: str) -> UploadState:
+        if not self.valid_id(upload_id):
+            raise UploadError("Unknown upload; announce it again with POST /uploads", 404)
+        blob = self.find(upload_id)
+        if blob is not None:
+            size = blob.stat().st_size
+            return UploadState(upload_id, size, size, blob_id=upload_id)
+        try:
+            size = json.loads(self._meta(upload_id).read_text())["size"]
+            offset = self._part(upload_id).stat().st_size
+        except (OSError, ValueError, KeyError):
+            raise UploadError("Unknown upload; announce it again with POST /uploads", 404) from None
+        return UploadState(upload_id, size, offset)
+
+    def append(self, upload_id: str, offset: int, body: BinaryIO, length: int | None = None) -> UploadState:
+        """
+        Append the bytes of `body` at `offset`. A chunk that does not start at the
+        current end of the upload is refused with status 409 and the offset to use.
+        The upload completes when its announced size is reached.
+        """
+        state = self.status(upload_id)
+        if state.complete:
+            return state
+        with self._lock:
+            lock = self._upload_locks.setdefault(upload_id, threading.Lock())
+        try:
+            with lock:
+                with open(self._part(upload_id), "ab") as part:
+                    if fcntl is not None:
+                        fcntl.flock(part, fcntl.LOCK_EX)  # other worker processes
+                    if not self._meta(upload_id).exists():
+                        # Completed or expired meanwhile; "ab" has just recreated the file.
+                        self._part(upload_id).unlink(missing_ok=True)
+                        return self.status(upload_id)
+                    current = os.fstat(part.fileno()).st_size
+                    if offset != current:
+                        raise UploadError(f"Expected offset {current}", 409, offset=current)
+                    remaining = state.size - current
+                    if length is not None and length > remaining:
+                        raise UploadError(f"Chunk runs past the announced size ({remaining} bytes left)", 413, offset=current)
+                    while remaining > 0:
+                        chunk = body.read(min(_COPY_CHUNK, remaining))
+                        if not chunk:
+                            break
+                        part.write(chunk)
+                        remaining -= len(chunk)
+                    if remaining == 0 and body.read(1):
+                        # Never keep a chunk that overruns the announced size.
+                        part.truncate(current)
+                        raise UploadError("Chunk runs past the announced size", 413, offset=current)
+                    part.flush()
+                    offset = os.fstat(part.fileno()).st_size
+                if offset == state.size and self._meta(upload_id).exists():
+                    return self._finish(upload_id, state.size)
+        finally:
+            # Keep the lock while the session lives; drop it once it is finished or discarded,
+            # however append ended (a failed hash check discards the session and raises).
+            if not self._meta(upload_id).exists():
+                with self._lock:
+                    self._upload_locks.pop(upload_id, None)
+        return UploadState(upload_id, state.size, offset)
+
+    def _finish(self, upload_id: str, size: int) -> UploadState:
+        part = self._part(upload_id)
+        if file_sha256(part) != upload_id:
+            self._discard(upload_id)
+            raise UploadError("Upload does not match its SHA-256; send it again", 422, offset=0)
+        kind = _kind(part)
+        if kind is None:
+            self._discard(upload_id)
+            raise UploadError("Only PDF and Word (.docx) files can be merged", 415)
+        self.blobs.store(upload_id + kind, part, move=True)
+        self._discard(upload_id)
+        return UploadState(upload_id, size, size, blob_id=upload_id)
+
+    def _discard(self, upload_id: str) -> None:
+        self._part(upload_id).unlink(missing_ok=True)
+        self._meta(upload_id).unlink(missing_ok=True)
+
+    def cleanup(self, ttl_s: float = UPLOAD_SESSION_TTL_S) -> int:
+        """Drop upload sessions not written to for ttl_s; returns how many."""
+        cutoff = time.time() - ttl_s
+        dropped = 0
+        for meta in self.uploads.glob("*.json"):
+            upload_id = meta.stem
+            try:
+                last = max(meta.stat().st_mtime, self._part(upload_id).stat().st_mtime)
+            except FileNotFoundError:
+                last = 0
+            if last < cutoff:
+                self._discard(upload_id)
+                with self._lock:
+                    self._upload_locks.pop(upload_id, None)
+                dropped += 1
+        return dropped
+
+    def link(self, blob_id: str, dest: Path) -> Path:
+        """
+        Make blob `blob_id` available as `dest` with the suffix of its kind (hard link,
+        or a copy across filesystems) and return that path. KeyError if unknown.
+        """
+        src = self.find(blob_id)
+        if src is None:
+            raise KeyError(blob_id)
+        dest = Path(dest)
+        if dest.suffix.lower() in _KINDS:
+            dest = dest.with_suffix("")
+        dest = dest.with_name(dest.name + src.suffix)
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+        return dest
+
+
+_store: BlobStore | None = None
+
+
+def get_store() -> BlobStore:
+    """The process-wide blob store under BLOB_DIR."""
+    global _store
+    if _store is None:
+        _store = BlobStore()
+    return _store
@@ -0,0 +1,171 @@
+"""
+Registry of DOCX → PDF converter backends.
+
+Each backend is probed once (is LibreOffice installed? do mammoth and weasyprint
+import?) instead of on every conversion. A backend that fails on a document another
+backend then converts is put in a cool-down and skipped for a while; observed latency
+(seconds per MB) is tracked per backend. For each document the registry orders the
+usable backends by quality, or — for simple text-only documents when the fast path is
+allowed — by observed speed. Under a deadline, backends expected to need more than the
+time left are tried after those expected to finish in time.
+"""
+
+import os
+import re
+import threading
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+# ---------- Registry settings (overridable through the environment) ----------
+COOLDOWN_S = float(os.environ.get("DOCX_BACKEND_COOLDOWN", 300))
+FAST_PATH = os.environ.get("DOCX_FAST_PATH", "0").lower() in ("1", "true", "yes")
+SIMPLE_DOC_MAX_BYTES = 512 * 1024
+LATENCY_EWMA_ALPHA = 0.3
+# ------------------------------------------------------------------
+
+# convert(docx_path, pdf_path, deadline) -> success; deadline is a scheduler.Deadline or None.
+ConvertFn = Callable[..., bool]
+
+
+@dataclass
+class DocxProfile:
+    """Cheap facts about a .docx, read from its zip directory and document.xml."""
+
+    size: int
+    images: int
+    tables: int
+
+    @property
+    def simple(self) -> bool:
+        return self.images == 0 and self.tables == 0 and self.size <= SIMPLE_DOC_MAX_BYTES
+
+
+def inspect_docx(path: Path) -> DocxProfile:
+    size = Path(path).stat().st_size
+    images = tables = 0
+    try:
+        with zipfile.ZipFile(path) as z:
+            images = sum(1 for name in z.namelist() if name.startswith("word/media/"))
+            with z.open("word/document.xml") as f:
+                tables = len(re.findall(rb"<w:tbl>", f.read()))
+    except (zipfile.BadZipFile, KeyError, OSError):
+        pass
+    return DocxProfile(size=size, images=images, tables=tables)
+
+
+def _size_mb(size: int) -> float:
+    return max(size / (1024 * 1024), 0.01)  # floor, so tiny files don't inflate the rate
+
+
+@dataclass
+class Backend:
+    name: str
+    convert: ConvertFn
+    probe: Callable[[], bool]
+    fast: bool = False                 # eligible for the fast path on simple documents
+    available: bool | None = None      # probe result, filled in once
+    cooldown_until: float = 0.0
+    latency_s_per_mb: float | None = None
+    stats: dict = field(default_factory=lambda: {"success": 0, "failure": 0})
+
+
+class BackendRegistry:
+    """Backends in preference order, with probing, cool-downs and latency tracking."""
+
+    def __init__(self):
+        self._backends: list[Backend] = []
+        self._lock = threading.Lock()
+
+    def register(self, name: str, convert: ConvertFn, probe: Callable[[], bool], fast: bool = False) -> None:
+        """Add a backend; registration order is quality order (best first)."""
+        with self._lock:
+            self._backends.append(Backend(name, convert, probe, fast))
+
+    def probe(self) -> dict[str, bool]:
+        """Run every backend's capability check once; later calls return the cached result."""
+        with self._lock:
+            pending = [b for b in self._backends if b.available is None]
+        for backend in pending:
+            try:
+                backend.available = bool(backend.probe())
+            except Exception:
+                backend.available = False
+        return {b.name: b.available for b in self._backends}
+
+    def backends(self) -> list[Backend]:
+        """All registered backends in quality order, whether or not they are available."""
+        return list(self._backends)
+
+    def available(self) -> list[Backend]:
+        self.probe()
+        return [b for b in self._backends if b.available]
+
+    def plan(
+        self,
+        profile: DocxProfile | None = None,
+        fast_path: bool = FAST_PATH,
+        size: int | None = None,
+        budget_s: float | None = None,
+    ) -> list[Backend]:
+        """
+        Backends to try for one document, in order.
+
+        Quality order by default. Simple documents (profile) with fast_path allowed try
+        the backends by observed speed instead, fast-path backends first among equals;
+        backends without a measurement yet count as fastest so they get one. With a
+        budget_s (e.g. a deadline's time left) and the document's size in bytes,
+        backends whose observed latency predicts more than the budget move behind the
+        rest. Cooling-down backends go last (still tried if everything else fails).
+        """
+        now = time.monotonic()
+        usable = self.available()
+        ready = [b for b in usable if b.cooldown_until <= now]
+        cooling = [b for b in usable if b.cooldown_until > now]
+        if fast_path and profile is not None and profile.simple:
+            ready.sort(key=lambda b: (b.latency_s_per_mb or 0.0, not b.fast))
+        if size is None and profile is not None:
+            size = profile.size
+        if budget_s is not None and size is not None:
+            fits = [b for b in ready if self.expected_s(b, size) <= budget_s]
+            ready = fits + [b for b in ready if b not in fits]
+        return ready + cooling
+
+    @staticmethod
+    def expected_s(backend: Backend, size: int) -> float:
+        """Predicted seconds to convert `size` bytes (0 while the backend is unmeasured)."""
+        return (backend.latency_s_per_mb or 0.0) * _size_mb(size)
+
+    def record(self, backend: Backend, ok: bool, seconds: float, size: int) -> None:
+        with self._lock:
+            backend.stats["success" if ok else "failure"] += 1
+            if ok:
+                backend.cooldown_until = 0.0
+                per_mb = seconds / _size_mb(size)
+                old = backend.latency_s_per_mb
+                backend.latency_s_per_mb = per_mb if old is None else (
+                    LATENCY_EWMA_ALPHA * per_mb + (1 - LATENCY_EWMA_ALPHA) * old
+                )
+
+    def cool_down(self, backends: list[Backend]) -> None:
+        """Skip these backends for COOLDOWN_S (they failed where another backend succeeded)."""
+        until = time.monotonic() + COOLDOWN_S
+        with self._lock:
+            for backend in backends:
+                backend.cooldown_until = until
+
+    def status(self) -> list[dict]:
+        self.probe()
+        now = time.monotonic()
+        return [
+            {
+                "name": b.name,
+                "available": b.available,
+                "cooling_down_s": round(max(0.0, b.cooldown_until - now), 1),
+                "latency_s_per_mb": b.latency_s_per_mb,
+                **b.stats,
+            }
+            for b in self._backends
+        ]
@@ -0,0 +1,171 @@
+"""
+Content-addressed, size-bounded file cache on local disk.
+
+Entries are files named after a caller-supplied key (normally a SHA-256 hex digest
+plus a qualifier). Writes go to a temporary file in the same directory followed by
+os.replace, so several processes can share one cache directory without readers ever
+seeing a partial file. Reads refresh the entry's mtime and eviction removes the
+least recently used entries until the cache fits its byte budget.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+_TMP_SUFFIX = ".tmp"
+_STALE_TMP_S = 3600  # leftovers from crashed writers are removed after an hour
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Return the hex SHA-256 of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DiskCache:
+    """LRU file cache under `directory`, holding at most `max_bytes` of entries."""
+
+    def __init__(self, directory: Path, max_bytes: int, suffix: str = ".pdf"):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def fetch(self, keys: Iterable[str], dest: Path) -> str | None:
+        """
+        Copy the first cached entry among `keys` to `dest`.
+
+        Returns the key that was served, or None on a miss. One lookup counts as a
+        single hit or miss however many keys were tried.
+        """
+        if not self.enabled:
+            return None
+        for key in keys:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as src, open(dest, "wb") as out:
+                    shutil.copyfileobj(src, out)
+            except FileNotFoundError:
+                continue
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self._count(True)
+            return key
+        self._count(False)
+        return None
+
+    def lookup(self, keys: Iterable[str], count: bool = True) -> tuple[str, Path] | None:
+        """
+        Like fetch(), but return (key, path) of the cached entry itself instead of
+        copying it. Callers must tolerate the file being evicted once they let go of it.
+        count=False leaves the hit/miss statistics alone, for stores that use the cache
+        as plain storage rather than as a cache.
+        """
+        if not self.enabled:
+            return None
+        for key in keys:
+            path = self._path(key)
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                pass
+            if count:
+                self._count(True)
+            return key, path
+        if count:
+            self._count(False)
+        return None
+
+    def store(self, key: str, src: Path, move: bool = False) -> None:
+        """
+        Atomically add `src` to the cache under `key`, then evict down to the budget.
+        move: rename `src` into the cache instead of copying it (copies across devices).
+        """
+        if not self.enabled:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if move:
+            try:
+                os.replace(src, path)
+                self.evict()
+                return
+            except OSError:
+                pass  # another filesystem: fall back to copying
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=_TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+                shutil.copyfileobj(f, out)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        if move:
+            Path(src).unlink(missing_ok=True)
+        self.evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        now = time.time()
+        for path in self.directory.glob("*/*"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.name.endswith(_TMP_SUFFIX):
+                if now - st.st_mtime > _STALE_TMP_S:
+                    path.unlink(missing_ok=True)
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache is within max_bytes."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            # Another process may have removed it already; that still frees the space.
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        entries = self._entries() if self.directory.exists() else []
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,114 @@
+"""
+Embedded images of a .docx, prepared for PDF rendering.
+
+Word files often carry full-resolution camera photos that print a few centimetres
+wide. display_widths() reads how wide each image is drawn in the document, and
+downsample() scales an image to TARGET_DPI at that width and recompresses it, so the
+converters decode, embed and write far fewer pixels.
+"""
+
+import hashlib
+import io
+import os
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+# ---------- Image settings (overridable through the environment) ----------
+TARGET_DPI = int(os.environ.get("DOCX_IMAGE_DPI", 150))  # 0 keeps images untouched
+JPEG_QUALITY = int(os.environ.get("DOCX_IMAGE_JPEG_QUALITY", 85))
+# ------------------------------------------------------------------
+
+EMU_PER_INCH = 914400
+_SLACK = 1.1  # images up to 10% above target are left alone
+
+_WP = "{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}"
+_BLIP = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+_EMBED = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed"
+_IMAGE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+
+def image_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def display_widths(docx_path) -> dict[str, float]:
+    """
+    Return {image_key(bytes): widest drawn width in inches} for the images placed in
+    the body of a .docx. Unreadable documents give an empty dict.
+    """
+    widths: dict[str, float] = {}
+    try:
+        with zipfile.ZipFile(docx_path) as z:
+            targets = {}
+            with z.open("word/_rels/document.xml.rels") as f:
+                for rel in ET.parse(f).getroot():
+                    if rel.get("Type") == _IMAGE_REL and rel.get("TargetMode") != "External":
+                        target = rel.get("Target", "")
+                        name = target.lstrip("/") if target.startswith("/") else posixpath.join("word", target)
+                        targets[rel.get("Id")] = posixpath.normpath(name)
+            keys: dict[str, str] = {}
+            with z.open("word/document.xml") as f:
+                for _, el in ET.iterparse(f):
+                    if el.tag not in (_WP + "inline", _WP + "anchor"):
+                        continue
+                    extent = el.find(_WP + "extent")
+                    blip = el.find(".//" + _BLIP)
+                    name = targets.get(blip.get(_EMBED)) if blip is not None else None
+                    if extent is not None and name:
+                        if name not in keys:
+                            keys[name] = image_key(z.read(name))
+                        width = int(extent.get("cx", 0)) / EMU_PER_INCH
+                        widths[keys[name]] = max(widths.get(keys[name], 0.0), width)
+                    el.clear()
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, OSError, ValueError):
+        pass
+    return widths
+
+
+def downsample(data: bytes, content_type: str, width_in: float, dpi: int = TARGET_DPI) -> tuple[bytes, str]:
+    """
+    Scale a raster image down to `dpi` pixels per inch at `width_in` inches and
+    recompress it (JPEG stays JPEG, everything else becomes PNG).
+
+    Returns (data, content_type). The original is returned unchanged when it is
+    already small enough, cannot be read by Pillow (e.g. EMF), or the result would not
+    be smaller.
+    """
+    if dpi <= 0 or width_in <= 0:
+        return data, content_type
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return data, content_type
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            fmt = img.format
+            target_w = max(1, round(width_in * dpi))
+            # The drawn width is that of the upright image; EXIF orientations 5-8 swap axes.
+            w, h = img.size
+            if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                w, h = h, w
+            if w <= target_w * _SLACK:
+                return data, content_type
+            target_h = max(1, round(h * target_w / w))
+            # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 instead of decoding every pixel.
+            img.draft(img.mode, (target_w, target_h) if (w, h) == img.size else (target_h, target_w))
+            img = ImageOps.exif_transpose(img)
+            if img.mode == "P":
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            elif img.mode == "1":
+                img = img.convert("L")
+            small = img.resize((target_w, target_h), Image.LANCZOS)
+            out = io.BytesIO()
+            if fmt == "JPEG" and small.mode in ("RGB", "L", "CMYK"):
+                small.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+                result = (out.getvalue(), "image/jpeg")
+            else:
+                if small.mode not in ("RGB", "RGBA", "L", "LA", "I", "I;16"):
+                    small = small.convert("RGBA" if "A" in small.getbands() else "RGB")
+                small.save(out, "PNG", optimize=True)
+                result = (out.getvalue(), "image/png")
+    except Exception:
+        return data, content_type
+    return result if len(result[0]) < len(data) else (data, content_type)
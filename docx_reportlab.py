@@ -0,0 +1,274 @@
+"""
+Last-resort Word-to-PDF rendering with python-docx and reportlab (no system libraries).
+
+Keeps bold/italic/underline, headings, alignment, tables and images, and scales to
+long, image-heavy documents:
+
+- each distinct image (by content) is downsampled to its drawn size once, written to
+  a work directory and drawn by file name, so reportlab embeds it once however often
+  it appears and JPEGs go in without being decoded;
+- streams are written binary rather than ASCII85 (pure Python without rl_accel);
+- paragraph styles are created once per (style, alignment);
+- flowables are generated while reportlab lays out pages, so only a short window of
+  the story exists at a time.
+"""
+
+import io
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from docx_images import TARGET_DPI, display_widths, downsample, image_key
+
+# Letter with 1-inch margins as laid out by convert(), less the frame's 6 pt padding
+# (and some room below images, so one never overflows a page).
+_MAX_W_PT = 6.5 * 72 - 12
+_MAX_H_PT = 9.0 * 72 - 24
+# Images whose drawn size is unknown fit this box (1 pixel = 1 point at most).
+_DEFAULT_BOX_IN = (5.5, 2.5)
+_LOOKAHEAD = 64  # flowables kept ready ahead of the layout
+
+_a85_lock = threading.Lock()
+_a85_users = 0
+_a85_saved = None
+
+
+@contextmanager
+def _binary_streams():
+    """
+    Write streams binary instead of ASCII85 while the block runs. Without rl_accel
+    reportlab encodes A85 in pure Python, which dominated the time spent embedding
+    images. rl_config is process-wide, so the first of overlapping builds switches
+    A85 off and the last one puts back whatever was configured before.
+    """
+    global _a85_users, _a85_saved
+    from reportlab import rl_config
+
+    with _a85_lock:
+        if _a85_users == 0:
+            _a85_saved = rl_config.useA85
+            rl_config.useA85 = 0
+        _a85_users += 1
+    try:
+        yield
+    finally:
+        with _a85_lock:
+            _a85_users -= 1
+            if _a85_users == 0:
+                rl_config.useA85 = _a85_saved
+
+
+class _LazyStory(list):
+    """
+    A story for DocTemplate.build that pulls flowables from an iterator on demand.
+    build() checks len() before every flowable it lays out, which is where the
+    buffer is topped up; reportlab's own list edits (splits, deletions) work as usual.
+    """
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+        self._exhausted = False
+
+    def __len__(self):
+        n = super().__len__()
+        while n < _LOOKAHEAD and not self._exhausted:
+            try:
+                self.append(next(self._source))
+                n += 1
+            except StopIteration:
+                self._exhausted = True
+        return n
+
+
+def _escape(text: str) -> str:
+    return (text or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class _Images:
+    """Images of one document, prepared once per distinct content."""
+
+    def __init__(self, docx_path: Path, work_dir: Path, dpi: int = TARGET_DPI):
+        self.widths = display_widths(docx_path)
+        self.work_dir = work_dir
+        self.dpi = dpi
+        self._by_part: dict[str, tuple | None] = {}
+        self._by_key: dict[str, tuple | None] = {}
+
+    def get(self, part) -> tuple[str, float, float] | None:
+        """(file name, width pt, height pt) for an image part; None if it cannot be drawn."""
+        name = str(part.partname)
+        if name not in self._by_part:
+            data = part.blob
+            key = image_key(data)
+            if key not in self._by_key:
+                self._by_key[key] = self._prepare(key, data, part.content_type)
+            self._by_part[name] = self._by_key[key]
+        return self._by_part[name]
+
+    def _prepare(self, key: str, data: bytes, content_type: str):
+        from PIL import Image
+
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                w, h = img.size
+        except Exception:
+            return None  # EMF/WMF and friends: not drawable by reportlab either
+        width_in = self.widths.get(key)
+        if width_in:
+            scale = min(width_in * 72, _MAX_W_PT) / w
+        else:
+            box_w, box_h = _DEFAULT_BOX_IN
+            scale = min(box_w * 72 / w, box_h * 72 / h, 1.0)
+        scale = min(scale, _MAX_W_PT / w, _MAX_H_PT / h)
+        draw_w, draw_h = w * scale, h * scale
+        data, content_type = downsample(data, content_type, draw_w / 72, self.dpi)
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                fmt = img.format
+        except Exception:
+            return None
+        # A .jpg name makes reportlab copy the JPEG stream as is instead of decoding it.
+        suffix = ".jpg" if fmt == "JPEG" else f".{(fmt or 'png').lower()}"
+        path = self.work_dir / f"{key}{suffix}"
+        path.write_bytes(data)
+        return str(path), draw_w, draw_h
+
+
+def convert(docx_path: Path, pdf_path: Path, deadline=None) -> bool:
+    """
+    Render docx_path to pdf_path. deadline: optional scheduler.Deadline, checked
+    between document elements (raises Cancelled/DeadlineExceeded). Returns success.
+    """
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.oxml.ns import qn
+    from docx.table import Table as DocxTable
+    from docx.text.paragraph import Paragraph as DocxPara
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_RIGHT
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Flowable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    class DocImage(Flowable):
+        """An image drawn by file name: reportlab keeps one XObject per name."""
+
+        def __init__(self, path: str, width: float, height: float):
+            super().__init__()
+            self.path, self.width, self.height = path, width, height
+            self.hAlign = "CENTER"
+
+        def wrap(self, avail_w, avail_h):
+            return self.width, self.height
+
+        def draw(self):
+            self.canv.drawImage(self.path, 0, 0, self.width, self.height, mask="auto")
+
+    doc = Document(str(docx_path))
+    base_styles = {
+        "n":  ParagraphStyle("rln",  fontName="Helvetica",      fontSize=11, leading=16, spaceAfter=4),
+        "h1": ParagraphStyle("rlh1", fontName="Helvetica-Bold", fontSize=20, leading=26, spaceBefore=10, spaceAfter=6),
+        "h2": ParagraphStyle("rlh2", fontName="Helvetica-Bold", fontSize=16, leading=22, spaceBefore=8,  spaceAfter=4),
+        "h3": ParagraphStyle("rlh3", fontName="Helvetica-Bold", fontSize=13, leading=18, spaceBefore=6,  spaceAfter=4),
+    }
+    align = {
+        WD_ALIGN_PARAGRAPH.CENTER:  TA_CENTER,
+        WD_ALIGN_PARAGRAPH.RIGHT:   TA_RIGHT,
+        WD_ALIGN_PARAGRAPH.JUSTIFY: TA_JUSTIFY,
+    }
+    styles: dict[tuple, ParagraphStyle] = {}
+    table_style = TableStyle([
+        ("GRID",         (0, 0), (-1, -1), 0.5, colors.grey),
+        ("BACKGROUND",   (0, 0), (-1,  0), colors.lightgrey),
+        ("VALIGN",       (0, 0), (-1, -1), "TOP"),
+        ("TOPPADDING",   (0, 0), (-1, -1), 4),
+        ("BOTTOMPADDING",(0, 0), (-1, -1), 4),
+        ("LEFTPADDING",  (0, 0), (-1, -1), 6),
+        ("RIGHTPADDING", (0, 0), (-1, -1), 6),
+    ])
+    rels = doc.part.rels
+    blip, embed = qn("a:blip"), qn("r:embed")
+
+    def style(level: str, alignment):
+        ta = align.get(alignment)
+        if ta is None:
+            return base_styles[level]
+        if (level, ta) not in styles:
+            base = base_styles[level]
+            styles[level, ta] = ParagraphStyle(f"{base.name}_a{ta}", parent=base, alignment=ta)
+        return styles[level, ta]
+
+    def markup(para) -> str:
+        parts = []
+        for run in para.runs:
+            t = _escape(run.text)
+            if not t:
+                continue
+            if run.bold:      t = f"<b>{t}</b>"
+            if run.italic:    t = f"<i>{t}</i>"
+            if run.underline: t = f"<u>{t}</u>"
+            parts.append(t)
+        return "".join(parts)
+
+    def paragraph(para):
+        for el in para._p.iter(blip):
+            rel = rels.get(el.get(embed))
+            if rel is not None and not rel.is_external and "image" in rel.reltype:
+                image = images.get(rel.target_part)
+                if image is not None:
+                    yield DocImage(*image)
+                    yield Spacer(1, 4)
+
+        text = markup(para)
+        if not text.strip():
+            yield Spacer(1, 4)
+            return
+        sname = (para.style.name or "").lower()
+        level = next((h for h in ("h1", "h2", "h3") if f"heading {h[1]}" in sname), "n")
+        try:
+            yield Paragraph(text, style(level, para.alignment))
+        except Exception:
+            yield Paragraph(_escape(para.text), base_styles[level])
+
+    def table(tbl):
+        data = [
+            [
+                Paragraph(_escape("".join(r.text or "" for p in cell.paragraphs for r in p.runs)), base_styles["n"])
+                for cell in row.cells
+            ]
+            for row in tbl.rows
+        ]
+        if data:
+            t = Table(data, repeatRows=1, hAlign="LEFT")
+            t.setStyle(table_style)
+            yield t
+            yield Spacer(1, 8)
+
+    def story():
+        empty = True
+        for child in doc.element.body:
+            if deadline is not None:
+                deadline.check()
+            if child.tag == qn("w:p"):
+                flowables = paragraph(DocxPara(child, doc))
+            elif child.tag == qn("w:tbl"):
+                flowables = table(DocxTable(child, doc))
+            else:
+                continue
+            for f in flowables:
+                empty = False
+                yield f
+        if empty:
+            yield Paragraph("(empty document)", base_styles["n"])
+
+    with tempfile.TemporaryDirectory(prefix="docx-images-", dir=pdf_path.parent) as work_dir, \
+            _binary_streams():
+        images = _Images(docx_path, Path(work_dir))
+        SimpleDocTemplate(
+            str(pdf_path), pagesize=letter,
+            leftMargin=inch, rightMargin=inch, topMargin=inch, bottomMargin=inch,
+        ).build(_LazyStory(story()))
+    return pdf_path.exists()
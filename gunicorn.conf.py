@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for production: `gunicorn -c gunicorn.conf.py app:app`.
+
+The app and converter libraries are imported once in the parent (preload_app), then
+each forked worker runs a prewarm conversion and page stamp before it accepts
+requests, so the first request after a deploy is as fast as the rest.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5050)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("WEB_THREADS", 4))
+# Longer than a LibreOffice conversion may take (SOFFICE_TIMEOUT, default 300 s).
+timeout = int(os.environ.get("WEB_TIMEOUT", 330))
+preload_app = True
+accesslog = "-"
+
+
+def on_starting(server):
+    from pdf_pipeline import preload
+
+    preload()
+
+
+def post_worker_init(worker):
+    from pdf_pipeline import prewarm
+
+    try:
+        prewarm()
+    except Exception as e:  # a failed warm-up must not keep the worker from serving
+        worker.log.warning("Prewarm failed: %s", e)
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Load test for the web app.
+
+    python loadtest.py -c 1,4,8 --duration 30 -o load.json       # gunicorn, as deployed
+    python loadtest.py --server dev --quick                       # Flask dev server, small corpus
+    python loadtest.py --mix merge_docx=1,process=1 --compare load.json
+
+Starts app.py locally on a free port (gunicorn with gunicorn.conf.py, or the Flask dev
+server), builds a corpus with benchmark.py's generators and, for each concurrency level,
+keeps that many clients sending a weighted mix of requests for --duration seconds:
+
+    merge_pdf           POST /merge, PDFs only
+    merge_pdf_numbered  POST /merge, PDFs only, enumerate=1
+    merge_docx          POST /merge, Word documents (images, tables) plus a PDF, enumerate=1
+    process             POST /process, page numbers on a long PDF
+
+Each level reports throughput, p50/p95/p99 latency (overall and per request kind), error
+and 429 rates, and the resident memory of the server's process tree, sampled throughout.
+The conversion and result caches are off unless --cache is given, so every request does
+the full work.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from benchmark import DEFAULT_THRESHOLD, build_corpus
+
+DEFAULT_MIX = "merge_pdf=3,merge_pdf_numbered=3,merge_docx=2,process=2"
+MERGE_PDF_PARTS = 8       # small PDFs per merge_pdf request
+STARTUP_TIMEOUT_S = 180   # gunicorn workers prewarm before they listen
+MAX_ERRORS_KEPT = 5       # error messages kept per request kind
+
+
+# ---------- Requests ----------
+
+@dataclass
+class Scenario:
+    name: str
+    path: str
+    body: bytes
+    content_type: str
+
+
+def _multipart(fields: list[tuple[str, str]], files: list[tuple[str, Path]]) -> tuple[bytes, str]:
+    """Encode form fields and (field name, path) file parts as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, path in files:
+        mimetype = "application/pdf" if path.suffix == ".pdf" else "application/octet-stream"
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{path.name}"\r\n'
+            f"Content-Type: {mimetype}\r\n\r\n".encode()
+            + path.read_bytes()
+            + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def build_scenarios(corpus: Path) -> dict[str, Scenario]:
+    pdfs = [corpus / "small.pdf", *sorted((corpus / "many").glob("*.pdf"))[:MERGE_PDF_PARTS - 1]]
+    docx = [corpus / "images.docx", corpus / "tables.docx", corpus / "small.pdf"]
+    specs = {
+        "merge_pdf": ("/merge", [("enumerate", "0")], [("files", p) for p in pdfs]),
+        "merge_pdf_numbered": ("/merge", [("enumerate", "1")], [("files", p) for p in pdfs]),
+        "merge_docx": ("/merge", [("enumerate", "1")], [("files", p) for p in docx]),
+        "process": ("/process", [], [("pdf", corpus / "huge.pdf")]),
+    }
+    scenarios = {}
+    for name, (path, fields, files) in specs.items():
+        body, content_type = _multipart(fields, files)
+        scenarios[name] = Scenario(name, path, body, content_type)
+    return scenarios
+
+
+def parse_mix(spec: str, scenarios: dict[str, Scenario]) -> list[tuple[Scenario, float]]:
+    """"merge_pdf=3,process=1" -> [(scenario, weight)]; raises ValueError for unknown names."""
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in scenarios:
+            raise ValueError(f"Unknown request kind {name!r} (use {', '.join(scenarios)})")
+        try:
+            w = float(weight or 1)
+        except ValueError:
+            raise ValueError(f"Invalid weight in {part!r}") from None
+        if w > 0:
+            mix.append((scenarios[name], w))
+    if not mix:
+        raise ValueError("The mix has no request kind with a positive weight")
+    return mix
+
+
+@dataclass
+class Sample:
+    scenario: str
+    start: float
+    seconds: float
+    status: int          # HTTP status; 0 when no response arrived
+    error: str = ""
+
+
+def send(base_url: str, scenario: Scenario, timeout: float) -> Sample:
+    request = urllib.request.Request(
+        base_url + scenario.path, data=scenario.body, method="POST",
+        headers={"Content-Type": scenario.content_type},
+    )
+    start = time.perf_counter()
+    status, error = 0, ""
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status = response.status
+            while response.read(1024 * 1024):
+                pass
+    except urllib.error.HTTPError as e:
+        status = e.code
+        error = f"HTTP {e.code}: {e.read(200).decode(errors='replace').strip()}"
+    except (OSError, urllib.error.URLError) as e:
+        error = f"{type(e).__name__}: {e}"
+    return Sample(scenario.name, start, time.perf_counter() - start, status, error)
+
+
+# ---------- Server ----------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _log_tail(path: Path, lines: int = 20) -> str:
+    return "\n".join(path.read_text(errors="replace").splitlines()[-lines:])
+
+
+def start_server(kind: str, work_dir: Path, cache: bool) -> tuple[subprocess.Popen, str, Path]:
+    """Start app.py (gunicorn or the dev server) and wait until it answers; returns (process, url, log)."""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        PDF_CACHE_DIR=str(work_dir / "cache"),
+        UPLOAD_BLOB_DIR=str(work_dir / "blobs"),
+        MERGE_JOBS_DIR=str(work_dir / "jobs"),
+        PYTHONUNBUFFERED="1",
+    )
+    if not cache:
+        env.update(PDF_CACHE_MAX_MB="0", PDF_RESULT_CACHE_MAX_MB="0")
+    root = Path(__file__).resolve().parent
+    if kind == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", str(root / "gunicorn.conf.py"),
+               "--bind", f"127.0.0.1:{port}", "app:app"]
+    else:
+        cmd = [sys.executable, str(root / "app.py")]
+    log_path = work_dir / "server.log"
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(cmd, cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}:\n{_log_tail(log_path)}")
+        try:
+            with urllib.request.urlopen(url + "/converters", timeout=5):
+                return process, url, log_path
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"Server did not answer within {STARTUP_TIMEOUT_S} s:\n{_log_tail(log_path)}")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def _process_table() -> dict[int, tuple[int, int]]:
+    """{pid: (parent pid, RSS in KiB)} from /proc, or from `ps` where there is no /proc."""
+    table = {}
+    if Path("/proc/self/stat").exists():
+        page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+        for entry in Path("/proc").iterdir():
+            if not entry.name.isdigit():
+                continue
+            try:
+                stat = (entry / "stat").read_text()
+                fields = stat[stat.rindex(")") + 2:].split()
+                table[int(entry.name)] = (int(fields[1]), int(fields[21]) * page_kb)
+            except (OSError, ValueError, IndexError):
+                continue  # exited meanwhile
+        return table
+    out = subprocess.run(["ps", "-A", "-o", "pid=,ppid=,rss="], capture_output=True, text=True).stdout
+    for line in out.splitlines():
+        pid, ppid, rss = (int(v) for v in line.split())
+        table[pid] = (ppid, rss)
+    return table
+
+
+def tree_rss_mb(pid: int) -> float:
+    """Resident memory of `pid` and all its descendants (gunicorn workers, LibreOffice)."""
+    table = _process_table()
+    children: dict[int, list[int]] = {}
+    for child, (parent, _) in table.items():
+        children.setdefault(parent, []).append(child)
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        total += table.get(p, (0, 0))[1]
+        stack.extend(children.get(p, ()))
+    return total / 1024
+
+
+class RssSampler:
+    """Samples the server tree's RSS every `interval` seconds as (seconds since start, level, MB)."""
+
+    def __init__(self, pid: int | None, interval: float):
+        self.pid = pid
+        self.interval = interval
+        self.level = 0
+        self.samples: list[tuple[float, int, float]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._start = time.monotonic()
+
+    def __enter__(self):
+        if self.pid is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            self.samples.append((round(time.monotonic() - self._start, 2), self.level, round(tree_rss_mb(self.pid), 1)))
+            if self._stop.wait(self.interval):
+                return
+
+    def for_level(self, level: int) -> list[float]:
+        return [mb for _, lvl, mb in self.samples if lvl == level]
+
+
+# ---------- Load ----------
+
+def run_level(base_url: str, mix: list[tuple[Scenario, float]], concurrency: int, duration: float,
+              timeout: float, seed: int) -> tuple[list[Sample], float]:
+    """Keep `concurrency` clients busy for `duration` seconds; returns (samples, wall seconds)."""
+    samples: list[Sample] = []
+    lock = threading.Lock()
+    scenarios, weights = zip(*mix)
+    stop_at = time.perf_counter() + duration
+
+    def client(index: int) -> None:
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < stop_at:
+            sample = send(base_url, rng.choices(scenarios, weights)[0], timeout)
+            with lock:
+                samples.append(sample)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,), name=f"client-{i}") for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()  # requests still running at stop_at are waited for and counted
+    return samples, time.perf_counter() - start
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def summarize(samples: list[Sample], wall_s: float) -> dict:
+    ok = sorted(s.seconds for s in samples if 200 <= s.status < 400)
+    rejected = sum(1 for s in samples if s.status == 429)
+    errors = [s for s in samples if s.status != 429 and not 200 <= s.status < 400]
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "rejected_429": rejected,
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(ok) / wall_s, 3) if wall_s else 0.0,
+        "p50_s": _round(_percentile(ok, 50)),
+        "p95_s": _round(_percentile(ok, 95)),
+        "p99_s": _round(_percentile(ok, 99)),
+        "max_s": _round(ok[-1] if ok else None),
+        "error_messages": sorted({s.error for s in errors})[:MAX_ERRORS_KEPT],
+    }
+
+
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(value, 4)
+
+
+def _format_row(label: str, r: dict, rss: str = "") -> str:
+    def ms(v):
+        return f"{v * 1000:8.0f}" if v is not None else "       -"
+    return (f"  {label:<20} {r['requests']:>6} {r['throughput_rps']:>8.2f} {ms(r['p50_s'])} {ms(r['p95_s'])} "
+            f"{ms(r['p99_s'])} {r['rejected_429']:>5} {r['errors']:>6}  {rss}")
+
+
+HEADER = (f"  {'':<20} {'reqs':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'429':>5} {'errors':>6}  RSS MB (min/max)")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Scaling regressions of `current` against `baseline`, matched by concurrency level."""
+    regressions = []
+    base_levels = {lvl["concurrency"]: lvl for lvl in baseline["levels"]}
+    for cur in current["levels"]:
+        base = base_levels.get(cur["concurrency"])
+        if base is None:
+            continue
+        where = f"c={cur['concurrency']}"
+        old, new = base["total"]["throughput_rps"], cur["total"]["throughput_rps"]
+        if old and new < old * (1 - threshold):
+            regressions.append(f"{where}: throughput {old} -> {new} req/s ({(new / old - 1) * 100:.0f}%)")
+        for metric in ("p95_s", "p99_s"):
+            old, new = base["total"][metric], cur["total"][metric]
+            if old and new and new > old * (1 + threshold):
+                regressions.append(f"{where}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+        old, new = base["total"]["error_rate"], cur["total"]["error_rate"]
+        if new > old:
+            regressions.append(f"{where}: error rate {old} -> {new}")
+        old, new = base.get("rss_max_mb"), cur.get("rss_max_mb")
+        if old and new and new > old * (1 + threshold):
+            regressions.append(f"{where}: peak RSS {old} -> {new} MB (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test the web app with a mix of /merge and /process requests.")
+    parser.add_argument("-c", "--concurrency", default="1,4,8", metavar="N[,N...]",
+                        help="Concurrent clients per level, run one level after another (default: 1,4,8)")
+    parser.add_argument("--duration", type=float, default=30, metavar="S",
+                        help="Seconds each level sends requests (default: 30)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, metavar="KIND=WEIGHT,...",
+                        help=f"Request kinds and their relative weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--server", choices=["gunicorn", "dev"], default="gunicorn",
+                        help="Start the app under gunicorn with gunicorn.conf.py (default) or the Flask dev server")
+    parser.add_argument("--url", metavar="URL",
+                        help="Test an already running server instead of starting one (no RSS sampling)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Keep the conversion and merge result caches on (repeated requests then hit them)")
+    parser.add_argument("--timeout", type=float, default=600, metavar="S", help="Per-request timeout (default: 600)")
+    parser.add_argument("--sample-interval", type=float, default=0.5, metavar="S",
+                        help="Seconds between server RSS samples (default: 0.5)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the request mix (default: 1)")
+    parser.add_argument("--quick", action="store_true", help="Use benchmark.py's smaller corpus")
+    parser.add_argument("--corpus", type=Path, help="Build/reuse the corpus in this directory instead of a temp dir")
+    parser.add_argument("-o", "--output", type=Path, help="Write results (and the RSS time series) as JSON to this file")
+    parser.add_argument("--compare", type=Path, metavar="BASELINE", help="Flag regressions against a saved JSON run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Relative change counted as a regression (default: {DEFAULT_THRESHOLD})")
+    args = parser.parse_args()
+    try:
+        levels = [int(n) for n in args.concurrency.split(",")]
+    except ValueError:
+        parser.error("--concurrency takes numbers, e.g. 1,4,8")
+    if any(n < 1 for n in levels):
+        parser.error("--concurrency levels must be at least 1")
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as tmp:
+        tmp = Path(tmp)
+        corpus = args.corpus or tmp / "corpus"
+        if not (corpus / "huge.pdf").exists():
+            print(f"Building corpus in {corpus} ...", flush=True)
+            build_corpus(corpus, args.quick)
+        scenarios = build_scenarios(corpus)
+        try:
+            mix = parse_mix(args.mix, scenarios)
+        except ValueError as e:
+            parser.error(str(e))
+
+        process = None
+        if args.url:
+            url = args.url.rstrip("/")
+        else:
+            print(f"Starting the app ({args.server}) ...", flush=True)
+            try:
+                process, url, log_path = start_server(args.server, tmp, args.cache)
+            except RuntimeError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 1
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "server": "external" if args.url else args.server,
+                "mix": {s.name: w for s, w in mix},
+                "duration_s": args.duration,
+                "cache": args.cache,
+                "quick": args.quick,
+                "cpus": os.cpu_count(),
+            },
+            "levels": [],
+        }
+        try:
+            with RssSampler(process.pid if process else None, args.sample_interval) as rss:
+                for level in levels:
+                    rss.level = level
+                    print(f"\nConcurrency {level}, {args.duration:g} s ...", flush=True)
+                    samples, wall = run_level(url, mix, level, args.duration, args.timeout, args.seed)
+                    mb = rss.for_level(level)
+                    result = {
+                        "concurrency": level,
+                        "wall_s": round(wall, 2),
+                        "total": summarize(samples, wall),
+                        "kinds": {name: summarize([s for s in samples if s.scenario == name], wall)
+                                  for name in sorted({s.scenario for s in samples})},
+                        "rss_min_mb": min(mb) if mb else None,
+                        "rss_max_mb": max(mb) if mb else None,
+                    }
+                    report["levels"].append(result)
+                    print(HEADER)
+                    range_mb = f"{result['rss_min_mb']:.0f}/{result['rss_max_mb']:.0f}" if mb else "-"
+                    print(_format_row("all", result["total"], range_mb))
+                    for name, r in result["kinds"].items():
+                        print(_format_row(name, r))
+                    for message in result["total"]["error_messages"]:
+                        print(f"  error: {message}")
+            report["rss_samples"] = [{"t": t, "concurrency": lvl, "mb": mb} for t, lvl, mb in rss.samples]
+        finally:
+            if process is not None:
+                stop_server(process)
+                if args.output:
+                    shutil.copyfile(log_path, args.output.with_suffix(".server.log"))
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nResults: {args.output}")
+    if args.compare:
+        regressions = compare(json.loads(args.compare.read_text()), report, args.threshold)
+        if regressions:
+            print(f"\nRegressions against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.compare}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Many merges from one manifest, in one process.
+
+A manifest lists merge jobs as JSON (a list, or {"jobs": [...]}) or as JSON Lines
+(one job per line):
+
+    {"id": "q3", "inputs": ["cover.docx", "annex.pdf:1-3"], "output": "out/q3.pdf", "enumerate": true}
+
+Optional keys are "dedupe", "optimize" (a pdf_optimize profile name) and "linearize".
+Relative paths are resolved against the manifest's folder. Every distinct .docx is
+converted once, on a thread pool shared by all jobs, and each job merges as soon as its
+own inputs are ready; a failing job does not stop the others.
+"""
+
+import json
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from pdf_pipeline import build_merged_pdf, convert_docx_to_pdf, parse_page_ranges, split_page_spec
+
+_JOB_KEYS = {"id", "inputs", "output", "enumerate", "dedupe", "optimize", "linearize"}
+
+
+@dataclass
+class ManifestJob:
+    id: str
+    inputs: List[Path]
+    output: Path
+    page_ranges: List[Optional[str]] = field(default_factory=list)
+    enumerate: bool = False
+    dedupe: bool = False
+    optimize: str | None = None
+    linearize: bool = False
+
+
+@dataclass
+class JobResult:
+    id: str
+    output: str
+    ok: bool = False
+    bytes: int = 0
+    convert_s: float = 0.0   # conversions this job used (a shared one counts for each job)
+    merge_s: float = 0.0
+    error: str = ""
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _parse_job(entry, base: Path, where: str, index: int) -> ManifestJob:
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where}: a job must be a JSON object")
+    unknown = set(entry) - _JOB_KEYS
+    if unknown:
+        raise ValueError(f"{where}: unknown key(s) {', '.join(sorted(unknown))}")
+    inputs = entry.get("inputs")
+    if not isinstance(inputs, list) or not inputs or not all(isinstance(p, str) for p in inputs):
+        raise ValueError(f"{where}: \"inputs\" must be a non-empty list of paths")
+    if not isinstance(entry.get("output"), str):
+        raise ValueError(f"{where}: \"output\" must be a path")
+    specs = [split_page_spec(p) for p in inputs]
+    for _, spec in specs:
+        if spec:
+            parse_page_ranges(spec)
+    output = base / entry["output"]
+    optimize = entry.get("optimize") or None
+    if optimize is not None:
+        from pdf_optimize import get_profile
+
+        get_profile(optimize)
+    return ManifestJob(
+        id=str(entry.get("id") or f"job{index}"),
+        inputs=[(base / path).resolve() for path, _ in specs],
+        output=output.resolve(),
+        page_ranges=[spec for _, spec in specs],
+        enumerate=bool(entry.get("enumerate", False)),
+        dedupe=bool(entry.get("dedupe", False)),
+        optimize=optimize,
+        linearize=bool(entry.get("linearize", False)),
+    )
+
+
+def load_manifest(path: Path) -> List[ManifestJob]:
+    """Read and validate a JSON or JSON Lines manifest; raises ValueError naming the bad entry."""
+    path = Path(path)
+    base = path.resolve().parent
+    text = path.read_text(encoding="utf-8")
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            entries = data["jobs"] if "jobs" in data else [data]  # a one-line JSONL manifest
+        else:
+            entries = data
+        if not isinstance(entries, list):
+            raise ValueError(f"{path.name}: expected a list of jobs or {{\"jobs\": [...]}}")
+        located = [(f"{path.name} job {i}", entry) for i, entry in enumerate(entries, start=1)]
+    except json.JSONDecodeError:
+        located = []
+        for n, line in enumerate(text.splitlines(), start=1):
+            if line.strip():
+                try:
+                    located.append((f"{path.name} line {n}", json.loads(line)))
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path.name} line {n}: {e.msg}") from None
+    jobs = [_parse_job(entry, base, where, i) for i, (where, entry) in enumerate(located, start=1)]
+    if not jobs:
+        raise ValueError(f"{path.name}: no jobs")
+    seen: dict[Path, str] = {}
+    for job in jobs:
+        if job.output in seen:
+            raise ValueError(f"Jobs {seen[job.output]!r} and {job.id!r} write the same file {job.output}")
+        seen[job.output] = job.id
+    return jobs
+
+
+def run_batch(
+    manifest_jobs: List[ManifestJob],
+    jobs: int = 1,
+    on_done: Callable[[JobResult], None] | None = None,
+) -> List[JobResult]:
+    """
+    Run every job of a manifest; returns one JobResult per job, in manifest order.
+
+    jobs: size of the shared conversion pool and of the merge pool.
+    on_done(result) is called from the merge threads as each job finishes.
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix="merge-batch-"))
+    conversions: dict[Path, Future] = {}
+    lock = threading.Lock()
+
+    def _convert(i: int, docx: Path) -> tuple[Path, float]:
+        start = time.perf_counter()
+        pdf = convert_docx_to_pdf(docx, output_dir=work_dir / f"{i:04d}")
+        return pdf, time.perf_counter() - start
+
+    def _converted(docx: Path) -> Future:
+        with lock:
+            future = conversions.get(docx)
+            if future is None:
+                future = conversions[docx] = converter.submit(_convert, len(conversions), docx)
+            return future
+
+    def _run(job: ManifestJob, pending: List[Future | None]) -> JobResult:
+        result = JobResult(id=job.id, output=str(job.output))
+        try:
+            paths = []
+            for path, future in zip(job.inputs, pending):
+                if future is None:
+                    paths.append(path)
+                else:
+                    pdf, seconds = future.result()
+                    paths.append(pdf)
+                    result.convert_s += seconds
+            start = time.perf_counter()
+            build_merged_pdf(
+                paths, job.output, enumerate=job.enumerate, dedupe=job.dedupe,
+                page_ranges=job.page_ranges if any(job.page_ranges) else None, optimize=job.optimize,
+                linearize=job.linearize,
+            )
+            result.merge_s = time.perf_counter() - start
+            result.bytes = job.output.stat().st_size
+            result.ok = True
+        except FileNotFoundError as e:
+            result.error = f"file not found: {e}"
+        except Exception as e:
+            result.error = str(e) or type(e).__name__
+        if on_done is not None:
+            on_done(result)
+        return result
+
+    workers = max(1, jobs)
+    converter = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-convert")
+    merger = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-merge")
+    try:
+        futures = []
+        for job in manifest_jobs:
+            # Submit every conversion first so merges never wait behind each other.
+            pending = [
+                _converted(p) if p.suffix.lower() == ".docx" and p.exists() else None
+                for p in job.inputs
+            ]
+            futures.append((job, pending))
+        results = [merger.submit(_run, job, pending) for job, pending in futures]
+        return [f.result() for f in results]
+    finally:
+        merger.shutdown(wait=True, cancel_futures=True)
+        converter.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def format_report(results: List[JobResult], elapsed: float) -> str:
+    """One line per job plus a total, for the CLI."""
+    width = max(len(r.id) for r in results)
+    lines = []
+    for r in results:
+        head = f"{'ok' if r.ok else 'FAILED':<7} {r.id:<{width}}  {r.convert_s:7.2f} s convert  {r.merge_s:7.2f} s merge"
+        lines.append(f"{head}  {r.bytes:>11} bytes  -> {r.output}" if r.ok else f"{head}  {r.error}")
+    failed = sum(1 for r in results if not r.ok)
+    lines.append(f"{len(results)} jobs, {failed} failed, {elapsed:.2f} s total")
+    return "\n".join(lines)
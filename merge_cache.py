@@ -0,0 +1,148 @@
+"""
+Cache of finished merges, so an identical request is answered without rerunning the pipeline.
+
+A merge is identified by the SHA-256 of every input, in order, plus the options that
+change its output (enumerate, dedupe, page ranges, optimize profile, linearization). That key names
+the cached PDF and is served as its ETag: a client that already holds the result of
+the same request gets 304 Not Modified. Entries live in a size-bounded DiskCache
+shared with other processes; least recently used results are evicted first.
+
+Only results whose .docx inputs were all converted by the best installed backend are
+cached: a fallback conversion (say, while LibreOffice is down) must not be served
+under the key for good once LibreOffice is back. The key is needed before merging (to
+answer If-None-Match), so the backend cannot be part of it. This also means merges
+whose documents took the DOCX_FAST_PATH to a quicker backend are never cached.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import metrics
+from disk_cache import DiskCache, file_sha256
+from pdf_pipeline import CACHE_DIR, backend_registry, write_merged_pdf
+
+# ---------- Result cache (overridable through the environment) ----------
+RESULT_CACHE_MAX_MB = int(os.environ.get("PDF_RESULT_CACHE_MAX_MB", 256))  # 0 disables the cache
+# ------------------------------------------------------------------
+
+# Bump when a pipeline change alters the output for the same inputs and options.
+_KEY_VERSION = 1
+_KEY = re.compile(r"^[0-9a-f]{64}$")
+
+
+def merge_key(
+    digests: List[str],
+    enumerate: bool = False,
+    dedupe: bool = False,
+    page_ranges: List[Optional[str]] | None = None,
+    optimize: str | None = None,
+    linearize: bool = False,
+    **_ignored,
+) -> str:
+    """
+    Key of a merge: the inputs' SHA-256 digests in merge order plus the options that
+    change the output. Options that only change how it is produced (streaming, jobs,
+    temp_dir, deadline) are ignored.
+    """
+    spec = {
+        "v": _KEY_VERSION,
+        "inputs": list(digests),
+        "enumerate": bool(enumerate),
+        "dedupe": bool(dedupe),
+        "pages": [r or None for r in page_ranges] if page_ranges and any(page_ranges) else None,
+        "optimize": optimize or None,
+        "linearize": bool(linearize),
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def valid_key(key: str) -> bool:
+    return bool(_KEY.match(key or ""))
+
+
+_result_cache: DiskCache | None = None
+
+
+def result_cache() -> DiskCache:
+    """Return the shared merge-result cache (hit/miss counters via .stats())."""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = DiskCache(CACHE_DIR / "merges", RESULT_CACHE_MAX_MB * 1024 * 1024)
+    return _result_cache
+
+
+def _cache_metrics() -> dict:
+    if _result_cache is None:
+        return {}
+    stats = _result_cache.stats()
+    return {(("stat", name),): stats[name] for name in ("hits", "misses", "entries", "bytes")}
+
+
+metrics.CallbackGauge("pdf_result_cache", "Merge result cache counters and size", _cache_metrics)
+
+
+def cached_result(key: str) -> Path | None:
+    """Path of the cached result for `key`, or None. It may be evicted once the caller lets go."""
+    if not valid_key(key):
+        return None
+    found = result_cache().lookup([key])
+    return found[1] if found else None
+
+
+def merge_cached(
+    file_paths: List[Path],
+    work_dir: Path,
+    enumerate: bool = False,
+    digests: List[str] | None = None,
+    **options,
+) -> tuple[str | None, Path]:
+    """
+    Merge like write_merged_pdf, through the result cache. Returns (key, path): the
+    cached PDF on a hit, else the fresh result (a new merged-*.pdf in work_dir, so it
+    cannot clobber an input saved there), which is also added to the cache. Open the path before the next merge could evict it.
+    key is None when the result is not cached (cache disabled, or a .docx was
+    converted by a fallback backend); such a result must not be given an ETag.
+
+    digests: SHA-256 of each input if already known (e.g. upload blob ids); hashed otherwise.
+    options: further write_merged_pdf arguments (dedupe, page_ranges, optimize, deadline, ...).
+    """
+    work_dir = Path(work_dir)
+    fd, out_path = tempfile.mkstemp(prefix="merged-", suffix=".pdf", dir=work_dir)
+    out_path = Path(out_path)
+    if not result_cache().enabled:
+        with open(fd, "wb") as out:
+            write_merged_pdf(file_paths, out, enumerate=enumerate, temp_dir=work_dir, **options)
+        return None, out_path
+    if digests is None:
+        digests = [file_sha256(p) for p in file_paths]
+    key = merge_key(digests, enumerate=enumerate, **options)
+    path = cached_result(key)
+    if path is not None:
+        os.close(fd)
+        out_path.unlink()
+        return key, path
+    backends: List[str] = []
+    with open(fd, "wb") as out:
+        write_merged_pdf(file_paths, out, enumerate=enumerate, temp_dir=work_dir, backends=backends, **options)
+    installed = backend_registry.available()
+    if any(name != installed[0].name for name in backends):
+        return None, out_path
+    try:
+        result_cache().store(key, out_path)
+    except OSError:
+        pass  # a full or read-only cache must not fail the merge
+    return key, out_path
+
+
+def copy_result(src: Path, dest: Path) -> None:
+    """Put a result at dest: a hard link when src is on the same filesystem, else a copy."""
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
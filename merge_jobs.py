@@ -0,0 +1,358 @@
+"""
+Background merge jobs for the web app.
+
+A job is a row in a local SQLite database plus a directory holding its uploaded
+inputs and, once finished, its result. Jobs run on a small thread pool in the web
+process; progress is written back to the database so any process sharing the job
+directory can report it. Finished jobs are deleted after JOB_RESULT_TTL_S, and jobs
+left behind by a process that died are picked up again on startup.
+
+At most MERGE_JOB_QUEUE_MAX jobs wait behind the running ones; beyond that new jobs
+are refused (HTTP 429). Each running job has a deadline (MERGE_DEADLINE_S) and can be
+cancelled, which kills a LibreOffice conversion in flight; a job cancelled through
+another process stops at its next progress report.
+
+Results go through the merge result cache, so resubmitting the same files and options
+finishes without merging again.
+"""
+
+import json
+import math
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+
+from merge_cache import copy_result, merge_cached
+from scheduler import CONVERSIONS, Cancelled, Deadline, DeadlineExceeded, Overloaded
+
+# ---------- Job settings (overridable through the environment) ----------
+JOBS_DIR = Path(os.environ.get("MERGE_JOBS_DIR", Path(tempfile.gettempdir()) / "pdf-master2-jobs"))
+JOB_WORKERS = int(os.environ.get("MERGE_JOB_WORKERS", 2))
+JOB_RESULT_TTL_S = int(os.environ.get("MERGE_JOB_TTL", 3600))
+JOB_QUEUE_MAX = int(os.environ.get("MERGE_JOB_QUEUE_MAX", 32))
+CLEANUP_INTERVAL_S = 60
+PROGRESS_INTERVAL_S = 0.5
+# ------------------------------------------------------------------
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+_JOB_EWMA_ALPHA = 0.2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    stage       TEXT,
+    done        INTEGER NOT NULL DEFAULT 0,
+    total       INTEGER NOT NULL DEFAULT 0,
+    inputs      TEXT NOT NULL,
+    enumerate   INTEGER NOT NULL,
+    output_name TEXT NOT NULL,
+    options     TEXT NOT NULL DEFAULT '{}',
+    error       TEXT,
+    pid         INTEGER,
+    owner       TEXT,
+    created     REAL NOT NULL,
+    updated     REAL NOT NULL,
+    finished    REAL
+)
+"""
+
+
+class JobStore:
+    """SQLite job table plus one directory per job under `root`."""
+
+    def __init__(self, root: Path = JOBS_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / "jobs.sqlite3"
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SCHEMA)
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            if "options" not in columns:  # job databases created before merge options existed
+                db.execute("ALTER TABLE jobs ADD COLUMN options TEXT NOT NULL DEFAULT '{}'")
+            if "owner" not in columns:
+                db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.root / "files" / job_id
+
+    def result_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / "result.pdf"
+
+    def new_job_dir(self) -> tuple[str, Path]:
+        """Reserve an id and an (empty) input directory for a job about to be created."""
+        job_id = uuid.uuid4().hex
+        path = self.job_dir(job_id) / "inputs"
+        path.mkdir(parents=True)
+        return job_id, path
+
+    def create(
+        self, job_id: str, inputs: list[Path], enumerate: bool, output_name: str, options: dict | None = None
+    ) -> None:
+        """options: extra keyword arguments for write_merged_pdf (e.g. {"dedupe": True})."""
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT INTO jobs (id, status, inputs, enumerate, output_name, options, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, QUEUED, json.dumps([str(p) for p in inputs]), int(enumerate), output_name,
+                    json.dumps(options or {}), now, now,
+                ),
+            )
+
+    def get(self, job_id: str) -> dict | None:
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, job_id: str) -> bool:
+        """Move a queued job to running for this process; False if someone else has it."""
+        with closing(self._connect()) as db, db:
+            cur = db.execute(
+                "UPDATE jobs SET status = ?, pid = ?, owner = ?, updated = ? WHERE id = ? AND status = ?",
+                (RUNNING, os.getpid(), _process_token(), time.time(), job_id, QUEUED),
+            )
+        return cur.rowcount == 1
+
+    def status(self, job_id: str) -> str | None:
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def count_queued(self) -> int:
+        """Jobs waiting for a worker, across all processes sharing the store."""
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def cancel(self, job_id: str) -> bool:
+        """Mark a queued or running job cancelled; False if it had already finished."""
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            cur = db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ?, finished = ?"
+                " WHERE id = ? AND status IN (?, ?)",
+                (CANCELLED, "Cancelled", now, now, job_id, QUEUED, RUNNING),
+            )
+        return cur.rowcount == 1
+
+    def finish(self, job_id: str, status: str, error: str | None = None) -> None:
+        """Record the outcome of a running job (a job cancelled meanwhile stays cancelled)."""
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ?, finished = ? WHERE id = ? AND status = ?",
+                (status, error, now, now, job_id, RUNNING),
+            )
+
+    def delete(self, job_id: str) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as db, db:
+            db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def requeue_orphans(self) -> list[str]:
+        """Return running jobs whose process is gone to the queue; return all queued ids."""
+        with closing(self._connect()) as db, db:
+            for row in db.execute("SELECT id, pid, owner FROM jobs WHERE status = ?", (RUNNING,)).fetchall():
+                if not _owner_alive(row["pid"], row["owner"]):
+                    db.execute(
+                        "UPDATE jobs SET status = ?, pid = NULL, owner = NULL WHERE id = ?", (QUEUED, row["id"])
+                    )
+            rows = db.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created", (QUEUED,)).fetchall()
+        return [row["id"] for row in rows]
+
+    def delete_expired(self, ttl_s: float = JOB_RESULT_TTL_S) -> int:
+        cutoff = time.time() - ttl_s
+        with closing(self._connect()) as db, db:
+            rows = db.execute(
+                "SELECT id FROM jobs WHERE finished IS NOT NULL AND finished < ?", (cutoff,)
+            ).fetchall()
+            db.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
+        for row in rows:
+            shutil.rmtree(self.job_dir(row["id"]), ignore_errors=True)
+        return len(rows)
+
+
+def _pid_alive(pid: int | None) -> bool:
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+_boot_id: str | None = None
+
+
+def _process_token(pid: int | None = None) -> str | None:
+    """
+    Identify a live process as "<boot id>:<pid>:<start time>", or None if it is gone.
+    PIDs are reused (a restarted container hands out the same low numbers again), but
+    not together with the start time. Without /proc this is just the pid.
+    """
+    global _boot_id
+    pid = pid or os.getpid()
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except FileNotFoundError:
+        if Path("/proc/self/stat").exists():
+            return None
+        return str(pid) if _pid_alive(pid) else None
+    except OSError:
+        return None
+    if _boot_id is None:
+        try:
+            _boot_id = Path("/proc/sys/kernel/random/boot_id").read_text().strip()
+        except OSError:
+            _boot_id = ""
+    # Field 22 is the start time; fields after the parenthesized command name start at 3.
+    start = stat.rsplit(")", 1)[1].split()[19]
+    return f"{_boot_id}:{pid}:{start}"
+
+
+def _owner_alive(pid: int | None, owner: str | None) -> bool:
+    """Whether the process that claimed a job still runs (jobs claimed before owners were kept: by pid)."""
+    if owner is None:
+        return _pid_alive(pid)
+    return bool(pid) and _process_token(pid) == owner
+
+
+class JobRunner:
+    """Runs queued jobs from a JobStore on a bounded thread pool."""
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_MAX):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.job_s = 10.0  # EWMA of job run time, for Retry-After
+        self._deadlines: dict[str, Deadline] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="merge-job")
+        self._stop = threading.Event()
+        self._cleaner = threading.Thread(target=self._cleanup_loop, name="merge-job-cleanup", daemon=True)
+        self._cleaner.start()
+        for job_id in store.requeue_orphans():
+            self.submit(job_id)
+
+    def admit(self) -> None:
+        """Raise Overloaded if max_queued jobs already wait behind the running ones."""
+        # Counted in the store, so workers in every process sharing it are accounted for.
+        waiting = self.store.count_queued()
+        if self.max_queued is not None and waiting >= self.max_queued:
+            raise Overloaded("job", max(1, math.ceil((waiting + 1) * self.job_s / self.workers)))
+
+    def submit(self, job_id: str) -> None:
+        self._executor.submit(self._run, job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job, killing its conversion if it runs here."""
+        if not self.store.cancel(job_id):
+            return False
+        with self._lock:
+            deadline = self._deadlines.get(job_id)
+        if deadline is not None:
+            deadline.cancel("job deleted")
+        return True
+
+    def _run(self, job_id: str) -> None:
+        if not self.store.claim(job_id):
+            return
+        job = self.store.get(job_id)
+        result = self.store.result_path(job_id)
+        partial = result.with_suffix(".part")
+        deadline = Deadline()
+        with self._lock:
+            self._deadlines[job_id] = deadline
+
+        last = {"stage": None, "time": 0.0}
+
+        def _progress(stage: str, done: int, total: int) -> None:
+            # Write on stage changes, completion, and at most every PROGRESS_INTERVAL_S.
+            now = time.monotonic()
+            if stage == last["stage"] and done < total and now - last["time"] < PROGRESS_INTERVAL_S:
+                return
+            last["stage"], last["time"] = stage, now
+            if self.store.status(job_id) == CANCELLED:  # cancelled through another process
+                deadline.cancel("job deleted")
+                deadline.check()
+            self.store.update(job_id, stage=stage, done=done, total=total)
+
+        start = time.monotonic()
+        work_dir = self.store.job_dir(job_id) / "work"
+        try:
+            work_dir.mkdir(exist_ok=True)
+            _, merged = merge_cached(
+                [Path(p) for p in json.loads(job["inputs"])],
+                work_dir,
+                enumerate=bool(job["enumerate"]),
+                progress=_progress,
+                deadline=deadline,
+                limiter=CONVERSIONS,
+                **json.loads(job["options"]),
+            )
+            partial.unlink(missing_ok=True)
+            copy_result(merged, partial)
+            os.replace(partial, result)
+        except Exception as e:
+            partial.unlink(missing_ok=True)
+            cancelled = isinstance(e, Cancelled) and not isinstance(e, DeadlineExceeded)
+            self.store.finish(job_id, CANCELLED if cancelled else FAILED, error=str(e))
+        else:
+            self.store.finish(job_id, DONE)
+        finally:
+            deadline.close()
+            with self._lock:
+                self._deadlines.pop(job_id, None)
+                self.job_s += _JOB_EWMA_ALPHA * (time.monotonic() - start - self.job_s)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _cleanup_loop(self) -> None:
+        while not self._stop.wait(CLEANUP_INTERVAL_S):
+            try:
+                self.store.delete_expired()
+            except sqlite3.Error:
+                pass
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_runner: JobRunner | None = None
+_runner_pid: int | None = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> JobRunner:
+    """Return the process-wide job runner, creating it on first use (and again after a fork)."""
+    global _runner, _runner_pid
+    with _runner_lock:
+        if _runner is None or _runner_pid != os.getpid():
+            _runner = JobRunner(JobStore())
+            _runner_pid = os.getpid()
+        return _runner
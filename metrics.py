@@ -0,0 +1,216 @@
+"""
+In-process metrics for the PDF pipeline, rendered in Prometheus text format.
+
+A deliberately small subset of the Prometheus client model — labelled counters,
+histograms and callback gauges — so the pipeline has no extra dependency. Values are
+per process; with several server workers, scrape each or aggregate downstream.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+# Latency buckets in seconds: page stamping is ~ms, soffice conversions can take minutes.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_registry: list["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        with _lock:
+            _registry.append(self)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with _lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def values(self) -> dict[tuple, float]:
+        with _lock:
+            return dict(self._values)
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_label_str(k)} {_fmt(v)}" for k, v in sorted(self.values().items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._local = threading.local()  # .captures: this thread's open capture() lists
+
+    def observe(self, value: float, **labels) -> None:
+        captures = getattr(self._local, "captures", None)
+        if captures:
+            for observed in captures:
+                observed.append((labels, value))
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def capture(self):
+        """
+        Also collect the observations made by this thread, as (labels, value), into the
+        yielded list while the block runs. Used for per-run breakdowns (profiling).
+        Captures nest: an observation goes to every capture open on the thread.
+        """
+        observed: list[tuple[dict, float]] = []
+        captures = getattr(self._local, "captures", None)
+        if captures is None:
+            captures = self._local.captures = []
+        captures.append(observed)
+        try:
+            yield observed
+        finally:
+            captures.pop()  # with blocks on one thread exit innermost first
+
+    def totals(self) -> dict[tuple, tuple[float, int]]:
+        """Return {labels: (sum, count)}."""
+        with _lock:
+            return {k: (s[-2], s[-1]) for k, s in self._series.items()}
+
+    def _samples(self) -> list[str]:
+        with _lock:
+            series = {k: list(s) for k, s in self._series.items()}
+        lines = []
+        for key, s in sorted(series.items()):
+            for bound, n in zip(self.buckets + (float("inf"),), s[:-2] + [s[-1]]):
+                lines.append(f"{self.name}_bucket{_label_str(key + (('le', _fmt(bound)),))} {n}")
+            lines.append(f"{self.name}_sum{_label_str(key)} {_fmt(s[-2])}")
+            lines.append(f"{self.name}_count{_label_str(key)} {s[-1]}")
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose labelled values are read from `fn` at render time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], dict[tuple, float]]):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_label_str(k)} {_fmt(v)}" for k, v in sorted(self.fn().items())]
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        metrics = list(_registry)
+    return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+# ---------- Pipeline metrics ----------
+STAGE_SECONDS = Histogram(
+    "pdf_stage_seconds", "Time spent per pipeline stage (convert, merge, number, write, build_merged_pdf, ...)"
+)
+CONVERTER_SECONDS = Histogram("pdf_converter_seconds", "Time spent per DOCX converter backend attempt")
+CONVERTER_ATTEMPTS = Counter(
+    "pdf_converter_attempts_total",
+    "DOCX converter backend attempts by outcome: success, fallthrough (failed, next backend tried) or failure",
+)
+PAGES = Counter("pdf_pages_total", "Pages processed per stage")
+BYTES = Counter(
+    "pdf_bytes_total",
+    "Bytes read (direction=in), written (direction=out) or avoided (direction=saved) per stage; "
+    "optimize counts its input PDFs under direction=inputs",
+)
+DEDUPED_OBJECTS = Counter("pdf_dedupe_objects_total", "Duplicate PDF objects dropped by resource deduplication")
+OPTIMIZED = Counter(
+    "pdf_optimize_total",
+    "Work done by the optimize stage (kind=images_downsampled, streams_compressed or objects_removed)",
+)
+ADMISSIONS = Counter(
+    "pdf_admission_total",
+    "Stage slot requests by outcome: admitted, rejected (stage full) or the reason the waiter gave up",
+)
+
+
+def summary() -> str:
+    """Human-readable breakdown of stage timings and converter outcomes (for the CLI)."""
+    lines = ["Stage timings:"]
+    for key, (total, count) in sorted(STAGE_SECONDS.totals().items()):
+        stage = dict(key).get("stage", "?")
+        lines.append(f"  {stage:<24} {count:>5} x  {total:9.3f} s total  {total / count:9.3f} s avg")
+    conv = CONVERTER_SECONDS.totals()
+    if conv:
+        lines.append("Converter backends:")
+        attempts = CONVERTER_ATTEMPTS.values()
+        for key, (total, count) in sorted(conv.items()):
+            backend = dict(key)["backend"]
+            outcomes = ", ".join(
+                f"{dict(k)['outcome']}={int(v)}" for k, v in sorted(attempts.items()) if dict(k)["backend"] == backend
+            )
+            lines.append(f"  {backend:<24} {count:>5} x  {total:9.3f} s total  ({outcomes})")
+    pages = PAGES.values()
+    if pages:
+        lines.append("Pages: " + ", ".join(f"{dict(k)['stage']}={int(v)}" for k, v in sorted(pages.items())))
+    if DEDUPED_OBJECTS.get():
+        saved = BYTES.get(stage="dedupe", direction="saved")
+        lines.append(f"Deduplication: {int(DEDUPED_OBJECTS.get())} objects, {int(saved)} bytes saved")
+    inputs = BYTES.get(stage="optimize", direction="inputs")
+    if inputs:
+        after = BYTES.get(stage="optimize", direction="out")
+        lines.append(f"Optimization: {int(after)} bytes written from {int(inputs)} bytes of input PDFs")
+    return "\n".join(lines)
@@ -5,23 +5,45 @@ Use as CLI or import run_pipeline for other UIs.
 """
 
 import argparse
+import json
 import sys
+import time
+from contextlib import nullcontext
 from pathlib import Path
 
-from pdf_pipeline import build_merged_pdf
+import metrics
+from pdf_optimize import DEFAULT_PROFILE, PROFILES
+from pdf_pipeline import build_merged_pdf, split_page_spec
 
 
 def run_pipeline(
     file_paths: list[str] | list[Path],
     output_path: str | Path,
     enumerate: bool = False,
+    jobs: int = 1,
+    dedupe: bool = False,
+    streaming: bool | None = None,
+    optimize: str | None = None,
+    linearize: bool = False,
 ) -> Path:
     """
     Run the full pipeline: convert DOCX → PDF, merge in order, optionally add numbers.
+    file_paths: may carry a page selection, e.g. "annex.pdf:1-3,10".
+    jobs: how many DOCX conversions may run at the same time.
+    dedupe: store fonts/images shared by several inputs only once.
+    streaming: bounded-memory merge; None decides by input size.
+    optimize: optimization profile name (see pdf_optimize.PROFILES) for a smaller file.
+    linearize: write a linearized ("fast web view") PDF; needs pikepdf or qpdf.
     """
-    paths = [Path(p).resolve() for p in file_paths]
+    specs = [split_page_spec(str(p)) for p in file_paths]
+    paths = [Path(path).resolve() for path, _ in specs]
+    page_ranges = [spec for _, spec in specs]
     out = Path(output_path).resolve()
-    return build_merged_pdf(paths, out, enumerate=enumerate)
+    return build_merged_pdf(
+        paths, out, enumerate=enumerate, jobs=jobs, dedupe=dedupe,
+        page_ranges=page_ranges if any(page_ranges) else None, streaming=streaming,
+        optimize=optimize, linearize=linearize,
+    )
 
 
 def main() -> int:
@@ -30,9 +52,9 @@ def main() -> int:
     )
     parser.add_argument(
         "files",
-        nargs="+",
-        type=Path,
-        help="Paths to .pdf and/or .docx files in the order they should appear",
+        nargs="*",
+        help="Paths to .pdf and/or .docx files in the order they should appear; "
+        "append :PAGES to take only some pages, e.g. annex.pdf:1-3,10 or report.docx:2-",
     )
     parser.add_argument(
         "-o", "--output",
@@ -45,11 +67,103 @@ def main() -> int:
         action="store_true",
         help="Add 'Pag. n/total' header to each page",
     )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Convert up to N Word files in parallel (default: 1); page order is unchanged",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Store fonts, images and other resources shared by several inputs only once",
+    )
+    parser.add_argument(
+        "--optimize",
+        nargs="?",
+        const=DEFAULT_PROFILE,
+        choices=list(PROFILES),
+        metavar="PROFILE",
+        help="Write a smaller file: compress streams, drop unused objects, pack object streams "
+        "and downsample oversized images; PROFILE is one of "
+        f"{', '.join(PROFILES)} (default: {DEFAULT_PROFILE})",
+    )
+    parser.add_argument(
+        "--linearize",
+        action="store_true",
+        help="Write a linearized (fast web view) PDF, whose first page shows before the whole "
+        "file has downloaded; needs pikepdf or the qpdf command",
+    )
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="Copy pages straight to the output with bounded memory (automatic for very large inputs)",
+    )
+    parser.add_argument(
+        "--batch",
+        type=Path,
+        metavar="MANIFEST",
+        help="Run every merge listed in a JSON or JSON Lines manifest in this one process "
+        "(see merge_batch.py); -j sets the shared pool size",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        metavar="FILE",
+        help="With --batch: also write the per-job results as JSON to FILE",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Print a per-stage timing and converter breakdown to stderr when done",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the run (cProfile + tracemalloc) and write a .pstats file and a report with "
+        "stage timings and top allocation sites to PDF_PROFILE_DIR",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=Path,
+        metavar="DIR",
+        help="Write the --profile files to DIR instead (implies --profile)",
+    )
     args = parser.parse_args()
+    error = _path_error(args.profile_dir, "profile directory", directory=True)
+    if error is None and args.batch is None:
+        error = _path_error(args.output, "output file")
+    if error is not None:
+        parser.error(error)
+    if args.batch is not None:
+        if args.files:
+            parser.error("give either input files or --batch, not both")
+        with _profile_run(args, "batch"):
+            return run_batch_cli(args.batch, args.jobs, args.report, args.metrics)
+    if not args.files:
+        parser.error("the following arguments are required: files")
 
     try:
-        result = run_pipeline(args.files, args.output, enumerate=args.enumerate)
+        with _profile_run(args, "merge"):
+            result = run_pipeline(
+                args.files, args.output, enumerate=args.enumerate, jobs=args.jobs, dedupe=args.dedupe,
+                streaming=True if args.low_memory else None, optimize=args.optimize,
+                linearize=args.linearize,
+            )
         print(f"Created: {result}")
+        if args.dedupe:
+            saved = int(metrics.BYTES.get(stage="dedupe", direction="saved"))
+            print(f"Deduplicated {int(metrics.DEDUPED_OBJECTS.get())} objects, saved {saved} bytes")
+        if args.optimize:
+            inputs = int(metrics.BYTES.get(stage="optimize", direction="inputs"))
+            after = int(metrics.BYTES.get(stage="optimize", direction="out"))
+            seconds = sum(total for key, (total, _) in metrics.STAGE_SECONDS.totals().items()
+                          if dict(key).get("stage") == "optimize")
+            print(f"Optimized ({args.optimize}): {after} bytes from {inputs} bytes of input PDFs "
+                  f"in {seconds:.2f} s")
+        if args.metrics:
+            print(metrics.summary(), file=sys.stderr)
         return 0
     except FileNotFoundError as e:
         print(f"Error: file not found: {e}", file=sys.stderr)
@@ -62,5 +176,50 @@ def main() -> int:
         return 1
 
 
+def _path_error(path: Path | None, what: str, directory: bool = False) -> str | None:
+    """Why `path` cannot be written as a file (or used as a directory), or None if it can."""
+    if path is None:
+        return None
+    if directory:
+        if path.exists() and not path.is_dir():
+            return f"{what} {path} exists and is not a directory"
+    elif path.is_dir():
+        return f"{what} {path} is a directory"
+    parent = path.parent
+    while not parent.exists():
+        parent = parent.parent
+    if not parent.is_dir():
+        return f"{what} {path}: {parent} is not a directory"
+    return None
+
+
+def _profile_run(args: argparse.Namespace, label: str):
+    """profiling.profiled() for --profile / --profile-dir, else a no-op."""
+    if not (args.profile or args.profile_dir):
+        return nullcontext()
+    from profiling import profiled
+
+    return profiled(label, out_dir=args.profile_dir, threads=True, echo=sys.stderr)
+
+
+def run_batch_cli(manifest: Path, jobs: int, report: Path | None = None, show_metrics: bool = False) -> int:
+    """Run a batch manifest and print one result line per job; 1 if any job failed."""
+    from merge_batch import format_report, load_manifest, run_batch
+
+    try:
+        manifest_jobs = load_manifest(manifest)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    results = run_batch(manifest_jobs, jobs=jobs)
+    print(format_report(results, time.perf_counter() - start))
+    if report is not None:
+        report.write_text(json.dumps([r.as_dict() for r in results], indent=2), encoding="utf-8")
+    if show_metrics:
+        print(metrics.summary(), file=sys.stderr)
+    return 0 if all(r.ok for r in results) else 1
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,538 @@
+"""
+Size optimizations applied to a PdfWriter before it is serialized.
+
+Merging documents produced by the same tool usually copies the same fonts, logos and
+form XObjects once per input. dedupe_objects() finds indirect objects that serialize
+to identical bytes and keeps a single copy, repointing every reference to it. Objects
+are only shared, never changed, so every page renders exactly as before.
+
+optimize_pdf() goes further and writes a smaller file: images drawn at far less than
+their resolution are downsampled to a profile's DPI, uncompressed streams are
+Flate-compressed, duplicates and unreachable objects are dropped, and — when pikepdf
+or the qpdf command is available — objects are packed into compressed object streams.
+linearize_pdf() uses the same tools to lay a file out for incremental ("fast web view")
+display.
+"""
+
+import hashlib
+import io
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from pypdf import PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    ContentStream,
+    DictionaryObject,
+    EncodedStreamObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+
+
+@dataclass(frozen=True)
+class OptimizeProfile:
+    image_dpi: int      # images drawn above this resolution are downsampled; 0 keeps them
+    jpeg_quality: int   # quality of re-encoded JPEG images
+
+
+PROFILES = {
+    "screen": OptimizeProfile(image_dpi=96, jpeg_quality=60),
+    "ebook": OptimizeProfile(image_dpi=150, jpeg_quality=80),
+    "print": OptimizeProfile(image_dpi=300, jpeg_quality=90),
+    "lossless": OptimizeProfile(image_dpi=0, jpeg_quality=0),
+}
+
+# ---------- Optimization settings (overridable through the environment) ----------
+DEFAULT_PROFILE = os.environ.get("PDF_OPTIMIZE_PROFILE", "ebook")
+# ------------------------------------------------------------------
+
+_SLACK = 1.1            # images up to 10% above the profile's DPI are left alone
+_MAX_FORM_DEPTH = 8     # nesting of form XObjects followed when measuring images
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+# Objects whose identity matters (page tree, annotations, form fields, structure,
+# outlines): two equal copies must stay two objects.
+_IDENTITY_TYPES = {"/Catalog", "/Pages", "/Page", "/Annot", "/Outlines", "/StructTreeRoot", "/StructElem", "/Sig"}
+_IDENTITY_KEYS = ("/Parent", "/Kids", "/P", "/Rect", "/FT")
+
+
+@dataclass
+class DedupeResult:
+    objects: int = 0       # indirect objects removed
+    bytes_saved: int = 0   # their serialized size
+
+
+def _shareable(obj) -> bool:
+    if isinstance(obj, DictionaryObject):  # includes streams: fonts, images, form XObjects
+        if obj.get("/Type") in _IDENTITY_TYPES:
+            return False
+        return not any(key in obj for key in _IDENTITY_KEYS)
+    return isinstance(obj, ArrayObject)  # e.g. font /Widths
+
+
+def _serialize(obj) -> bytes:
+    buf = io.BytesIO()
+    obj.write_to_stream(buf)
+    return buf.getvalue()
+
+
+def _repoint(obj, replaced: dict[int, int], writer: PdfWriter) -> bool:
+    """Rewrite references to replaced objects inside `obj`; True if anything changed."""
+    changed = False
+    if isinstance(obj, DictionaryObject):
+        items = list(dict.items(obj))
+    elif isinstance(obj, ArrayObject):
+        items = list(enumerate(list.__iter__(obj)))
+    else:
+        return False
+    for key, value in items:
+        if isinstance(value, IndirectObject):
+            if value.pdf is writer and value.idnum in replaced:
+                if isinstance(obj, DictionaryObject):
+                    dict.__setitem__(obj, key, IndirectObject(replaced[value.idnum], 0, writer))
+                else:
+                    list.__setitem__(obj, key, IndirectObject(replaced[value.idnum], 0, writer))
+                changed = True
+        elif _repoint(value, replaced, writer):
+            changed = True
+    return changed
+
+
+def dedupe_objects(writer: PdfWriter) -> DedupeResult:
+    """
+    Keep one copy of every group of byte-identical shareable objects in `writer`.
+
+    Runs to a fixed point: once duplicate font programs are merged, the font
+    dictionaries pointing at them become identical too and are merged on the next pass.
+    Call it after the last page is added, right before writing.
+    """
+    objects = writer._objects
+    protected = {
+        ref.idnum
+        for ref in (getattr(writer.root_object, "indirect_reference", None),
+                    getattr(writer._info, "indirect_reference", None))
+        if isinstance(ref, IndirectObject)
+    }
+    result = DedupeResult()
+    keys: dict[int, bytes] = {}     # idnum -> content hash
+    owners: dict[bytes, int] = {}   # content hash -> idnum of the copy that is kept
+    pending = [i for i, obj in enumerate(objects, start=1) if obj is not None and i not in protected]
+
+    while pending:
+        replaced: dict[int, int] = {}
+        for idnum in pending:
+            obj = objects[idnum - 1]
+            if obj is None or not _shareable(obj):
+                continue
+            old = keys.pop(idnum, None)
+            if old is not None and owners.get(old) == idnum:
+                del owners[old]
+            data = _serialize(obj)
+            key = hashlib.sha256(data).digest()
+            keep = owners.setdefault(key, idnum)
+            keys[idnum] = key
+            if keep != idnum:
+                replaced[idnum] = keep
+                result.objects += 1
+                result.bytes_saved += len(data)
+        if not replaced:
+            break
+        for idnum in replaced:
+            objects[idnum - 1] = None
+            keys.pop(idnum, None)
+        # Only objects whose references changed can have become duplicates.
+        pending = [
+            i for i, obj in enumerate(objects, start=1)
+            if obj is not None and _repoint(obj, replaced, writer) and i not in protected
+        ]
+    return result
+
+
+@dataclass
+class OptimizeResult:
+    profile: str = ""
+    bytes_before: int = 0        # size unoptimized; only measured on request (see optimize_pdf)
+    bytes_after: int = 0
+    images_downsampled: int = 0
+    streams_compressed: int = 0
+    objects_removed: int = 0     # duplicates and unreachable objects
+    object_streams: bool = False  # packed into object streams (needs pikepdf or qpdf)
+    seconds: float = 0.0
+
+
+def get_profile(name: str | None) -> OptimizeProfile:
+    """The profile called `name` (None: PDF_OPTIMIZE_PROFILE); ValueError if unknown."""
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown optimization profile {name!r} (use one of: {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+class _ByteCounter:
+    """Write-only sink that only counts, to measure a serialization without storing it."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self) -> None:
+        pass
+
+
+# dedupe_objects, _replace, downsample_images, compress_streams and drop_unreachable edit
+# PdfWriter._objects (idnum - 1 -> object, None for a freed slot) directly; pypdf has no
+# public API for replacing or dropping an indirect object. The layout has held since
+# pypdf 3; requirements.txt pins the range this was checked against (pypdf >=4, <7).
+def _replace(writer: PdfWriter, idnum: int, obj) -> None:
+    obj.indirect_reference = IndirectObject(idnum, 0, writer)
+    writer._objects[idnum - 1] = obj
+
+
+def _multiply(m, n) -> tuple:
+    a, b, c, d, e, f = m
+    A, B, C, D, E, F = n
+    return (a * A + b * C, a * B + b * D, c * A + d * C, c * B + d * D, e * A + f * C + E, e * B + f * D + F)
+
+
+def drawn_sizes(writer: PdfWriter) -> dict[int, tuple[float, float]]:
+    """
+    Return {image idnum: (width, height)} in points, the largest each image XObject is
+    drawn by the page contents (following form XObjects). Images on a page whose
+    content cannot be parsed are reported as infinitely large, so nothing shrinks them.
+    """
+    sizes: dict[int, tuple[float, float]] = {}
+    forms: dict[int, list] = {}
+
+    def _record(idnum: int, width: float, height: float) -> None:
+        old_w, old_h = sizes.get(idnum, (0.0, 0.0))
+        sizes[idnum] = (max(old_w, width), max(old_h, height))
+
+    def _xobjects(resources) -> DictionaryObject:
+        xobjects = resources.get("/XObject") if isinstance(resources, DictionaryObject) else None
+        xobjects = xobjects.get_object() if xobjects is not None else None
+        return xobjects if isinstance(xobjects, DictionaryObject) else DictionaryObject()
+
+    def _walk(operations, resources, ctm, depth: int) -> None:
+        xobjects = _xobjects(resources)
+        saved = []
+        for operands, op in operations:
+            if op == b"q":
+                saved.append(ctm)
+            elif op == b"Q":
+                if saved:
+                    ctm = saved.pop()
+            elif op == b"cm" and len(operands) == 6:
+                ctm = _multiply(tuple(float(x) for x in operands), ctm)
+            elif op == b"Do" and operands and operands[0] in xobjects:
+                ref = xobjects.raw_get(operands[0])
+                if not isinstance(ref, IndirectObject):
+                    continue
+                xobj = ref.get_object()
+                subtype = xobj.get("/Subtype") if isinstance(xobj, DictionaryObject) else None
+                if subtype == "/Image":
+                    _record(ref.idnum, math.hypot(ctm[0], ctm[1]), math.hypot(ctm[2], ctm[3]))
+                elif subtype == "/Form" and depth < _MAX_FORM_DEPTH:
+                    ops = forms.get(ref.idnum)
+                    if ops is None:
+                        ops = forms[ref.idnum] = ContentStream(xobj, writer).operations
+                    matrix = tuple(float(x) for x in xobj.get("/Matrix", _IDENTITY))
+                    _walk(ops, xobj.get("/Resources", resources), _multiply(matrix, ctm), depth + 1)
+
+    for page in writer.pages:
+        resources = page.get("/Resources")
+        try:
+            contents = page.get_contents()
+            _walk(contents.operations if contents is not None else [], resources, _IDENTITY, 0)
+        except Exception:
+            for name in _xobjects(resources):
+                ref = _xobjects(resources).raw_get(name)
+                if isinstance(ref, IndirectObject):
+                    _record(ref.idnum, math.inf, math.inf)
+    return sizes
+
+
+def _filters(obj: StreamObject) -> list:
+    f = obj.get("/Filter")
+    if f is None:
+        return []
+    return list(f) if isinstance(f, ArrayObject) else [f]
+
+
+def _ascii_filters() -> dict:
+    from pypdf.filters import ASCII85Decode, ASCIIHexDecode
+
+    return {"/ASCII85Decode": ASCII85Decode, "/A85": ASCII85Decode, "/ASCIIHexDecode": ASCIIHexDecode, "/AHx": ASCIIHexDecode}
+
+
+_ASCII_FILTERS = _ascii_filters()
+
+
+def _image_mode(obj: StreamObject) -> str | None:
+    cs = obj.get("/ColorSpace")
+    if isinstance(cs, ArrayObject) and len(cs) == 2 and cs[0] == "/ICCBased":
+        return {1: "L", 3: "RGB"}.get(cs[1].get_object().get("/N"))
+    return {"/DeviceGray": "L", "/DeviceRGB": "RGB"}.get(cs)
+
+
+def _decode_image(obj: StreamObject, mode: str | None, size: tuple[int, int]):
+    """(PIL image, filter to re-encode with) for plain 8-bit Gray/RGB images, else None."""
+    from PIL import Image
+
+    if (mode is None or obj.get("/BitsPerComponent") != 8 or obj.get("/ImageMask")
+            or "/Mask" in obj or "/Matte" in obj):
+        return None
+    decode = obj.get("/Decode")
+    if decode is not None and [float(x) for x in decode] != [0.0, 1.0] * len(mode):
+        return None  # inverted or remapped samples
+    w, h = obj.get("/Width"), obj.get("/Height")
+    filters = _filters(obj)
+    if filters and filters[-1] == "/DCTDecode" and all(f in _ASCII_FILTERS for f in filters[:-1]):
+        data = obj._data
+        for f in filters[:-1]:  # e.g. reportlab's [/ASCII85Decode /DCTDecode]
+            data = _ASCII_FILTERS[f].decode(data)
+        img = Image.open(io.BytesIO(data))
+        if img.mode != mode or img.size != (w, h):
+            return None  # CMYK/YCCK data or a mismatched header: leave it alone
+        img.draft(mode, size)
+        return img, "/DCTDecode"
+    if all(f == "/FlateDecode" or f in _ASCII_FILTERS for f in filters):
+        data = obj.get_data()
+        if len(data) < w * h * len(mode):
+            return None
+        return Image.frombytes(mode, (w, h), data[:w * h * len(mode)]), "/FlateDecode"
+    return None
+
+
+def _encode_image(img, filter_name: str, quality: int) -> bytes:
+    if filter_name == "/DCTDecode":
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=quality, optimize=True)
+        return buf.getvalue()
+    return zlib.compress(img.tobytes(), 6)
+
+
+def _image_stream(old: StreamObject, data: bytes, size: tuple[int, int], filter_name: str) -> EncodedStreamObject:
+    new = EncodedStreamObject()
+    for key, value in dict.items(old):
+        if key not in ("/Filter", "/DecodeParms", "/Length", "/Width", "/Height"):
+            dict.__setitem__(new, key, value)
+    new[NameObject("/Width")] = NumberObject(size[0])
+    new[NameObject("/Height")] = NumberObject(size[1])
+    new[NameObject("/Filter")] = NameObject(filter_name)
+    new._data = data
+    return new
+
+
+def downsample_images(writer: PdfWriter, profile: OptimizeProfile) -> int:
+    """
+    Scale image XObjects drawn above profile.image_dpi down to it (soft masks along with
+    them) and re-encode them; an image is only replaced when the result is smaller.
+    Returns the number of images replaced.
+    """
+    if profile.image_dpi <= 0:
+        return 0
+    try:
+        from PIL import Image
+    except ImportError:
+        return 0
+    replaced = 0
+    for idnum, (width_pt, height_pt) in drawn_sizes(writer).items():
+        obj = writer._objects[idnum - 1]
+        if not isinstance(obj, StreamObject) or math.isinf(width_pt) or math.isinf(height_pt):
+            continue
+        w, h = obj.get("/Width"), obj.get("/Height")
+        if not w or not h:
+            continue
+        scale = max(width_pt * profile.image_dpi / 72 / w, height_pt * profile.image_dpi / 72 / h)
+        if scale * _SLACK >= 1:
+            continue
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        try:
+            decoded = _decode_image(obj, _image_mode(obj), size)
+            if decoded is None:
+                continue
+            smask_ref = obj.raw_get("/SMask") if "/SMask" in obj else None
+            smask = smask_ref.get_object() if isinstance(smask_ref, IndirectObject) else None
+            if smask_ref is not None:
+                if smask is None or (smask.get("/Width"), smask.get("/Height")) != (w, h):
+                    continue
+                decoded_mask = _decode_image(smask, "L", size)
+                if decoded_mask is None:
+                    continue
+            img, filter_name = decoded
+            data = _encode_image(img.resize(size, Image.LANCZOS), filter_name, profile.jpeg_quality)
+            new_mask = None
+            if smask is not None:
+                mask_img, mask_filter = decoded_mask
+                mask_data = _encode_image(mask_img.resize(size, Image.LANCZOS), mask_filter, profile.jpeg_quality)
+                new_mask = _image_stream(smask, mask_data, size, mask_filter)
+        except Exception:
+            continue  # undecodable image data: keep the original
+        before = len(obj._data) + (len(smask._data) if smask is not None else 0)
+        if len(data) + (len(new_mask._data) if new_mask is not None else 0) >= before:
+            continue
+        _replace(writer, idnum, _image_stream(obj, data, size, filter_name))
+        if new_mask is not None:
+            _replace(writer, smask_ref.idnum, new_mask)
+        replaced += 1
+    return replaced
+
+
+def compress_streams(writer: PdfWriter, level: int = 9) -> int:
+    """Flate-compress every stream without a filter (keeping it if not smaller); returns the count."""
+    compressed = 0
+    for idnum, obj in enumerate(writer._objects, start=1):
+        # XMP metadata stays readable for tools that scan files for it.
+        if not isinstance(obj, StreamObject) or "/Filter" in obj or obj.get("/Type") == "/Metadata":
+            continue
+        encoded = obj.flate_encode(level)
+        if len(encoded._data) < len(obj._data):
+            _replace(writer, idnum, encoded)
+            compressed += 1
+    return compressed
+
+
+def drop_unreachable(writer: PdfWriter) -> int:
+    """Remove objects no longer reachable from the catalog or the info dictionary."""
+    objects = writer._objects
+    todo = [
+        ref.idnum
+        for ref in (getattr(writer.root_object, "indirect_reference", None),
+                    getattr(writer._info, "indirect_reference", None))
+        if isinstance(ref, IndirectObject)
+    ]
+    seen: set[int] = set()
+    while todo:
+        idnum = todo.pop()
+        if idnum in seen or not 0 < idnum <= len(objects):
+            continue
+        seen.add(idnum)
+        values = [objects[idnum - 1]]
+        while values:
+            value = values.pop()
+            if isinstance(value, IndirectObject):
+                if value.pdf is writer and value.idnum not in seen:
+                    todo.append(value.idnum)
+            elif isinstance(value, DictionaryObject):
+                values.extend(dict.values(value))
+            elif isinstance(value, ArrayObject):
+                values.extend(list.__iter__(value))
+    removed = 0
+    for idnum, obj in enumerate(objects, start=1):
+        if obj is not None and idnum not in seen:
+            objects[idnum - 1] = None
+            removed += 1
+    return removed
+
+
+def _pikepdf():
+    try:
+        import pikepdf
+    except ImportError:
+        return None
+    return pikepdf
+
+
+def _qpdf(args: list[str], src: Path, dst: Path) -> bool:
+    qpdf = shutil.which("qpdf")
+    if qpdf is None:
+        return False
+    result = subprocess.run([qpdf, *args, str(src), str(dst)], capture_output=True)
+    return result.returncode in (0, 3)  # 3: written, with warnings
+
+
+def pack_object_streams(src: Path, dst: Path) -> bool:
+    """
+    Rewrite `src` to `dst` with objects packed into compressed object streams and a
+    cross-reference stream, through pikepdf or else the qpdf command (pypdf cannot
+    write object streams). Returns False when neither is available or qpdf fails.
+    """
+    pikepdf = _pikepdf()
+    if pikepdf is not None:
+        with pikepdf.open(src) as pdf:
+            pdf.save(dst, object_stream_mode=pikepdf.ObjectStreamMode.generate, compress_streams=True)
+        return True
+    return _qpdf(["--object-streams=generate", "--compress-streams=y"], src, dst)
+
+
+def can_linearize() -> bool:
+    """True if pikepdf or the qpdf command is there to write linearized files."""
+    return _pikepdf() is not None or shutil.which("qpdf") is not None
+
+
+def linearize_pdf(src: Path, dst: Path) -> bool:
+    """
+    Rewrite `src` to `dst` linearized ("fast web view"): the first page's objects and
+    the hint tables come first, so a viewer reading byte ranges shows page 1 before the
+    rest has arrived. Object streams are kept as they are. Through pikepdf or else the
+    qpdf command; returns False when neither is available or qpdf fails.
+    """
+    pikepdf = _pikepdf()
+    if pikepdf is not None:
+        with pikepdf.open(src) as pdf:
+            pdf.save(dst, linearize=True)
+        return True
+    return _qpdf(["--linearize"], src, dst)
+
+
+def optimize_pdf(
+    writer: PdfWriter,
+    stream: BinaryIO,
+    profile: str | None = None,
+    work_dir: Path | None = None,
+    measure_before: bool = False,
+) -> OptimizeResult:
+    """
+    Optimize `writer` in place with the named profile (see PROFILES) and write the
+    result to `stream` (needs write() only). work_dir holds the intermediate files.
+
+    measure_before: also report the unoptimized size (bytes_before, else 0). That
+    serializes the writer once more, which on a large merge costs about as much as
+    writing the result.
+    """
+    start = time.perf_counter()
+    settings = get_profile(profile)
+    result = OptimizeResult(profile=profile or DEFAULT_PROFILE)
+    if measure_before:
+        counter = _ByteCounter()
+        writer.write(counter)
+        result.bytes_before = counter.size
+
+    # Deduplicate first so an image shared by several inputs is only resampled once.
+    result.objects_removed = dedupe_objects(writer).objects
+    result.images_downsampled = downsample_images(writer, settings)
+    result.streams_compressed = compress_streams(writer)
+    result.objects_removed += drop_unreachable(writer)
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        plain, packed = Path(tmp) / "plain.pdf", Path(tmp) / "packed.pdf"
+        with open(plain, "wb") as f:
+            writer.write(f)
+        try:
+            result.object_streams = (pack_object_streams(plain, packed)
+                                     and packed.stat().st_size < plain.stat().st_size)
+        except Exception:
+            result.object_streams = False  # the plain file is still a valid result
+        final = packed if result.object_streams else plain
+        result.bytes_after = final.stat().st_size
+        with open(final, "rb") as f:
+            shutil.copyfileobj(f, stream, 1024 * 1024)
+    result.seconds = time.perf_counter() - start
+    return result
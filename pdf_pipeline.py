@@ -3,86 +3,112 @@ PDF pipeline: convert DOCX → PDF, merge PDFs in order, optionally add page num
 All steps are separate, pure functions.
 """
 
+import os
+import re
 import shutil
-import subprocess
 import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextlib import ExitStack, nullcontext
 from pathlib import Path
-from typing import List
+from typing import BinaryIO, Callable, List, Optional
 
 from pypdf import PdfReader, PdfWriter
 
+import metrics
+from converter_registry import FAST_PATH, BackendRegistry, inspect_docx
+from disk_cache import DiskCache, file_sha256
+from scheduler import Deadline, StageLimiter, checked_progress
 
-def convert_docx_to_pdf(docx_path: Path, output_dir: Path | None = None) -> Path:
-    """
-    Convert a single .docx file to PDF.
+# progress(stage, done, total) — stage is "convert", "merge" or "write".
+ProgressCallback = Callable[[str, int, int], None]
 
-    On macOS we prefer LibreOffice (soffice) because docx2pdf/JXA + Word often
-    fails with 'Error: Message not understood'. On Windows we prefer docx2pdf
-    (Word automation) and fall back to LibreOffice if available.
 
-    Returns the path to the generated PDF.
-    """
-    docx_path = Path(docx_path).resolve()
-    if not docx_path.suffix.lower() == ".docx":
-        raise ValueError(f"Not a .docx file: {docx_path}")
-    if not docx_path.exists():
-        raise FileNotFoundError(docx_path)
+# ---------- Conversion cache (overridable through the environment) ----------
+CACHE_DIR = Path(os.environ.get("PDF_CACHE_DIR", Path(tempfile.gettempdir()) / "pdf-master2-cache"))
+CACHE_MAX_MB = int(os.environ.get("PDF_CACHE_MAX_MB", 512))  # 0 disables the cache
+# ------------------------------------------------------------------
 
-    out_dir = Path(output_dir) if output_dir else docx_path.parent
-    out_dir = out_dir.resolve()
-    out_dir.mkdir(parents=True, exist_ok=True)
-    pdf_path = out_dir / f"{docx_path.stem}.pdf"
+# Part of every conversion cache key. Bump when a converter's output changes (e.g. the
+# image handling of mammoth+weasyprint or the reportlab fallback), so old PDFs go stale.
+_CONVERSION_KEY_VERSION = 2
 
-    def _try_docx2pdf() -> bool:
-        try:
-            from docx2pdf import convert as docx2pdf_convert
+# ---------- Streaming merge (overridable through the environment) ----------
+# Inputs adding up to more than this are merged with streaming_merge (bounded memory).
+STREAMING_MIN_MB = int(os.environ.get("PDF_STREAMING_MIN_MB", 1024))  # 0 = only when asked
+# ------------------------------------------------------------------
 
-            docx2pdf_convert(str(docx_path), str(pdf_path))
-            return pdf_path.exists()
-        except Exception:
-            return False
 
-    def _try_soffice() -> bool:
-        # LibreOffice headless: soffice --headless --convert-to pdf --outdir out_dir input.docx
-        soffice = shutil.which("soffice") or shutil.which("libreoffice")
-        if not soffice and Path("/Applications/LibreOffice.app").exists():
-            soffice = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
-        if not soffice or not Path(soffice).exists():
-            return False
-        try:
-            subprocess.run(
-                [soffice, "--headless", "--convert-to", "pdf", "--outdir", str(out_dir), str(docx_path)],
-                check=True,
-                capture_output=True,
-                timeout=300,
-            )
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
-            return False
+def _try_docx2pdf(docx_path: Path, pdf_path: Path, deadline: Deadline | None = None) -> bool:
+    try:
+        from docx2pdf import convert as docx2pdf_convert
+
+        docx2pdf_convert(str(docx_path), str(pdf_path))
         return pdf_path.exists()
+    except Exception:
+        return False
 
-    def _try_mammoth_weasyprint() -> bool:
-        # Pure-Python fallback with formatting: mammoth converts docx→HTML
-        # (preserving bold, italic, headings, tables, lists, images), then
-        # weasyprint renders the HTML to PDF.
-        try:
-            import base64
-            import mammoth
-            import weasyprint
-
-            # Embed images as base64 data URIs so they appear in the PDF
-            def _inline_image(image):
-                with image.open() as img_bytes:
-                    encoded = base64.b64encode(img_bytes.read()).decode("ascii")
-                return {"src": f"data:{image.content_type};base64,{encoded}"}
-
-            with open(docx_path, "rb") as f:
-                result = mammoth.convert_to_html(
-                    f,
-                    convert_image=mammoth.images.img_element(_inline_image),
-                )
-
-            html = f"""<!DOCTYPE html>
+
+def _try_soffice(docx_path: Path, pdf_path: Path, deadline: Deadline | None = None) -> bool:
+    # LibreOffice headless, through the shared worker pool (see soffice_pool.py);
+    # cancelling the deadline kills the worker's process.
+    from soffice_pool import SofficeError, get_pool
+
+    pool = get_pool()
+    if not pool.available():
+        return False
+    try:
+        timeout = deadline.remaining() if deadline is not None else None
+        pool.convert(docx_path, pdf_path.parent, timeout=timeout, cancel=deadline)
+    except (SofficeError, TimeoutError, OSError):
+        return False
+    return pdf_path.exists()
+
+
+# A4 (weasyprint's default page size) minus the 2cm @page margins used below.
+_HTML_PRINTABLE_WIDTH_IN = (210 - 2 * 20) / 25.4
+_IMAGE_URL_PREFIX = "docx-image:"
+
+
+def _try_mammoth_weasyprint(docx_path: Path, pdf_path: Path, deadline: Deadline | None = None) -> bool:
+    # Pure-Python fallback with formatting: mammoth converts docx→HTML
+    # (preserving bold, italic, headings, tables, lists, images), then
+    # weasyprint renders the HTML to PDF.
+    try:
+        import mammoth
+        import weasyprint
+
+        from docx_images import display_widths, downsample, image_key
+
+        # Images reach weasyprint through url_fetcher rather than base64 data URIs:
+        # each distinct image is downsampled to its drawn size once and embedded once.
+        widths = display_widths(docx_path)
+        images: dict[str, tuple[bytes, str]] = {}
+
+        def _image_src(image):
+            with image.open() as img_bytes:
+                data = img_bytes.read()
+            key = image_key(data)
+            if key not in images:
+                width_in = min(widths.get(key, _HTML_PRINTABLE_WIDTH_IN), _HTML_PRINTABLE_WIDTH_IN)
+                images[key] = downsample(data, image.content_type, width_in)
+            return {"src": _IMAGE_URL_PREFIX + key}
+
+        def _fetch(url, *args, **kwargs):
+            if url.startswith(_IMAGE_URL_PREFIX):
+                data, content_type = images[url[len(_IMAGE_URL_PREFIX):]]
+                return {"string": data, "mime_type": content_type}
+            return weasyprint.default_url_fetcher(url, *args, **kwargs)
+
+        with open(docx_path, "rb") as f:
+            result = mammoth.convert_to_html(
+                f,
+                convert_image=mammoth.images.img_element(_image_src),
+            )
+
+        html = f"""<!DOCTYPE html>
 <html>
 <head>
 <meta charset="utf-8">
@@ -108,162 +134,195 @@ def convert_docx_to_pdf(docx_path: Path, output_dir: Path | None = None) -> Path
 <body>{result.value}</body>
 </html>"""
 
-            weasyprint.HTML(string=html).write_pdf(str(pdf_path))
-            return pdf_path.exists()
-        except Exception:
+        if deadline is not None and deadline.cancelled:
             return False
+        weasyprint.HTML(string=html, url_fetcher=_fetch).write_pdf(str(pdf_path))
+        return pdf_path.exists()
+    except Exception:
+        return False
 
-    def _try_python_docx_reportlab() -> bool:
-        # Last-resort fallback: python-docx + reportlab only — no system libs needed.
-        # Preserves bold/italic/headings/tables but drops images (needs pango for those).
-        try:
-            import io as _io
-            from docx import Document as _Document
-            from docx.oxml.ns import qn as _qn
-            from docx.text.paragraph import Paragraph as _DocxPara
-            from docx.table import Table as _DocxTable
-            from docx.enum.text import WD_ALIGN_PARAGRAPH
-
-            from reportlab.lib import colors as _colors
-            from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
-            from reportlab.lib.pagesizes import letter
-            from reportlab.lib.styles import ParagraphStyle
-            from reportlab.lib.units import inch
-            from reportlab.platypus import (
-                Image as _RLImage,
-                Paragraph as _RLPara,
-                SimpleDocTemplate,
-                Spacer,
-                Table as _RLTable,
-                TableStyle,
-            )
 
-            _doc = _Document(str(docx_path))
-
-            _S = {
-                "n":  ParagraphStyle("rln",  fontName="Helvetica",      fontSize=11, leading=16, spaceAfter=4),
-                "h1": ParagraphStyle("rlh1", fontName="Helvetica-Bold", fontSize=20, leading=26, spaceBefore=10, spaceAfter=6),
-                "h2": ParagraphStyle("rlh2", fontName="Helvetica-Bold", fontSize=16, leading=22, spaceBefore=8,  spaceAfter=4),
-                "h3": ParagraphStyle("rlh3", fontName="Helvetica-Bold", fontSize=13, leading=18, spaceBefore=6,  spaceAfter=4),
-            }
-            _ALIGN = {
-                WD_ALIGN_PARAGRAPH.CENTER:  TA_CENTER,
-                WD_ALIGN_PARAGRAPH.RIGHT:   TA_RIGHT,
-                WD_ALIGN_PARAGRAPH.JUSTIFY: TA_JUSTIFY,
-            }
-
-            def _style(base, alignment):
-                ta = _ALIGN.get(alignment)
-                if ta is None:
-                    return base
-                return ParagraphStyle(base.name + "_a", parent=base, alignment=ta)
-
-            def _runs_to_markup(para):
-                parts = []
-                for run in para.runs:
-                    t = (run.text or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-                    if not t:
-                        continue
-                    if run.bold:      t = f"<b>{t}</b>"
-                    if run.italic:    t = f"<i>{t}</i>"
-                    if run.underline: t = f"<u>{t}</u>"
-                    parts.append(t)
-                return "".join(parts)
-
-            def _images_in_para(para):
-                imgs = []
-                for run in para.runs:
-                    for blip in run._r.findall(".//" + _qn("a:blip")):
-                        rid = blip.get(_qn("r:embed"))
-                        if rid and rid in _doc.part.rels:
-                            rel = _doc.part.rels[rid]
-                            if "image" in rel.reltype:
-                                imgs.append(rel.target_part.blob)
-                return imgs
-
-            story = []
-
-            def _add_para(para):
-                for img_blob in _images_in_para(para):
-                    try:
-                        from PIL import Image as _PILImg
-                        pil = _PILImg.open(_io.BytesIO(img_blob))
-                        w, h = pil.size
-                        max_w, max_h = 5.5 * inch, 2.5 * inch
-                        scale = min(max_w / w, max_h / h, 1.0)
-                        story.append(_RLImage(_io.BytesIO(img_blob), width=w * scale, height=h * scale))
-                        story.append(Spacer(1, 4))
-                    except Exception:
-                        pass
-
-                markup = _runs_to_markup(para)
-                if not markup.strip():
-                    story.append(Spacer(1, 4))
-                    return
-
-                sname = (para.style.name or "").lower()
-                if "heading 1" in sname:   base = _S["h1"]
-                elif "heading 2" in sname: base = _S["h2"]
-                elif "heading 3" in sname: base = _S["h3"]
-                else:                      base = _S["n"]
-
-                st = _style(base, para.alignment)
-                try:
-                    story.append(_RLPara(markup, st))
-                except Exception:
-                    story.append(_RLPara((para.text or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;"), base))
-
-            def _add_table(table):
-                data = []
-                for row in table.rows:
-                    row_data = []
-                    for cell in row.cells:
-                        ct = "".join(
-                            (r.text or "") for p in cell.paragraphs for r in p.runs
-                        ).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-                        row_data.append(_RLPara(ct, _S["n"]))
-                    data.append(row_data)
-                if data:
-                    t = _RLTable(data, repeatRows=1, hAlign="LEFT")
-                    t.setStyle(TableStyle([
-                        ("GRID",         (0, 0), (-1, -1), 0.5, _colors.grey),
-                        ("BACKGROUND",   (0, 0), (-1,  0), _colors.lightgrey),
-                        ("VALIGN",       (0, 0), (-1, -1), "TOP"),
-                        ("TOPPADDING",   (0, 0), (-1, -1), 4),
-                        ("BOTTOMPADDING",(0, 0), (-1, -1), 4),
-                        ("LEFTPADDING",  (0, 0), (-1, -1), 6),
-                        ("RIGHTPADDING", (0, 0), (-1, -1), 6),
-                    ]))
-                    story.append(t)
-                    story.append(Spacer(1, 8))
-
-            for child in _doc.element.body:
-                tag = child.tag
-                if tag == _qn("w:p"):
-                    _add_para(_DocxPara(child, _doc))
-                elif tag == _qn("w:tbl"):
-                    _add_table(_DocxTable(child, _doc))
-
-            if not story:
-                story.append(_RLPara("(empty document)", _S["n"]))
-
-            SimpleDocTemplate(
-                str(pdf_path), pagesize=letter,
-                leftMargin=inch, rightMargin=inch, topMargin=inch, bottomMargin=inch,
-            ).build(story)
-            return pdf_path.exists()
-        except Exception:
-            return False
+def _try_python_docx_reportlab(docx_path: Path, pdf_path: Path, deadline: Deadline | None = None) -> bool:
+    # Last-resort fallback: python-docx + reportlab only — no system libs needed.
+    # Preserves bold/italic/headings/tables and images (see docx_reportlab.py).
+    try:
+        from docx_reportlab import convert
+
+        return convert(docx_path, pdf_path, deadline)
+    except Exception:
+        return False
+
 
-    ok = False
+def _probe_docx2pdf() -> bool:
+    # docx2pdf drives Microsoft Word, which only exists on Windows and macOS.
+    if sys.platform not in ("win32", "darwin"):
+        return False
+    import docx2pdf  # noqa: F401
+    return True
+
+
+def _probe_soffice() -> bool:
+    from soffice_pool import get_pool
+    return get_pool().available()
+
+
+def _probe_mammoth_weasyprint() -> bool:
+    import mammoth  # noqa: F401
+    import weasyprint  # noqa: F401  (raises if pango/cairo are missing)
+    return True
+
+
+def _probe_python_docx_reportlab() -> bool:
+    import docx  # noqa: F401
+    import reportlab  # noqa: F401
+    return True
+
+
+def _build_registry() -> BackendRegistry:
+    """Register the converters in order of preference for this platform."""
+    backends = {
+        "docx2pdf": (_try_docx2pdf, _probe_docx2pdf),
+        "soffice": (_try_soffice, _probe_soffice),
+        "mammoth-weasyprint": (_try_mammoth_weasyprint, _probe_mammoth_weasyprint),
+        "python-docx-reportlab": (_try_python_docx_reportlab, _probe_python_docx_reportlab),
+    }
     if sys.platform == "win32":
-        ok = _try_docx2pdf() or _try_soffice() or _try_mammoth_weasyprint() or _try_python_docx_reportlab()
+        order = ["docx2pdf", "soffice", "mammoth-weasyprint", "python-docx-reportlab"]
     else:
-        ok = _try_soffice() or _try_docx2pdf() or _try_mammoth_weasyprint() or _try_python_docx_reportlab()
+        order = ["soffice", "docx2pdf", "mammoth-weasyprint", "python-docx-reportlab"]
+    registry = BackendRegistry()
+    for name in order:
+        convert, probe = backends[name]
+        registry.register(name, convert, probe, fast=(name == "python-docx-reportlab"))
+    return registry
+
+
+backend_registry = _build_registry()
+
+
+def _backend_chain():
+    """Conversion backends as (name, function) in order of preference for this platform."""
+    return [(b.name, b.convert) for b in backend_registry.backends()]
+
+
+_conversion_cache: DiskCache | None = None
+
+
+def conversion_cache() -> DiskCache:
+    """Return the shared DOCX→PDF conversion cache (hit/miss counters via .stats())."""
+    global _conversion_cache
+    if _conversion_cache is None:
+        _conversion_cache = DiskCache(CACHE_DIR / "conversions", CACHE_MAX_MB * 1024 * 1024)
+    return _conversion_cache
+
+
+def _cache_metrics() -> dict:
+    if _conversion_cache is None:
+        return {}
+    stats = _conversion_cache.stats()
+    return {(("stat", name),): stats[name] for name in ("hits", "misses", "entries", "bytes")}
+
+
+metrics.CallbackGauge("pdf_conversion_cache", "DOCX→PDF conversion cache counters and size", _cache_metrics)
+
+
+def _conversion_key(digest: str, backend) -> str:
+    return f"{digest}-{backend.name}-v{_CONVERSION_KEY_VERSION}"
+
+
+def convert_docx_to_pdf(
+    docx_path: Path,
+    output_dir: Path | None = None,
+    use_cache: bool = True,
+    fast_path: bool | None = None,
+    deadline: Deadline | None = None,
+    backends: List[str] | None = None,
+    limiter: StageLimiter | None = None,
+) -> Path:
+    """
+    Convert a single .docx file to PDF.
+
+    On macOS we prefer LibreOffice (soffice) because docx2pdf/JXA + Word often
+    fails with 'Error: Message not understood'. On Windows we prefer docx2pdf
+    (Word automation) and fall back to LibreOffice if available.
+
+    Backends come from backend_registry: probed once, skipped for a while after
+    failing on a document another backend could convert, and — when fast_path is
+    allowed (default: DOCX_FAST_PATH) — simple text-only documents go to the fastest
+    observed backend first. Under a deadline, backends whose observed latency would
+    overrun the time left are tried last.
+
+    Results are cached by the SHA-256 of the .docx bytes plus the backend that
+    produced them (and a key version); a cached conversion of the backend the plan
+    picks first is served without running any converter.
+
+    limiter: a scheduler.StageLimiter to hold a slot of while converting; the web app
+    passes scheduler.CONVERSIONS (CONVERT_MAX_ACTIVE per process). None: no limit.
+    deadline: a scheduler.Deadline; once it expires or is cancelled the conversion
+    stops (killing a running LibreOffice) and Cancelled/DeadlineExceeded is raised.
+    backends: optional list; the name of the backend whose output is returned is
+        appended to it (cache hits included).
+
+    Returns the path to the generated PDF.
+    """
+    docx_path = Path(docx_path).resolve()
+    if not docx_path.suffix.lower() == ".docx":
+        raise ValueError(f"Not a .docx file: {docx_path}")
+    if not docx_path.exists():
+        raise FileNotFoundError(docx_path)
+
+    out_dir = Path(output_dir) if output_dir else docx_path.parent
+    out_dir = out_dir.resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    pdf_path = out_dir / f"{docx_path.stem}.pdf"
+
+    fast_path = FAST_PATH if fast_path is None else fast_path
+    size = docx_path.stat().st_size
+    # Reading document.xml only pays off when the fast path may use what it finds.
+    profile = inspect_docx(docx_path) if fast_path else None
+    plan = backend_registry.plan(
+        profile, fast_path=fast_path, size=size,
+        budget_s=deadline.remaining() if deadline is not None else None,
+    )
 
-    if ok:
+    # Only the backend the plan puts first may answer from the cache: a fallback's
+    # output cached while a better backend was down is not served once it is back.
+    cache = conversion_cache() if use_cache else None
+    digest = file_sha256(docx_path) if cache is not None and cache.enabled and plan else None
+    if digest is not None and cache.fetch([_conversion_key(digest, plan[0])], pdf_path):
+        if backends is not None:
+            backends.append(plan[0].name)
         return pdf_path
 
+    failed = []
+    with limiter.slot(deadline, queue=True) if limiter is not None else nullcontext():
+        for i, backend in enumerate(plan):
+            if deadline is not None:
+                deadline.check()
+            start = time.perf_counter()
+            ok = backend.convert(docx_path, pdf_path, deadline)
+            elapsed = time.perf_counter() - start
+            if not ok and deadline is not None and deadline.cancelled:
+                deadline.check()  # stopped on purpose: not the backend's failure
+            metrics.CONVERTER_SECONDS.observe(elapsed, backend=backend.name)
+            backend_registry.record(backend, ok, elapsed, size)
+            if not ok:
+                outcome = "fallthrough" if i < len(plan) - 1 else "failure"
+                metrics.CONVERTER_ATTEMPTS.inc(backend=backend.name, outcome=outcome)
+                failed.append(backend)
+                continue
+            metrics.CONVERTER_ATTEMPTS.inc(backend=backend.name, outcome="success")
+            if backends is not None:
+                backends.append(backend.name)
+            # The document was convertible, so the earlier failures were the backends' fault.
+            backend_registry.cool_down(failed)
+            if digest is not None:
+                try:
+                    cache.store(_conversion_key(digest, backend), pdf_path)
+                except OSError:
+                    pass  # a full or read-only cache must not fail the conversion
+            return pdf_path
+
     raise RuntimeError(
         "Could not convert the Word (.docx) file to PDF.\n"
         "For best results install LibreOffice: brew install --cask libreoffice\n"
@@ -271,22 +330,134 @@ def convert_docx_to_pdf(docx_path: Path, output_dir: Path | None = None) -> Path
     )
 
 
-def merge_pdfs(pdf_paths: List[Path], output_path: Path) -> None:
+_PAGE_RANGE = re.compile(r"^(\d*)(?:(-)(\d*))?$")
+
+
+def parse_page_ranges(spec: str) -> List[tuple[int, int | None]]:
+    """
+    Parse a page spec such as "1-3,10,20-" into 1-based inclusive (first, last) ranges;
+    last is None for "to the end". Raises ValueError on malformed specs.
+    """
+    ranges = []
+    for part in spec.replace(" ", "").split(","):
+        m = _PAGE_RANGE.match(part)
+        if not part or not m or not (m.group(1) or m.group(3)):
+            raise ValueError(f"Invalid page range {part!r} in {spec!r} (use e.g. 1-3,10)")
+        first = int(m.group(1)) if m.group(1) else 1
+        last = first if not m.group(2) else (int(m.group(3)) if m.group(3) else None)
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Invalid page range {part!r} in {spec!r}")
+        ranges.append((first, last))
+    return ranges
+
+
+def split_page_spec(arg: str) -> tuple[str, str | None]:
+    """
+    Split "annex.pdf:1-3,10" into ("annex.pdf", "1-3,10"). Only a suffix that looks like
+    a page spec is split off, so Windows drive letters and existing files named with a
+    colon are left alone.
+    """
+    path, sep, spec = arg.rpartition(":")
+    if not sep or not path or Path(arg).exists() or not re.fullmatch(r"[\d,\- ]+", spec):
+        return arg, None
+    return path, spec
+
+
+def _validate_page_ranges(page_ranges: List[Optional[str]] | None, count: int) -> List[Optional[str]]:
+    if page_ranges is None:
+        return [None] * count
+    if len(page_ranges) != count:
+        raise ValueError(f"Got {len(page_ranges)} page ranges for {count} input files.")
+    page_ranges = [spec.strip() if spec and spec.strip() else None for spec in page_ranges]
+    for spec in page_ranges:
+        if spec:
+            parse_page_ranges(spec)
+    return page_ranges
+
+
+def _selected_pages(reader: PdfReader, spec: str | None, path: Path) -> List[int]:
+    """0-based page indices selected by `spec`, in spec order."""
+    count = len(reader.pages)
+    if not spec:
+        return list(range(count))
+    indices = []
+    for first, last in parse_page_ranges(spec):
+        last = count if last is None else last
+        if last > count:
+            raise ValueError(f"{path.name}: page range {spec!r} is outside pages 1-{count}")
+        indices.extend(range(first - 1, last))
+    return indices
+
+
+def _open_reader(path: Path, files: ExitStack) -> PdfReader:
+    # Hand pypdf an open file rather than a path: given a path it reads the whole file
+    # into memory, given a file it only reads the objects the selected pages reference.
+    return PdfReader(files.enter_context(open(path, "rb")))
+
+
+def merge_pdfs(
+    pdf_paths: List[Path],
+    output_path: Path,
+    dedupe: bool = False,
+    page_ranges: List[Optional[str]] | None = None,
+    streaming: bool = False,
+) -> None:
     """
     Merge PDFs in the given order into a single file.
+    dedupe: store fonts, images and other resources shared by several inputs only once.
+    page_ranges: optional page spec per input ("1-3,10"; None for every page).
+    streaming: copy pages straight to the output with bounded memory (see streaming_merge).
     """
     output_path = Path(output_path).resolve()
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    writer = PdfWriter()
+    page_ranges = _validate_page_ranges(page_ranges, len(pdf_paths))
+    if streaming and dedupe:
+        raise ValueError("Deduplication needs the whole document in memory; it cannot be combined with streaming.")
+    pdf_paths = [Path(p).resolve() for p in pdf_paths]
     for p in pdf_paths:
-        p = Path(p).resolve()
         if not p.exists():
             raise FileNotFoundError(p)
-        reader = PdfReader(str(p))
-        for page in reader.pages:
-            writer.add_page(page)
-    with open(output_path, "wb") as f:
-        writer.write(f)
+    with metrics.STAGE_SECONDS.time(stage="merge_pdfs"), ExitStack() as files:
+        if streaming:
+            with open(output_path, "wb") as f:
+                metrics.PAGES.inc(_stream_merged(pdf_paths, pdf_paths, page_ranges, f), stage="merge_pdfs")
+        else:
+            writer = PdfWriter()
+            for p, spec in zip(pdf_paths, page_ranges):
+                reader = _open_reader(p, files)
+                indices = _selected_pages(reader, spec, p)
+                for i in indices:
+                    writer.add_page(reader.pages[i])
+                metrics.PAGES.inc(len(indices), stage="merge_pdfs")
+            if dedupe:
+                _dedupe(writer)
+            with open(output_path, "wb") as f:
+                writer.write(f)
+    metrics.BYTES.inc(output_path.stat().st_size, stage="merge_pdfs", direction="out")
+
+
+def _optimize(writer: PdfWriter, stream: BinaryIO, profile: str, work_dir: Path, input_bytes: int) -> None:
+    from pdf_optimize import optimize_pdf
+
+    with metrics.STAGE_SECONDS.time(stage="optimize"):
+        result = optimize_pdf(writer, stream, profile, work_dir)
+    # Measuring the unoptimized merge would mean writing it twice; the total size of the
+    # input PDFs is known already. It is not the "before" size: page ranges, numbering
+    # and dedupe change that.
+    metrics.BYTES.inc(input_bytes, stage="optimize", direction="inputs")
+    metrics.BYTES.inc(result.bytes_after, stage="optimize", direction="out")
+    metrics.OPTIMIZED.inc(result.images_downsampled, kind="images_downsampled")
+    metrics.OPTIMIZED.inc(result.streams_compressed, kind="streams_compressed")
+    metrics.OPTIMIZED.inc(result.objects_removed, kind="objects_removed")
+
+
+def _dedupe(writer: PdfWriter) -> None:
+    from pdf_optimize import dedupe_objects
+
+    with metrics.STAGE_SECONDS.time(stage="dedupe"):
+        result = dedupe_objects(writer)
+    metrics.DEDUPED_OBJECTS.inc(result.objects)
+    metrics.BYTES.inc(result.bytes_saved, stage="dedupe", direction="saved")
 
 
 def add_numbered_header(input_path: Path, output_path: Path) -> None:
@@ -297,56 +468,387 @@ def add_numbered_header(input_path: Path, output_path: Path) -> None:
     add_numbers_to_pdf(Path(input_path), Path(output_path))
 
 
+def _convert_inputs(
+    sources: List[Path],
+    temp_dir: Path,
+    jobs: int = 1,
+    progress: ProgressCallback | None = None,
+    deadline: Deadline | None = None,
+    backends: List[str] | None = None,
+    limiter: StageLimiter | None = None,
+) -> List[Path]:
+    """
+    Convert every .docx in `sources` to PDF and return PDF paths in input order.
+
+    Each document converts into its own numbered subdirectory of temp_dir, so inputs
+    with the same stem never overwrite each other. With jobs > 1 conversions run on a
+    bounded thread pool; the first failure cancels every conversion not yet started.
+    """
+    pdf_paths: List[Path | None] = [p if p.suffix.lower() == ".pdf" else None for p in sources]
+    todo = [(i, p) for i, p in enumerate(sources) if pdf_paths[i] is None]
+    converted = 0
+    lock = threading.Lock()
+
+    def _convert(i: int, p: Path) -> Path:
+        nonlocal converted
+        pdf_path = convert_docx_to_pdf(
+            p, output_dir=temp_dir / f"{i:04d}", deadline=deadline, backends=backends, limiter=limiter
+        )
+        if progress is not None:
+            with lock:
+                converted += 1
+                progress("convert", converted, len(todo))
+        return pdf_path
+
+    if progress is not None:
+        progress("convert", 0, len(todo))
+    if not todo:
+        return pdf_paths
+
+    start = time.perf_counter()
+    try:
+        if jobs <= 1 or len(todo) <= 1:
+            for i, p in todo:
+                pdf_paths[i] = _convert(i, p)
+            return pdf_paths
+
+        executor = ThreadPoolExecutor(max_workers=min(jobs, len(todo)), thread_name_prefix="convert")
+        try:
+            futures = {executor.submit(_convert, i, p): i for i, p in todo}
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for fut in done:
+                if fut.exception() is not None:
+                    raise fut.exception()
+            for fut, i in futures.items():
+                pdf_paths[i] = fut.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return pdf_paths
+    finally:
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="convert")
+        metrics.BYTES.inc(sum(p.stat().st_size for _, p in todo), stage="convert", direction="in")
+
+
+class _PositionTrackingStream:
+    """Adds tell() to write-only streams (sockets, pipes) so PdfWriter can build the xref."""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._pos = 0
+
+    def write(self, data: bytes) -> int:
+        self._stream.write(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        if hasattr(self._stream, "flush"):
+            self._stream.flush()
+
+
+def _trackable(stream: BinaryIO) -> BinaryIO:
+    seekable = getattr(stream, "seekable", None)
+    if seekable and seekable():
+        return stream
+    return _PositionTrackingStream(stream)
+
+
+def _stream_merged(
+    pdf_paths: List[Path],
+    sources: List[Path],
+    page_ranges: List[Optional[str]],
+    stream: BinaryIO,
+    enumerate: bool = False,
+    progress: ProgressCallback | None = None,
+) -> int:
+    """Bounded-memory variant of the merge and write stages; returns the page count."""
+    from streaming_merge import stream_merge
+
+    # Resolve the selections first: "Pag. n/total" needs the total before page one.
+    selections = []
+    for p, spec, src in zip(pdf_paths, page_ranges, sources):
+        with ExitStack() as files:
+            selections.append(_selected_pages(_open_reader(p, files), spec, src))
+    stream = _trackable(stream)
+    start_pos = stream.tell()
+    with metrics.STAGE_SECONDS.time(stage="stream_merge"):
+        total_pages = stream_merge(pdf_paths, selections, stream, enumerate=enumerate, progress=progress)
+    metrics.PAGES.inc(total_pages, stage="stream_merge")
+    metrics.BYTES.inc(stream.tell() - start_pos, stage="stream_merge", direction="out")
+    return total_pages
+
+
+def _validate_inputs(file_paths: List[Path]) -> List[Path]:
+    # Validate every input before converting anything, so a bad path fails fast.
+    sources: List[Path] = []
+    for p in file_paths:
+        p = Path(p).resolve()
+        if not p.exists():
+            raise FileNotFoundError(p)
+        if p.suffix.lower() not in (".docx", ".pdf"):
+            raise ValueError(f"Unsupported format: {p} (use .pdf or .docx)")
+        sources.append(p)
+    if not sources:
+        raise ValueError("No PDF or DOCX files to merge.")
+    return sources
+
+
+def write_merged_pdf(
+    file_paths: List[Path],
+    stream: BinaryIO,
+    enumerate: bool = False,
+    temp_dir: Path | None = None,
+    jobs: int = 1,
+    progress: ProgressCallback | None = None,
+    dedupe: bool = False,
+    page_ranges: List[Optional[str]] | None = None,
+    streaming: bool | None = None,
+    optimize: str | None = None,
+    deadline: Deadline | None = None,
+    linearize: bool = False,
+    backends: List[str] | None = None,
+    limiter: StageLimiter | None = None,
+) -> int:
+    """
+    Single-pass pipeline: convert any .docx, append all pages in order to one PdfWriter
+    (stamping "Pag. n/total" as each page is appended when enumerate is set) and
+    serialize once to `stream`.
+
+    stream: Any binary writable object — a file, a BytesIO, a socket file; it does not
+        need to be seekable.
+    temp_dir: Optional directory for converted .docx files; uses tempfile if not set.
+    progress: Optional progress(stage, done, total) callback, called from the pipeline's
+        threads, with stages "convert" (documents), "merge" (pages) and "write".
+    dedupe: Store resources (fonts, images, form XObjects) that several inputs share
+        only once; the bytes saved are counted in metrics under stage "dedupe".
+    page_ranges: Optional page spec per input file ("1-3,10", "5-"; None or "" for every
+        page). Only the selected pages, and the objects they use, are read and written.
+    streaming: Copy pages object by object straight to `stream` (see streaming_merge),
+        so memory stays bounded however large the inputs are. None (default) streams
+        when the PDFs add up to more than PDF_STREAMING_MIN_MB and neither dedupe nor
+        optimize is set.
+    optimize: Name of a pdf_optimize profile ("screen", "ebook", "print", "lossless")
+        to compress streams, downsample oversized images, drop duplicate and unused
+        objects and pack object streams; sizes before and after are counted in metrics
+        under stage "optimize".
+    deadline: Optional scheduler.Deadline; the pipeline stops with Cancelled or
+        DeadlineExceeded soon after it fires (running conversions are killed).
+    linearize: Write a linearized ("fast web view") file, so a viewer reading byte
+        ranges shows the first page before the rest arrives. Needs pikepdf or qpdf
+        (RuntimeError otherwise); time is counted under stage "linearize".
+    backends: Optional list that receives the name of the backend that converted each
+        .docx (in completion order).
+    limiter: Optional scheduler.StageLimiter shared with other merges in the process;
+        each conversion holds one of its slots, so at most its limit run at once across
+        all of them. Without one, `jobs` alone sets the concurrency.
+
+    Returns the number of pages written.
+    """
+    if linearize:
+        return _write_linearized(
+            file_paths, stream, temp_dir=temp_dir, enumerate=enumerate, jobs=jobs, progress=progress,
+            dedupe=dedupe, page_ranges=page_ranges, streaming=streaming, optimize=optimize, deadline=deadline,
+            backends=backends, limiter=limiter,
+        )
+    sources = _validate_inputs(file_paths)
+    page_ranges = _validate_page_ranges(page_ranges, len(sources))
+    if streaming and dedupe:
+        raise ValueError("Deduplication needs the whole document in memory; it cannot be combined with streaming.")
+    if optimize:
+        from pdf_optimize import get_profile
+
+        get_profile(optimize)
+        if streaming:
+            raise ValueError("Optimization needs the whole document in memory; it cannot be combined with streaming.")
+    use_temp = temp_dir is None
+    if use_temp:
+        temp_dir = Path(tempfile.mkdtemp())
+    else:
+        temp_dir = Path(temp_dir).resolve()
+        temp_dir.mkdir(parents=True, exist_ok=True)
+    progress = checked_progress(progress, deadline)
+
+    files = ExitStack()
+    try:
+        pdf_paths = _convert_inputs(
+            sources, temp_dir, jobs=jobs, progress=progress, deadline=deadline, backends=backends,
+            limiter=limiter,
+        )
+
+        input_bytes = sum(p.stat().st_size for p in pdf_paths)
+        metrics.BYTES.inc(input_bytes, stage="merge", direction="in")
+        if streaming is None:
+            streaming = not dedupe and not optimize and 0 < STREAMING_MIN_MB * 1024 * 1024 < input_bytes
+        if streaming:
+            # stream_merge reports "merge" per page and "write" 0/1 and 1/1, as below.
+            return _stream_merged(pdf_paths, sources, page_ranges, stream, enumerate=enumerate, progress=progress)
+
+        merge_start = time.perf_counter()
+        readers = [_open_reader(p, files) for p in pdf_paths]
+        selections = [_selected_pages(r, spec, p) for r, spec, p in zip(readers, page_ranges, sources)]
+        total_pages = sum(len(indices) for indices in selections)
+
+        writer = PdfWriter()
+        stamper = None
+        stamp_s = 0.0
+        if enumerate:
+            from add_page_numbers import PageNumberStamper
+            stamper = PageNumberStamper(writer)
+
+        page_num = 0
+        for reader, indices in zip(readers, selections):
+            for i in indices:
+                page_num += 1
+                added = writer.add_page(reader.pages[i])
+                if stamper is not None:
+                    t = time.perf_counter()
+                    stamper.stamp(added, page_num, total_pages)
+                    stamp_s += time.perf_counter() - t
+                if progress is not None:
+                    progress("merge", page_num, total_pages)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - merge_start - stamp_s, stage="merge")
+        metrics.PAGES.inc(total_pages, stage="merge")
+        if stamper is not None:
+            metrics.STAGE_SECONDS.observe(stamp_s, stage="number")
+            metrics.PAGES.inc(total_pages, stage="number")
+        if deadline is not None:
+            deadline.check()
+        if dedupe and not optimize:  # optimizing deduplicates anyway
+            _dedupe(writer)
+
+        if progress is not None:
+            progress("write", 0, 1)
+        if optimize:
+            _optimize(writer, stream, optimize, temp_dir, input_bytes)
+        else:
+            stream = _trackable(stream)
+            start_pos = stream.tell()
+            with metrics.STAGE_SECONDS.time(stage="write"):
+                writer.write(stream)
+            metrics.BYTES.inc(stream.tell() - start_pos, stage="write", direction="out")
+        if progress is not None:
+            progress("write", 1, 1)
+        return total_pages
+    finally:
+        files.close()
+        if use_temp and temp_dir.exists():
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _write_linearized(file_paths: List[Path], stream: BinaryIO, temp_dir: Path | None = None, **options) -> int:
+    """write_merged_pdf to a scratch file, then linearize that into `stream`."""
+    from pdf_optimize import can_linearize, linearize_pdf
+
+    if not can_linearize():
+        raise RuntimeError("Linearized output needs pikepdf or the qpdf command; neither is installed.")
+    if temp_dir is not None:
+        Path(temp_dir).mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="linearize-", dir=temp_dir) as tmp:
+        plain, linear = Path(tmp) / "plain.pdf", Path(tmp) / "linear.pdf"
+        with open(plain, "wb") as f:
+            pages = write_merged_pdf(file_paths, f, temp_dir=temp_dir, **options)
+        deadline = options.get("deadline")
+        if deadline is not None:
+            deadline.check()
+        with metrics.STAGE_SECONDS.time(stage="linearize"):
+            if not linearize_pdf(plain, linear):
+                raise RuntimeError("Linearizing the merged PDF failed (qpdf).")
+        metrics.BYTES.inc(plain.stat().st_size, stage="linearize", direction="in")
+        metrics.BYTES.inc(linear.stat().st_size, stage="linearize", direction="out")
+        with open(linear, "rb") as f:
+            shutil.copyfileobj(f, stream, 1024 * 1024)
+    return pages
+
+
 def build_merged_pdf(
     file_paths: List[Path],
     output_path: Path,
     enumerate: bool = False,
     temp_dir: Path | None = None,
+    jobs: int = 1,
+    dedupe: bool = False,
+    page_ranges: List[Optional[str]] | None = None,
+    streaming: bool | None = None,
+    optimize: str | None = None,
+    deadline: Deadline | None = None,
+    linearize: bool = False,
 ) -> Path:
     """
     Main pipeline: convert any .docx to PDF, merge all in order, optionally add page numbers.
 
     file_paths: List of paths to .pdf or .docx files (order preserved).
     output_path: Where to write the final PDF.
-    enumerate: If True, run add_numbered_header on the merged document before saving.
+    enumerate: If True, add "Pag. n/total" to every page while merging.
     temp_dir: Optional directory for intermediate files; uses tempfile if not set.
+    jobs: Number of .docx conversions to run concurrently (page order is unaffected).
+    dedupe: If True, store fonts, images and form XObjects shared by several inputs once.
+    page_ranges: Optional page spec per input, e.g. ["1-3,10", None] (None = all pages).
+    streaming: True for the bounded-memory merge, False for in-memory, None to decide by
+        input size (PDF_STREAMING_MIN_MB).
+    optimize: Optional optimization profile name ("screen", "ebook", "print", "lossless").
+    deadline: Optional scheduler.Deadline bounding the whole run.
+    linearize: If True, write a linearized ("fast web view") PDF (needs pikepdf or qpdf).
 
     Returns the path to the final PDF.
     """
     output_path = Path(output_path).resolve()
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    use_temp = temp_dir is None
-    if use_temp:
-        temp_dir = Path(tempfile.mkdtemp())
-    else:
-        temp_dir = Path(temp_dir).resolve()
-        temp_dir.mkdir(parents=True, exist_ok=True)
+    # Write next to the destination and rename, so a failed run leaves no partial file.
+    fd, tmp = tempfile.mkstemp(dir=output_path.parent, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f, metrics.STAGE_SECONDS.time(stage="build_merged_pdf"):
+            write_merged_pdf(
+                file_paths, f, enumerate=enumerate, temp_dir=temp_dir, jobs=jobs, dedupe=dedupe,
+                page_ranges=page_ranges, streaming=streaming, optimize=optimize,
+                deadline=deadline, linearize=linearize,
+            )
+        os.replace(tmp, output_path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return output_path
+
 
+def preload() -> None:
+    """
+    Import the converter libraries and probe the backends without starting any
+    threads or subprocesses, so a pre-forking server can do it once in the parent.
+    """
+    import reportlab.platypus  # noqa: F401
+    import docx  # noqa: F401
+    import add_page_numbers  # noqa: F401  (registers the header font)
     try:
-        pdf_paths: List[Path] = []
-        for p in file_paths:
-            p = Path(p).resolve()
-            if not p.exists():
-                raise FileNotFoundError(p)
-            if p.suffix.lower() == ".docx":
-                pdf_paths.append(convert_docx_to_pdf(p, output_dir=temp_dir))
-            elif p.suffix.lower() == ".pdf":
-                pdf_paths.append(p)
-            else:
-                raise ValueError(f"Unsupported format: {p} (use .pdf or .docx)")
-
-        if not pdf_paths:
-            raise ValueError("No PDF or DOCX files to merge.")
-
-        merged_path = temp_dir / "merged.pdf"
-        merge_pdfs(pdf_paths, merged_path)
+        import PIL.Image  # noqa: F401
+    except ImportError:
+        pass
+    backend_registry.probe()
 
-        if enumerate:
-            add_numbered_header(merged_path, output_path)
-        else:
-            shutil.copy2(merged_path, output_path)
 
-        return output_path
-    finally:
-        if use_temp and temp_dir.exists():
-            shutil.rmtree(temp_dir, ignore_errors=True)
+def prewarm() -> None:
+    """
+    Pay one-off setup costs before serving traffic: convert a tiny document with every
+    available backend (which also starts a LibreOffice pool worker) and stamp the result.
+    """
+    from docx import Document
+
+    from add_page_numbers import add_numbers_to_pdf
+
+    preload()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        docx_path = tmp / "prewarm.docx"
+        doc = Document()
+        doc.add_heading("Prewarm", 1)
+        doc.add_paragraph("Warm-up document.")
+        doc.save(str(docx_path))
+        converted = None
+        for backend in backend_registry.available():
+            pdf_path = tmp / backend.name / "prewarm.pdf"
+            pdf_path.parent.mkdir()
+            if backend.convert(docx_path, pdf_path):
+                converted = converted or pdf_path
+        if converted is not None:
+            add_numbers_to_pdf(converted, tmp / "numbered.pdf")
@@ -0,0 +1,183 @@
+"""
+Opt-in profiling of a single run: one CLI invocation or one HTTP request.
+
+profiled() wraps the run in cProfile and tracemalloc and writes two files to
+PDF_PROFILE_DIR:
+
+    <time>-<label>-<id>.pstats  cProfile stats (snakeviz, python -m pstats, gprof2dot)
+    <time>-<label>-<id>.txt     stage breakdown (convert / merge / number / write ...),
+                                top functions by cumulative time, top allocation sites
+
+Nothing is hooked unless a profile is requested, so ordinary runs pay nothing. Over
+HTTP a profile is only taken when the request carries PDF_PROFILE_TOKEN (header
+X-Profile or query parameter "profile"); without a token configured it is refused.
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TextIO
+
+import metrics
+
+# ---------- Profiling settings (overridable through the environment) ----------
+PROFILE_DIR = Path(os.environ.get("PDF_PROFILE_DIR", Path(tempfile.gettempdir()) / "pdf-master2-profiles"))
+PROFILE_TOKEN = os.environ.get("PDF_PROFILE_TOKEN", "")  # empty: HTTP requests cannot ask for a profile
+PROFILE_TOP = int(os.environ.get("PDF_PROFILE_TOP", 30))
+# ------------------------------------------------------------------
+
+_lock = threading.Lock()
+_tracing = 0  # profiles currently relying on tracemalloc
+
+
+def allowed(token: str | None) -> bool:
+    """True if `token` matches PDF_PROFILE_TOKEN (never when no token is configured)."""
+    return bool(PROFILE_TOKEN and token) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+@dataclass
+class Profile:
+    label: str
+    stats_path: Path | None = None
+    report_path: Path | None = None
+    seconds: float = 0.0
+    peak_bytes: int = 0
+    stages: dict[str, float] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        lines = [f"Profile of {self.label}: {self.seconds:.3f} s wall, {self.peak_bytes / 2**20:.1f} MB peak traced memory"]
+        lines += [f"  {stage:<20} {seconds:9.3f} s" for stage, seconds in self.stages.items()]
+        lines.append(f"  stats:  {self.stats_path}")
+        lines.append(f"  report: {self.report_path}")
+        return "\n".join(lines)
+
+
+def _start_tracing() -> bool:
+    """Start tracemalloc unless already tracing; True if this call started it."""
+    global _tracing
+    with _lock:
+        _tracing += 1
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start()
+        return True
+
+
+def _stop_tracing(started: bool) -> None:
+    global _tracing
+    with _lock:
+        _tracing -= 1
+        if started and _tracing == 0:
+            tracemalloc.stop()
+
+
+def _stages(observed: list[tuple[dict, float]]) -> dict[str, float]:
+    stages: dict[str, float] = {}
+    for labels, seconds in observed:
+        stage = labels.get("stage", "?")
+        stages[stage] = stages.get(stage, 0.0) + seconds
+    return stages
+
+
+def _allocation_sites(snapshot: tracemalloc.Snapshot, top: int) -> list[str]:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    lines = []
+    for stat in snapshot.statistics("lineno")[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"  {stat.size / 1024:10.1f} KiB  {stat.count:8d} blocks  {frame.filename}:{frame.lineno}")
+    return lines
+
+
+@contextmanager
+def profiled(label: str, out_dir: Path | None = None, threads: bool = False, echo: TextIO | None = None):
+    """
+    Profile the block and write its .pstats and .txt report to out_dir (default
+    PDF_PROFILE_DIR). Yields a Profile whose fields are filled in when the block exits,
+    also when it raises.
+
+    threads: also profile threads started inside the block (e.g. the conversion pool of
+        `-j N`); their stats are merged into the file. Only for single-run processes,
+        since it hooks every thread the process starts meanwhile.
+    echo: stream to print Profile.summary() to when done (e.g. sys.stderr).
+    """
+    out_dir = Path(out_dir or PROFILE_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)[:40]
+    base = out_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{uuid.uuid4().hex[:8]}"
+    result = Profile(label=label)
+
+    thread_profiles: list[cProfile.Profile] = []
+    previous_hook = threading.getprofile()
+    if threads:
+        def _profile_thread(frame, event, arg):
+            sys.setprofile(None)
+            profile = cProfile.Profile()
+            with _lock:
+                thread_profiles.append(profile)
+            profile.enable()
+
+        threading.setprofile(_profile_thread)
+
+    started_tracing = _start_tracing()
+    if started_tracing:
+        tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        with metrics.STAGE_SECONDS.capture() as observed:
+            profiler.enable()
+            try:
+                yield result
+            finally:
+                profiler.disable()
+    finally:
+        result.seconds = time.perf_counter() - start
+        if threads:
+            threading.setprofile(previous_hook)
+        result.peak_bytes = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+        _stop_tracing(started_tracing)
+        result.stages = _stages(observed)
+
+        stats = pstats.Stats(profiler)
+        for profile in thread_profiles:
+            stats.add(profile)
+        result.stats_path = base.with_suffix(".pstats")
+        stats.dump_stats(result.stats_path)
+
+        top_functions = io.StringIO()
+        stats.stream = top_functions
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+        result.report_path = base.with_suffix(".txt")
+        report = [
+            f"Profile of {label}, {time.strftime('%Y-%m-%d %H:%M:%S')}, pid {os.getpid()}",
+            f"Wall time: {result.seconds:.3f} s",
+            f"Peak traced memory: {result.peak_bytes / 2**20:.1f} MB"
+            + ("" if started_tracing else " (tracemalloc was shared with another run; includes its allocations)"),
+            "",
+            "Stages (this run only):",
+            *(f"  {stage:<20} {seconds:9.3f} s" for stage, seconds in result.stages.items()),
+            "",
+            f"Top {PROFILE_TOP} functions by cumulative time:",
+            top_functions.getvalue(),
+            f"Top {PROFILE_TOP} allocation sites still allocated at the end (whole process):",
+            *_allocation_sites(snapshot, PROFILE_TOP),
+            "",
+        ]
+        result.report_path.write_text("\n".join(report), encoding="utf-8")
+        if echo is not None:
+            print(result.summary(), file=echo)
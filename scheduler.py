@@ -0,0 +1,245 @@
+"""
+Admission control, deadlines and cancellation for merge work.
+
+Every request that merges or stamps PDFs first takes a slot on the "request" stage;
+every DOCX conversion the web app runs (requests and jobs) takes one on the "convert"
+stage. Command-line and batch runs do not: their -j alone sets the concurrency. A stage runs at most
+`limit` holders at once and lets at most `max_waiting` more queue up; beyond that
+the caller gets Overloaded with a Retry-After estimate (HTTP 429) instead of adding
+to everyone's latency.
+
+A Deadline travels with one job through every stage: it expires after the job's time
+budget, can be cancelled (client gone, job deleted), and runs registered callbacks
+when either happens — which is how a LibreOffice subprocess gets killed mid-job.
+"""
+
+import math
+import os
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+import metrics
+
+# ---------- Scheduler settings (overridable through the environment) ----------
+MAX_ACTIVE_REQUESTS = int(os.environ.get("ADMIT_MAX_ACTIVE", 4))
+MAX_QUEUED_REQUESTS = int(os.environ.get("ADMIT_MAX_QUEUED", 16))
+MAX_ACTIVE_CONVERSIONS = int(os.environ.get("CONVERT_MAX_ACTIVE", 2))
+DEADLINE_S = float(os.environ.get("MERGE_DEADLINE_S", 600))  # 0 = no deadline
+# ------------------------------------------------------------------
+
+_SERVICE_EWMA_ALPHA = 0.2
+
+
+class Cancelled(RuntimeError):
+    """The job was cancelled (client disconnected or job deleted)."""
+
+
+class DeadlineExceeded(Cancelled):
+    """The job ran out of its time budget."""
+
+
+class Overloaded(RuntimeError):
+    """A stage is full; retry after `retry_after` seconds."""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"Server busy ({stage}); retry in {retry_after} s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """Time budget plus cancellation flag for one job, shared by all of its stages."""
+
+    def __init__(self, seconds: float | None = DEADLINE_S):
+        self.seconds = seconds if seconds and seconds > 0 else None
+        self.expires = time.monotonic() + self.seconds if self.seconds else None
+        self.reason: str | None = None
+        self._event = threading.Event()
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._timer = None
+        if self.seconds:
+            self._timer = threading.Timer(self.seconds, self.cancel, args=("deadline",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Stop the expiry timer (the job is over)."""
+        if self._timer is not None:
+            self._timer.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def remaining(self) -> float | None:
+        """Seconds left, None for no limit."""
+        return None if self.expires is None else max(0.0, self.expires - time.monotonic())
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Cancel the job and run the on_cancel callbacks (once)."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                pass
+
+    def on_cancel(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Call fn on cancellation (now, if already cancelled); returns an unregister function."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return lambda: self._unregister(fn)
+        fn()
+        return lambda: None
+
+    def _unregister(self, fn) -> None:
+        with self._lock:
+            if fn in self._callbacks:
+                self._callbacks.remove(fn)
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded or Cancelled if the job should stop."""
+        if not self._event.is_set():
+            return
+        if self.reason == "deadline":
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g} s exceeded")
+        raise Cancelled(f"Cancelled ({self.reason})")
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to timeout seconds, waking early on cancellation; True if cancelled."""
+        return self._event.wait(timeout)
+
+
+class StageLimiter:
+    """At most `limit` concurrent holders, at most `max_waiting` queued; others are refused."""
+
+    def __init__(self, name: str, limit: int, max_waiting: int | None = None):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.waiting = 0
+        self.service_s = 1.0  # EWMA of how long a slot is held
+        self._cond = threading.Condition()
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a new arrival would get a slot."""
+        with self._cond:
+            return self._retry_after()
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil((self.waiting + 1) * self.service_s / self.limit))
+
+    @contextmanager
+    def slot(self, deadline: Deadline | None = None, queue: bool = False):
+        """
+        Hold one slot for the duration of the block. When all slots are taken and
+        max_waiting callers already wait, raise Overloaded — unless queue is set
+        (background work, which waits instead). Waiting stops with Cancelled or
+        DeadlineExceeded when `deadline` fires.
+        """
+        with self._cond:
+            if self.active >= self.limit and self.max_waiting is not None and not queue \
+                    and self.waiting >= self.max_waiting:
+                metrics.ADMISSIONS.inc(stage=self.name, outcome="rejected")
+                raise Overloaded(self.name, self._retry_after())
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    if deadline is not None and deadline.cancelled:
+                        metrics.ADMISSIONS.inc(stage=self.name, outcome=deadline.reason or "cancelled")
+                        deadline.check()
+                    self._cond.wait(0.25)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+        metrics.ADMISSIONS.inc(stage=self.name, outcome="admitted")
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                elapsed = time.monotonic() - start
+                self.service_s += _SERVICE_EWMA_ALPHA * (elapsed - self.service_s)
+                self._cond.notify()
+
+
+REQUESTS = StageLimiter("request", MAX_ACTIVE_REQUESTS, MAX_QUEUED_REQUESTS)
+CONVERSIONS = StageLimiter("convert", MAX_ACTIVE_CONVERSIONS)
+
+
+def _occupancy() -> dict:
+    return {
+        (("stage", s.name), ("state", state)): value
+        for s in (REQUESTS, CONVERSIONS)
+        for state, value in (("active", s.active), ("waiting", s.waiting))
+    }
+
+
+metrics.CallbackGauge("pdf_stage_slots", "Slots held (active) and callers queued (waiting) per stage", _occupancy)
+
+
+def checked_progress(progress, deadline: Deadline | None):
+    """Wrap a progress(stage, done, total) callback so every report also checks `deadline`."""
+    if deadline is None:
+        return progress
+
+    def _progress(stage: str, done: int, total: int) -> None:
+        deadline.check()
+        if progress is not None:
+            progress(stage, done, total)
+
+    return _progress
+
+
+def _peer_closed(sock) -> bool:
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+@contextmanager
+def cancel_on_disconnect(environ: dict, deadline: Deadline, interval: float = 0.5):
+    """
+    While the block runs, cancel `deadline` if the HTTP client closes its connection.
+    Needs the raw socket from the server (gunicorn or the Werkzeug dev server);
+    elsewhere only the deadline applies. Use it after the request body has been read.
+    """
+    sock = environ.get("gunicorn.socket") or environ.get("werkzeug.socket")
+    if sock is None:
+        yield
+        return
+    stop = threading.Event()
+
+    def _watch():
+        while not stop.wait(interval):
+            if _peer_closed(sock):
+                deadline.cancel("client disconnected")
+                return
+
+    watcher = threading.Thread(target=_watch, name="disconnect-watch", daemon=True)
+    watcher.start()
+    try:
+        yield
+    finally:
+        stop.set()
@@ -0,0 +1,353 @@
+"""
+Pool of long-lived headless LibreOffice workers for DOCX → PDF conversion.
+
+Each worker owns an isolated user profile, so concurrent conversions never share
+(and corrupt) the default LibreOffice profile. Workers are started lazily, reused
+across jobs, restarted after MAX_JOBS_PER_WORKER conversions or a crash, and every
+job is bounded by a timeout that kills the worker if it hangs.
+
+Workers are only warm when the LibreOffice Python bindings (`uno`, package
+python3-uno) are importable: a worker is then a single soffice process listening
+on a local socket, and documents are converted through it without any process
+startup. Without them the pool degrades to cold starts: every job runs its own
+`soffice --convert-to` process, and only the first-run profile creation is saved.
+`SofficePool.mode` tells which of the two is in use.
+"""
+
+import atexit
+import os
+import queue
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# ---------- Pool settings (overridable through the environment) ----------
+POOL_SIZE = int(os.environ.get("SOFFICE_POOL_SIZE", 2))
+MAX_JOBS_PER_WORKER = int(os.environ.get("SOFFICE_MAX_JOBS", 50))
+JOB_TIMEOUT_S = float(os.environ.get("SOFFICE_TIMEOUT", 300))
+START_TIMEOUT_S = float(os.environ.get("SOFFICE_START_TIMEOUT", 60))
+# ------------------------------------------------------------------
+
+
+class SofficeError(RuntimeError):
+    """A LibreOffice worker failed to start or to convert a document."""
+
+
+def find_soffice() -> str | None:
+    """Return the path to the soffice binary, or None if LibreOffice is not installed."""
+    soffice = shutil.which("soffice") or shutil.which("libreoffice")
+    if not soffice and Path("/Applications/LibreOffice.app").exists():
+        soffice = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+    if not soffice or not Path(soffice).exists():
+        return None
+    return soffice
+
+
+def _uno_available() -> bool:
+    try:
+        import uno  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _kill_tree(proc: subprocess.Popen) -> None:
+    """Kill proc and its children: `soffice` is usually a wrapper around soffice.bin."""
+    if proc.poll() is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)  # started with start_new_session=True
+    except (AttributeError, OSError):
+        proc.kill()
+
+
+class SofficeWorker:
+    """One LibreOffice instance with its own profile directory."""
+
+    def __init__(self, soffice: str, use_uno: bool):
+        self.soffice = soffice
+        self.use_uno = use_uno
+        self.profile_dir = Path(tempfile.mkdtemp(prefix="soffice-profile-"))
+        self.jobs = 0
+        self._proc: subprocess.Popen | None = None
+        self._desktop = None
+        self._timed_out = False
+
+    def _base_args(self) -> list[str]:
+        return [
+            self.soffice,
+            f"-env:UserInstallation={self.profile_dir.as_uri()}",
+            "--headless", "--invisible", "--nologo", "--nodefault",
+            "--norestore", "--nolockcheck",
+        ]
+
+    def start(self) -> None:
+        if not self.use_uno:
+            # Create the profile once; every --convert-to run still starts LibreOffice.
+            try:
+                subprocess.run(
+                    self._base_args() + ["--terminate_after_init"],
+                    check=True, capture_output=True, timeout=START_TIMEOUT_S,
+                )
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+                raise SofficeError(f"Could not initialise LibreOffice profile: {e}") from e
+            return
+
+        import uno
+
+        port = _free_port()
+        accept = f"--accept=socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext"
+        try:
+            self._proc = subprocess.Popen(
+                self._base_args() + [accept],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        except OSError as e:
+            raise SofficeError(f"Could not start LibreOffice: {e}") from e
+
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local
+        )
+        url = f"uno:socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext"
+        deadline = time.monotonic() + START_TIMEOUT_S
+        while True:
+            if self._proc.poll() is not None:
+                raise SofficeError("LibreOffice exited during startup")
+            try:
+                ctx = resolver.resolve(url)
+                break
+            except Exception:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise SofficeError("Timed out waiting for LibreOffice to accept connections")
+                time.sleep(0.25)
+        self._desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+    def healthy(self) -> bool:
+        if not self.profile_dir.exists():
+            return False
+        if not self.use_uno:
+            return True
+        if self._proc is None or self._proc.poll() is not None or self._desktop is None:
+            return False
+        try:
+            self._desktop.getComponents()
+            return True
+        except Exception:
+            return False
+
+    def kill(self) -> None:
+        self._timed_out = True
+        if self._proc is not None:
+            _kill_tree(self._proc)
+
+    def convert(self, docx_path: Path, out_dir: Path, timeout: float, cancel=None) -> Path:
+        """cancel: optional token with on_cancel(fn) (a scheduler.Deadline); cancelling kills soffice."""
+        pdf_path = out_dir / f"{docx_path.stem}.pdf"
+        self.jobs += 1
+        if not self.use_uno:
+            try:
+                proc = subprocess.Popen(
+                    self._base_args() + ["--convert-to", "pdf", "--outdir", str(out_dir), str(docx_path)],
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    start_new_session=True,
+                )
+            except OSError as e:
+                raise SofficeError(f"LibreOffice conversion failed: {e}") from e
+            unregister = cancel.on_cancel(lambda: _kill_tree(proc)) if cancel is not None else None
+            try:
+                _, stderr = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired as e:
+                _kill_tree(proc)
+                proc.communicate()
+                raise TimeoutError(f"LibreOffice conversion timed out after {timeout:.0f}s") from e
+            finally:
+                if unregister is not None:
+                    unregister()
+            if proc.returncode != 0:
+                raise SofficeError(f"LibreOffice conversion failed (exit {proc.returncode}): {stderr[-500:]!r}")
+            return pdf_path
+
+        import uno
+        from com.sun.star.beans import PropertyValue
+
+        def _prop(name, value):
+            p = PropertyValue()
+            p.Name, p.Value = name, value
+            return p
+
+        self._timed_out = False
+        watchdog = threading.Timer(timeout, self.kill)
+        watchdog.start()
+        unregister = cancel.on_cancel(self.kill) if cancel is not None else None
+        try:
+            doc = self._desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(str(docx_path)), "_blank", 0,
+                (_prop("Hidden", True), _prop("ReadOnly", True)),
+            )
+            if doc is None:
+                raise SofficeError(f"LibreOffice could not open {docx_path.name}")
+            try:
+                doc.storeToURL(
+                    uno.systemPathToFileUrl(str(pdf_path)),
+                    (_prop("FilterName", "writer_pdf_Export"),),
+                )
+            finally:
+                doc.close(True)
+        except SofficeError:
+            raise
+        except Exception as e:
+            if self._timed_out:
+                raise TimeoutError(f"LibreOffice conversion timed out after {timeout:.0f}s") from e
+            raise SofficeError(f"LibreOffice conversion failed: {e}") from e
+        finally:
+            watchdog.cancel()
+            if unregister is not None:
+                unregister()
+        return pdf_path
+
+    def stop(self) -> None:
+        if self._desktop is not None:
+            try:
+                self._desktop.terminate()
+            except Exception:
+                pass
+            self._desktop = None
+        if self._proc is not None:
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                _kill_tree(self._proc)
+                self._proc.wait()
+            self._proc = None
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class SofficePool:
+    """Bounded pool of SofficeWorker instances, shared by all conversions in the process."""
+
+    def __init__(
+        self,
+        size: int = POOL_SIZE,
+        max_jobs: int = MAX_JOBS_PER_WORKER,
+        timeout: float = JOB_TIMEOUT_S,
+        soffice: str | None = None,
+    ):
+        self.size = max(1, size)
+        self.max_jobs = max(1, max_jobs)
+        self.timeout = timeout
+        self.soffice = soffice or find_soffice()
+        self.use_uno = _uno_available()
+        self.mode = "uno" if self.use_uno else "cold-start"
+        self._idle: queue.LifoQueue[SofficeWorker] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def available(self) -> bool:
+        return self.soffice is not None and not self._closed
+
+    def _acquire(self, timeout: float) -> SofficeWorker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    spawn = self._created < self.size
+                    if spawn:
+                        self._created += 1
+                if not spawn:
+                    worker = self._idle.get(timeout=timeout)
+                else:
+                    worker = SofficeWorker(self.soffice, self.use_uno)
+                    try:
+                        worker.start()
+                    except Exception:
+                        self._discard(worker)
+                        raise
+                    return worker
+            if worker.healthy():
+                return worker
+            self._discard(worker)
+
+    def _release(self, worker: SofficeWorker) -> None:
+        if self._closed or worker.jobs >= self.max_jobs or not worker.healthy():
+            self._discard(worker)
+        else:
+            self._idle.put(worker)
+
+    def _discard(self, worker: SofficeWorker) -> None:
+        worker.stop()
+        with self._lock:
+            self._created -= 1
+
+    def convert(self, docx_path: Path, out_dir: Path, timeout: float | None = None, cancel=None) -> Path:
+        """
+        Convert docx_path into out_dir/<stem>.pdf on a pooled worker and return the PDF path.
+        timeout: at most this many seconds (capped at the pool's timeout), waiting included.
+        cancel: optional token with on_cancel(fn); cancelling kills the worker's soffice.
+        """
+        if not self.available():
+            raise SofficeError("LibreOffice is not installed")
+        docx_path = Path(docx_path).resolve()
+        out_dir = Path(out_dir).resolve()
+        deadline = time.monotonic() + (self.timeout if timeout is None else min(timeout, self.timeout))
+        try:
+            worker = self._acquire(max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            raise TimeoutError("Timed out waiting for a free LibreOffice worker") from None
+        try:
+            pdf_path = worker.convert(docx_path, out_dir, max(0.0, deadline - time.monotonic()), cancel)
+        except BaseException:
+            self._discard(worker)
+            raise
+        self._release(worker)
+        return pdf_path
+
+    def shutdown(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(worker)
+
+
+_pool: SofficePool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SofficePool:
+    """Return the process-wide pool, creating it on first use (and again after a fork)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = SofficePool()
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
+
+
+atexit.register(shutdown_pool)
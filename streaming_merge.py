@@ -0,0 +1,262 @@
+"""
+Bounded-memory merge for very large inputs.
+
+write_merged_pdf normally copies every page into one PdfWriter and serializes the
+whole object graph at the end, so memory grows with the total input size. stream_merge()
+instead maps each input with mmap and copies the selected pages object by object
+straight to the output: an object is written as soon as the first page that uses it is,
+and then forgotten. What stays in memory is an object-number map per input, the
+output's xref offsets and at most MAX_CACHED_OBJECTS parsed objects per reader. The
+page tree, catalog and cross-reference table are written at the end.
+"""
+
+import mmap
+import os
+from array import array
+from contextlib import ExitStack
+from pathlib import Path
+from typing import BinaryIO, Callable, List
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+)
+
+# ---------- Streaming merge settings (overridable through the environment) ----------
+MAX_CACHED_OBJECTS = int(os.environ.get("STREAM_MERGE_MAX_OBJECTS", 2000))
+# ------------------------------------------------------------------
+
+# Reached through links and form fields; copying them would drag in every page.
+_TREE_TYPES = ("/Pages", "/Catalog")
+
+
+class _OutputFile:
+    """Writes numbered objects to a stream, remembering offsets for the xref table."""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.start = stream.tell()
+        self.offsets = array("q", [0])  # offsets[num]; entry 0 is the head of the free list
+        stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def reserve(self) -> int:
+        self.offsets.append(0)
+        return len(self.offsets) - 1
+
+    def write(self, num: int, obj) -> None:
+        self.offsets[num] = self.stream.tell() - self.start
+        self.stream.write(b"%d 0 obj\n" % num)
+        obj.write_to_stream(self.stream)
+        self.stream.write(b"\nendobj\n")
+
+    def finish(self, root: int, info: int) -> None:
+        xref = self.stream.tell() - self.start
+        self.stream.write(b"xref\n0 %d\n0000000000 65535 f \n" % len(self.offsets))
+        for i in range(1, len(self.offsets), 4096):
+            self.stream.write(b"".join(b"%010d 00000 n \n" % off for off in self.offsets[i:i + 4096]))
+        self.stream.write(
+            b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(self.offsets), root, info, xref)
+        )
+
+
+class _Copier:
+    """Copies the objects reachable from one source's pages into the output, once each."""
+
+    def __init__(self, out: _OutputFile, page_numbers: dict[int, int], all_pages: set[int]):
+        self.out = out
+        self.page_numbers = page_numbers  # source page idnum -> output object number
+        self.all_pages = all_pages
+        self.numbers: dict[tuple[int, int], int] = {}
+        self.pending: list[tuple[int, IndirectObject]] = []
+
+    def ref(self, ref: IndirectObject):
+        if ref.idnum in self.page_numbers:
+            return IndirectObject(self.page_numbers[ref.idnum], 0, None)
+        if ref.idnum in self.all_pages:
+            return NullObject()  # a link to a page that is not part of the output
+        key = (ref.idnum, ref.generation)
+        num = self.numbers.get(key)
+        if num is None:
+            num = self.numbers[key] = self.out.reserve()
+            self.pending.append((num, ref))
+        return IndirectObject(num, 0, None)
+
+    def rewrite(self, obj, skip: tuple = ()):
+        """Copy of a direct object with every reference renumbered for the output."""
+        if isinstance(obj, IndirectObject):
+            return self.ref(obj)
+        if isinstance(obj, StreamObject):
+            copy = StreamObject()
+            copy._data = obj._data  # still encoded: filters are copied along with it
+            for key, value in dict.items(obj):
+                if key != "/Length":
+                    dict.__setitem__(copy, key, self.rewrite(value))
+            return copy
+        if isinstance(obj, DictionaryObject):
+            copy = DictionaryObject()
+            for key, value in dict.items(obj):
+                if key not in skip:
+                    dict.__setitem__(copy, key, self.rewrite(value))
+            return copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.rewrite(value) for value in obj)
+        return obj
+
+    def flush(self, cache: dict | None = None) -> None:
+        """Write every object referenced so far; streams are dropped from `cache` once written."""
+        while self.pending:
+            num, ref = self.pending.pop()
+            obj = ref.get_object()
+            if obj is None or (isinstance(obj, DictionaryObject) and obj.get("/Type") in _TREE_TYPES):
+                obj = NullObject()
+            self.out.write(num, self.rewrite(obj))
+            if cache is not None and isinstance(obj, StreamObject):
+                cache.pop((ref.generation, ref.idnum), None)
+
+
+def _open(path: Path, files: ExitStack) -> tuple[PdfReader, mmap.mmap | None]:
+    f = files.enter_context(open(path, "rb"))
+    if os.fstat(f.fileno()).st_size == 0:
+        return PdfReader(f), None  # mmap cannot map an empty file; let pypdf report it
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    files.callback(mm.close)
+    return PdfReader(mm), mm
+
+
+def _release(reader: PdfReader, mm: mmap.mmap | None) -> None:
+    # Parsed objects are re-read from the map on demand; mapped pages already copied
+    # are handed back to the page cache so they do not count against this process.
+    if len(reader.resolved_objects) > MAX_CACHED_OBJECTS:
+        reader.resolved_objects.clear()
+    if mm is not None and hasattr(mmap, "MADV_DONTNEED"):
+        mm.madvise(mmap.MADV_DONTNEED)
+
+
+def stream_merge(
+    pdf_paths: List[Path],
+    selections: List[List[int]],
+    stream: BinaryIO,
+    enumerate: bool = False,
+    progress: Callable[[str, int, int], None] | None = None,
+) -> int:
+    """
+    Write the pages `selections[i]` (0-based indices) of every `pdf_paths[i]`, in order,
+    to `stream` as one PDF. `stream` needs write() and tell() only.
+
+    enumerate stamps "Pag. n/total" on every page, as PageNumberStamper does.
+    progress(stage, done, total) is called with "merge" per page and "write" at the end.
+    Returns the number of pages written.
+    """
+    total = sum(len(indices) for indices in selections)
+    out = _OutputFile(stream)
+    pages_num = out.reserve()
+    kids = array("q")
+
+    header = None
+    if enumerate:
+        from add_page_numbers import PageNumberStamper
+
+        # Build the shared header objects in a scratch writer and copy them out once.
+        stamper = PageNumberStamper(PdfWriter())
+        shared = _Copier(out, {}, set())
+        header = (stamper, shared.ref(stamper.font_ref), shared.ref(stamper.push_ref), shared.ref(stamper.pop_ref))
+        shared.flush()
+
+    page_num = 0
+    for path, indices in zip(pdf_paths, selections):
+        if not indices:
+            continue
+        with ExitStack() as files:
+            reader, mm = _open(path, files)
+            pages = reader.pages
+            page_numbers: dict[int, int] = {}
+            for i in indices:  # one number per page; a page selected twice gets more below
+                idnum = pages[i].indirect_reference.idnum
+                if idnum not in page_numbers:
+                    page_numbers[idnum] = out.reserve()
+            all_pages = {page.indirect_reference.idnum for page in pages}
+            _release(reader, mm)  # drop what opening the file (xref checks) mapped in
+            copier = _Copier(out, page_numbers, all_pages)
+            written = set()
+            for i in indices:
+                page_num += 1
+                page = pages[i]
+                num = page_numbers[page.indirect_reference.idnum]
+                if num in written:
+                    # The same page selected twice: the second copy needs its own object.
+                    num = out.reserve()
+                written.add(num)
+                if header is None:
+                    copy = copier.rewrite(page, skip=("/Parent",))
+                else:
+                    copy = _stamped(copier, out, page, header, page_num, total)
+                copy[NameObject("/Parent")] = IndirectObject(pages_num, 0, None)
+                out.write(num, copy)
+                kids.append(num)
+                copier.flush(reader.resolved_objects)
+                _release(reader, mm)
+                if progress is not None:
+                    progress("merge", page_num, total)
+
+    if progress is not None:
+        progress("write", 0, 1)
+    out.write(pages_num, DictionaryObject({
+        NameObject("/Type"): NameObject("/Pages"),
+        NameObject("/Count"): NumberObject(len(kids)),
+        NameObject("/Kids"): ArrayObject(IndirectObject(num, 0, None) for num in kids),
+    }))
+    root = out.reserve()
+    out.write(root, DictionaryObject({
+        NameObject("/Type"): NameObject("/Catalog"),
+        NameObject("/Pages"): IndirectObject(pages_num, 0, None),
+    }))
+    info = out.reserve()
+    out.write(info, DictionaryObject({NameObject("/Producer"): TextStringObject("pypdf")}))
+    out.finish(root, info)
+    if progress is not None:
+        progress("write", 1, 1)
+    return total
+
+
+def _stamped(copier: _Copier, out: _OutputFile, page, header, current: int, total: int) -> DictionaryObject:
+    """Copy of `page` with the "Pag. n/total" header appended to its content."""
+    stamper, font_ref, push_ref, pop_ref = header
+    copy = copier.rewrite(page, skip=("/Parent", "/Resources", "/Contents"))
+
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else DictionaryObject()
+    resources_copy = copier.rewrite(resources, skip=("/Font",))
+    fonts = resources.get("/Font")
+    fonts_copy = copier.rewrite(fonts.get_object()) if fonts is not None else DictionaryObject()
+    fonts_copy[stamper.FONT_KEY] = font_ref
+    resources_copy[NameObject("/Font")] = fonts_copy
+    copy[NameObject("/Resources")] = resources_copy
+
+    parts = []
+    if "/Contents" in page:
+        contents = page.raw_get("/Contents")
+        resolved = contents.get_object()
+        if isinstance(resolved, ArrayObject):
+            parts = [copier.rewrite(part) for part in resolved]
+        elif isinstance(contents, IndirectObject):
+            parts = [copier.ref(contents)]
+        else:
+            num = out.reserve()
+            out.write(num, copier.rewrite(resolved))
+            parts = [IndirectObject(num, 0, None)]
+    mediabox = page.mediabox
+    text = DecodedStreamObject()
+    text.set_data(stamper.content(float(mediabox.width), float(mediabox.height), current, total))
+    text_num = out.reserve()
+    out.write(text_num, text)
+    copy[NameObject("/Contents")] = ArrayObject([push_ref, *parts, pop_ref, IndirectObject(text_num, 0, None)])
+    return copy
@@ -1,5 +1,8 @@
 """
 Streamlit UI: upload/select files in order, toggle Enumerate, run merge pipeline.
+
+Results go to the shared merge result cache; a session only remembers the cache key,
+so reruns and repeated clicks neither merge again nor keep PDF bytes per session.
 """
 
 import tempfile
@@ -7,7 +10,9 @@ from pathlib import Path
 
 import streamlit as st
 
-from pdf_pipeline import build_merged_pdf
+from merge_cache import cached_result, merge_cached
+from pdf_optimize import can_linearize
+from scheduler import CONVERSIONS
 
 st.set_page_config(page_title="PDF Merger", page_icon="📄", layout="centered")
 
@@ -33,6 +38,15 @@ for i, name in enumerate(names):
 
 # Enumerate toggle
 enumerate_pages = st.checkbox("Add page numbers (Pag. n/total) in header", value=True)
+dedupe = st.checkbox("Store fonts and images shared by several files only once (smaller PDF)", value=False)
+optimize = st.selectbox(
+    "Optimize output size",
+    ["off", "lossless", "print", "ebook", "screen"],
+    help="Compress streams, drop unused objects and downsample images to the profile's resolution",
+)
+linearize = can_linearize() and st.checkbox(
+    "Fast web view (first page shows before the whole file has downloaded)", value=False
+)
 
 # Output filename
 output_name = st.text_input("Output filename", value="merged_output.pdf")
@@ -43,24 +57,35 @@ if st.button("Merge and download"):
     with tempfile.TemporaryDirectory() as tmp:
         tmp = Path(tmp)
         paths = []
-        for f in uploaded:
-            p = tmp / f.name
+        for i, f in enumerate(uploaded):
+            # One numbered folder per upload, so repeated names don't overwrite each other.
+            (tmp / f"{i:04d}").mkdir()
+            p = tmp / f"{i:04d}" / Path(f.name).name
             p.write_bytes(f.getvalue())
             paths.append(p)
-        out_path = tmp / output_name.strip()
         try:
-            build_merged_pdf(paths, out_path, enumerate=enumerate_pages, temp_dir=tmp)
-            if out_path.exists():
-                st.session_state["merged_pdf_bytes"] = out_path.read_bytes()
-                st.session_state["merged_pdf_name"] = output_name.strip()
-                st.rerun()
+            key, merged = merge_cached(paths, tmp, enumerate=enumerate_pages, dedupe=dedupe,
+                                       optimize=None if optimize == "off" else optimize,
+                                       linearize=linearize, limiter=CONVERSIONS)
+            st.session_state["merged_pdf_key"] = key
+            # An uncached result (cache disabled, or a fallback converter was used) has to stay here.
+            st.session_state["merged_pdf_bytes"] = None if key is not None else merged.read_bytes()
+            st.session_state["merged_pdf_name"] = output_name.strip()
+            st.rerun()
         except Exception as e:
             st.error(str(e))
 
-if st.session_state.get("merged_pdf_bytes"):
-    st.download_button(
-        label="Download merged PDF",
-        data=st.session_state["merged_pdf_bytes"],
-        file_name=st.session_state.get("merged_pdf_name", "merged_output.pdf"),
-        mime="application/pdf",
-    )
+if st.session_state.get("merged_pdf_key") or st.session_state.get("merged_pdf_bytes"):
+    data = st.session_state.get("merged_pdf_bytes")
+    result = cached_result(st.session_state["merged_pdf_key"]) if data is None else None
+    if data is None and result is None:
+        st.warning("The merged PDF is no longer cached. Click \"Merge and download\" again.")
+    else:
+        if data is None:
+            data = result.read_bytes()
+        st.download_button(
+            label="Download merged PDF",
+            data=data,
+            file_name=st.session_state.get("merged_pdf_name", "merged_output.pdf"),
+            mime="application/pdf",
+        )
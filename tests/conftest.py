@@ -0,0 +1,36 @@
+"""
+Shared test setup: the top-level modules are importable, and every on-disk store the
+app keeps (conversion and result caches, upload blobs, jobs, profiles) lives in a
+temporary directory instead of the system temp dir.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Read at import time by the modules under test, so set before any of them is imported.
+_STATE = Path(tempfile.mkdtemp(prefix="pdf-tests-"))
+for _var, _sub in (
+    ("PDF_CACHE_DIR", "cache"),
+    ("UPLOAD_BLOB_DIR", "blobs"),
+    ("MERGE_JOBS_DIR", "jobs"),
+    ("PDF_PROFILE_DIR", "profiles"),
+):
+    os.environ[_var] = str(_STATE / _sub)
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """make_pdf(name, pages) writes a small text PDF into tmp_path and returns its path."""
+    from benchmark import make_text_pdf
+
+    def _make(name: str = "doc.pdf", pages: int = 3) -> Path:
+        return make_text_pdf(tmp_path / name, pages)
+
+    return _make
@@ -0,0 +1,54 @@
+import io
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import A4, landscape, letter
+from reportlab.pdfgen import canvas
+
+from add_page_numbers import PageNumberStamper, create_page_number_overlay
+
+
+def _blank(size) -> PdfReader:
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=size)
+    c.drawString(72, 72, "body")
+    c.showPage()
+    c.save()
+    return PdfReader(io.BytesIO(buffer.getvalue()))
+
+
+def _header(page) -> tuple[str, float, float, float]:
+    """(text, x, y, font size) of the "Pag." string as drawn on the page."""
+    found = []
+
+    def visit(text, cm, tm, font, size):
+        if text.startswith("Pag."):
+            x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+            y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+            found.append((text.strip(), round(x, 2), round(y, 2), round(size * tm[0] * cm[0], 2)))
+
+    page.extract_text(visitor_text=visit)
+    assert len(found) == 1, found
+    return found[0]
+
+
+@pytest.mark.parametrize("size", [A4, letter, landscape(A4)], ids=["a4", "letter", "landscape"])
+def test_stamper_draws_what_the_overlay_draws(size):
+    width, height = size
+
+    overlaid = PdfWriter()
+    page = overlaid.add_page(_blank(size).pages[0])
+    page.merge_page(PdfReader(io.BytesIO(create_page_number_overlay(width, height, 3, 12))).pages[0])
+
+    stamped = PdfWriter()
+    page = stamped.add_page(_blank(size).pages[0])
+    PageNumberStamper(stamped).stamp(page, 3, 12)
+
+    pages = []
+    for writer in (overlaid, stamped):
+        out = io.BytesIO()
+        writer.write(out)
+        pages.append(PdfReader(out).pages[0])
+    assert _header(pages[1]) == _header(pages[0])
+    assert _header(pages[1])[0] == "Pag. 3/12"
+    assert "body" in pages[1].extract_text()
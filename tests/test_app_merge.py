@@ -0,0 +1,66 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+from werkzeug.wsgi import FileWrapper
+
+import app as app_module
+from scheduler import Cancelled
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def _merge(client, *paths, **form):
+    data = {"files": [(open(p, "rb"), p.name) for p in paths], **form}
+    return client.post("/merge", data=data, content_type="multipart/form-data")
+
+
+def test_page_ranges_select_pages(client, make_pdf):
+    a, b = make_pdf("a.pdf", 3), make_pdf("b.pdf", 4)
+    response = _merge(client, a, b, pages=["2-3", ""])
+    assert response.status_code == 200
+    assert len(PdfReader(io.BytesIO(response.data)).pages) == 2 + 4
+
+
+def test_page_range_past_the_end_is_a_client_error(client, make_pdf):
+    a, b = make_pdf("a.pdf", 3), make_pdf("b.pdf", 2)
+    response = _merge(client, a, b, pages=["9", ""])
+    assert response.status_code == 400
+    assert b"outside pages 1-3" in response.data
+
+
+@pytest.mark.parametrize("pages", [["1-x", ""], ["1"]])
+def test_malformed_page_ranges_are_rejected(client, make_pdf, pages):
+    a, b = make_pdf("a.pdf", 3), make_pdf("b.pdf", 2)
+    assert _merge(client, a, b, pages=pages).status_code == 400
+
+
+def test_result_file_goes_to_the_server_and_its_close_cleans_up(client, make_pdf):
+    wrapped = []
+
+    def file_wrapper(file, block_size=8192):
+        wrapped.append(file)
+        return FileWrapper(file, block_size)
+
+    a, b = make_pdf("a.pdf", 3), make_pdf("b.pdf", 2)
+    data = {"files": [(open(p, "rb"), p.name) for p in (a, b)]}
+    response = client.post("/merge", data=data, content_type="multipart/form-data",
+                           environ_base={"wsgi.file_wrapper": file_wrapper}, buffered=False)
+    [file] = wrapped
+    assert file.fileno() >= 0 and file.tmp_dir.exists()  # still open while being sent
+    body = response.get_data()
+    response.close()
+    assert int(response.headers["Content-Length"]) == len(body)
+    assert len(PdfReader(io.BytesIO(body)).pages) == 5
+    assert file.closed and not file.tmp_dir.exists()
+
+
+def test_cancelled_merge_answers_with_a_standard_status(client, make_pdf, monkeypatch):
+    def cancelled(*args, **kwargs):
+        raise Cancelled("Cancelled (disconnected)")
+
+    monkeypatch.setattr(app_module, "merge_cached", cancelled)
+    assert _merge(client, make_pdf("a.pdf", 1), make_pdf("b.pdf", 1)).status_code == 503
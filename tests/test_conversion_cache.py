@@ -0,0 +1,68 @@
+import pytest
+from docx import Document
+
+import pdf_pipeline
+from converter_registry import BackendRegistry
+from disk_cache import DiskCache
+
+
+@pytest.fixture
+def docx_path(tmp_path):
+    path = tmp_path / "letter.docx"
+    doc = Document()
+    doc.add_paragraph("Dear reader")
+    doc.save(path)
+    return path
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    """Two fake backends, "best" and "fallback", that write a PDF naming themselves."""
+    calls = []
+
+    def backend(name, works):
+        def convert(docx, pdf, deadline=None):
+            calls.append(name)
+            if works[name]:
+                pdf.write_bytes(f"%PDF-1.4 {name}".encode())
+            return works[name]
+        return convert
+
+    works = {"best": True, "fallback": True}
+    registry = BackendRegistry()
+    registry.register("best", backend("best", works), lambda: True)
+    registry.register("fallback", backend("fallback", works), lambda: True)
+    monkeypatch.setattr(pdf_pipeline, "backend_registry", registry)
+    monkeypatch.setattr(pdf_pipeline, "_conversion_cache", DiskCache(tmp_path / "cache", 10 * 1024 * 1024))
+    registry.works, registry.calls = works, calls
+    return registry
+
+
+def test_hit_skips_the_converters(registry, docx_path, tmp_path):
+    first = pdf_pipeline.convert_docx_to_pdf(docx_path, tmp_path / "a")
+    second = pdf_pipeline.convert_docx_to_pdf(docx_path, tmp_path / "b")
+    assert registry.calls == ["best"]
+    assert first.read_bytes() == second.read_bytes()
+    assert pdf_pipeline.conversion_cache().stats()["hits"] == 1
+
+
+def test_fallback_result_is_not_served_once_the_best_backend_is_back(registry, docx_path, tmp_path):
+    registry.works["best"] = False
+    out = pdf_pipeline.convert_docx_to_pdf(docx_path, tmp_path / "a")
+    assert out.read_bytes().endswith(b"fallback")
+    # "best" failed where "fallback" worked, so it cools down and the fallback's entry is served.
+    pdf_pipeline.convert_docx_to_pdf(docx_path, tmp_path / "b")
+    assert registry.calls == ["best", "fallback"]
+
+    registry.works["best"] = True
+    for backend in registry.backends():
+        backend.cooldown_until = 0.0
+    out = pdf_pipeline.convert_docx_to_pdf(docx_path, tmp_path / "c")
+    assert out.read_bytes().endswith(b"best")
+    assert registry.calls == ["best", "fallback", "best"]
+
+
+def test_keys_carry_backend_and_version(registry, docx_path, tmp_path):
+    pdf_pipeline.convert_docx_to_pdf(docx_path, tmp_path / "a")
+    (entry,) = (tmp_path / "cache").glob("*/*.pdf")
+    assert entry.stem.endswith(f"-best-v{pdf_pipeline._CONVERSION_KEY_VERSION}")
@@ -0,0 +1,71 @@
+from converter_registry import BackendRegistry, DocxProfile
+
+MB = 1024 * 1024
+SIMPLE = DocxProfile(size=100 * 1024, images=0, tables=0)
+COMPLEX = DocxProfile(size=100 * 1024, images=2, tables=1)
+
+
+def _registry(*names, fast=()):
+    registry = BackendRegistry()
+    for name in names:
+        registry.register(name, lambda *a: True, lambda: True, fast=name in fast)
+    return registry
+
+
+def _names(plan):
+    return [b.name for b in plan]
+
+
+def _measure(registry, **s_per_mb):
+    for backend in registry.backends():
+        if backend.name in s_per_mb:
+            registry.record(backend, True, s_per_mb[backend.name], MB)
+
+
+def test_quality_order_without_fast_path_or_budget():
+    registry = _registry("soffice", "mammoth", "reportlab", fast={"reportlab"})
+    _measure(registry, soffice=5.0, mammoth=1.0, reportlab=0.2)
+    assert _names(registry.plan(SIMPLE, fast_path=False)) == ["soffice", "mammoth", "reportlab"]
+
+
+def test_fast_path_orders_simple_documents_by_observed_latency():
+    registry = _registry("soffice", "mammoth", "reportlab", fast={"reportlab"})
+    _measure(registry, soffice=5.0, mammoth=0.1, reportlab=0.2)
+    assert _names(registry.plan(SIMPLE, fast_path=True)) == ["mammoth", "reportlab", "soffice"]
+    # Documents with images or tables keep the quality order.
+    assert _names(registry.plan(COMPLEX, fast_path=True)) == ["soffice", "mammoth", "reportlab"]
+
+
+def test_unmeasured_backends_are_tried_first_on_the_fast_path():
+    registry = _registry("soffice", "reportlab", fast={"reportlab"})
+    _measure(registry, reportlab=0.2)
+    assert _names(registry.plan(SIMPLE, fast_path=True)) == ["soffice", "reportlab"]
+
+
+def test_budget_demotes_backends_predicted_to_overrun():
+    registry = _registry("soffice", "mammoth", "reportlab")
+    _measure(registry, soffice=10.0, mammoth=1.0, reportlab=0.5)
+    assert _names(registry.plan(size=2 * MB, budget_s=5.0)) == ["mammoth", "reportlab", "soffice"]
+    assert _names(registry.plan(size=2 * MB, budget_s=60.0)) == ["soffice", "mammoth", "reportlab"]
+
+
+def test_cooling_backends_go_last():
+    registry = _registry("soffice", "mammoth")
+    registry.cool_down(registry.backends()[:1])
+    assert _names(registry.plan()) == ["mammoth", "soffice"]
+
+
+def test_document_is_only_inspected_on_the_fast_path(monkeypatch, tmp_path):
+    import pdf_pipeline
+    from docx import Document
+
+    docx_path = tmp_path / "a.docx"
+    doc = Document()
+    doc.add_paragraph("hello")
+    doc.save(docx_path)
+    calls = []
+    monkeypatch.setattr(pdf_pipeline, "inspect_docx", lambda p: calls.append(p) or SIMPLE)
+    pdf_pipeline.convert_docx_to_pdf(docx_path, tmp_path / "out", use_cache=False, fast_path=False)
+    assert calls == []
+    pdf_pipeline.convert_docx_to_pdf(docx_path, tmp_path / "out", use_cache=False, fast_path=True)
+    assert len(calls) == 1
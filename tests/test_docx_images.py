@@ -0,0 +1,47 @@
+import io
+import random
+import zipfile
+
+import pytest
+from PIL import Image
+
+from benchmark import make_image_docx
+from docx_images import display_widths, downsample, image_key
+
+
+def _jpeg(width: int, height: int, orientation: int = 1) -> bytes:
+    img = Image.frombytes("RGB", (width, height), random.Random(1).randbytes(width * height * 3))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=85, exif=exif)
+    return out.getvalue()
+
+
+def test_display_widths_keys_images_by_content(tmp_path):
+    docx = make_image_docx(tmp_path / "photos.docx", 2)
+    with zipfile.ZipFile(docx) as z:
+        media = {image_key(z.read(n)) for n in z.namelist() if n.startswith("word/media/")}
+    widths = display_widths(docx)
+    assert set(widths) == media
+    assert all(w == pytest.approx(8 / 2.54) for w in widths.values())  # drawn 8 cm wide
+
+
+def test_downsample_scales_to_the_drawn_width():
+    data, kind = downsample(_jpeg(1600, 1200), "image/jpeg", width_in=2, dpi=150)
+    assert kind == "image/jpeg"
+    assert Image.open(io.BytesIO(data)).size == (300, 225)
+
+
+@pytest.mark.parametrize("orientation", [6, 8])
+def test_downsample_uses_the_upright_size_of_rotated_photos(orientation):
+    # Stored 1600x1200 but shown rotated: 1200 wide, 1600 tall once upright.
+    data, _ = downsample(_jpeg(1600, 1200, orientation), "image/jpeg", width_in=2, dpi=150)
+    assert Image.open(io.BytesIO(data)).size == (300, 400)
+
+
+def test_small_or_unreadable_images_are_kept():
+    small = _jpeg(320, 240)
+    assert downsample(small, "image/jpeg", width_in=2, dpi=150) == (small, "image/jpeg")
+    assert downsample(b"EMF data", "image/x-emf", width_in=2, dpi=150) == (b"EMF data", "image/x-emf")
+    assert downsample(small, "image/jpeg", width_in=0.5, dpi=0) == (small, "image/jpeg")
@@ -0,0 +1,53 @@
+import io
+import threading
+
+from docx import Document
+from docx.shared import Inches
+from PIL import Image
+from pypdf import PdfReader
+from reportlab import rl_config
+
+import docx_reportlab
+
+
+def _docx(path, paragraphs=20):
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 300), (200, 30, 30)).save(buf, "JPEG")
+    doc = Document()
+    doc.add_heading("Report", 1)
+    for i in range(paragraphs):
+        doc.add_paragraph(f"Paragraph {i}")
+    buf.seek(0)
+    doc.add_picture(buf, width=Inches(3))
+    doc.save(path)
+    return path
+
+
+def test_converts_text_and_images_without_ascii85(tmp_path):
+    pdf = tmp_path / "out.pdf"
+    assert docx_reportlab.convert(_docx(tmp_path / "in.docx"), pdf)
+    reader = PdfReader(pdf)
+    assert "Paragraph 19" in "".join(page.extract_text() for page in reader.pages)
+    images = [img for page in reader.pages for img in page.images]
+    assert len(images) == 1
+    assert b"ASCII85Decode" not in pdf.read_bytes()
+
+
+def test_reportlab_setting_is_restored_after_overlapping_builds(tmp_path):
+    assert rl_config.useA85 == 1
+    sources = [_docx(tmp_path / f"in{i}.docx", paragraphs=200) for i in range(3)]
+    errors = []
+
+    def run(i):
+        try:
+            assert docx_reportlab.convert(sources[i], tmp_path / f"out{i}.pdf")
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert rl_config.useA85 == 1
@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+import pytest
+
+import app as app_module
+from merge_jobs import DONE, RUNNING, JobRunner, JobStore, _process_token
+from scheduler import Overloaded
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    runner = JobRunner(JobStore(tmp_path / "jobs"))
+    monkeypatch.setattr(app_module, "get_runner", lambda: runner)
+    yield runner
+    runner.shutdown()
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def _submit(client, files):
+    data = {"files": [(open(p, "rb"), name) for p, name in files]}
+    return client.post("/jobs", data=data, content_type="multipart/form-data")
+
+
+def _wait(runner, job_id, timeout=10.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        job = runner.store.get(job_id)
+        if job["finished"] is not None:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_upload_names_cannot_leave_the_job_dir(client, runner, make_pdf):
+    a, b = make_pdf("a.pdf", 1), make_pdf("b.pdf", 2)
+    response = _submit(client, [(a, "../../escape.pdf"), (b, "/tmp/b.pdf")])
+    assert response.status_code == 202
+    job_id = response.get_json()["id"]
+    inputs = [runner.store.job_dir(job_id) / "inputs" / name for name in ("escape.pdf", "b.pdf")]
+    assert json.loads(runner.store.get(job_id)["inputs"]) == [str(p) for p in inputs]
+    assert not (runner.store.root / "escape.pdf").exists()
+    assert _wait(runner, job_id)["status"] == DONE
+
+
+def test_failed_upload_leaves_no_job_dir(client, runner, make_pdf, monkeypatch):
+    def _fail(files, upload_dir):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(app_module, "_save_uploads", _fail)
+    assert _submit(client, [(make_pdf("a.pdf", 1), "a.pdf")]).status_code == 500
+    assert list((runner.store.root / "files").iterdir()) == []
+
+
+def _orphan(store, make_pdf, owner):
+    """A job left "running" by a process with this owner token."""
+    job_id, upload_dir = store.new_job_dir()
+    store.create(job_id, [make_pdf("a.pdf", 1)], False, "out.pdf")
+    store.update(job_id, status=RUNNING, pid=os.getpid(), owner=owner)
+    return job_id
+
+
+def test_orphan_with_a_reused_pid_is_requeued(tmp_path, make_pdf):
+    store = JobStore(tmp_path / "jobs")
+    # Same pid as this process, but a different start time: the pid was handed out again.
+    boot_id, pid, start = _process_token().split(":")
+    orphan = _orphan(store, make_pdf, f"{boot_id}:{pid}:{int(start) - 1}")
+    mine = _orphan(store, make_pdf, _process_token())
+
+    assert store.requeue_orphans() == [orphan]
+    assert store.status(mine) == RUNNING
+
+    runner = JobRunner(store)
+    try:
+        assert _wait(runner, orphan)["status"] == DONE
+    finally:
+        runner.shutdown()
+
+
+def test_admit_counts_queued_jobs_of_every_process(tmp_path, make_pdf):
+    store = JobStore(tmp_path / "jobs")
+    runner = JobRunner(store, workers=1, max_queued=2)
+    try:
+        # Running elsewhere, so not held against this runner's queue.
+        for _ in range(3):
+            _orphan(store, make_pdf, _process_token())
+        runner.admit()
+        for _ in range(2):
+            job_id, _dir = store.new_job_dir()
+            store.create(job_id, [make_pdf("a.pdf", 1)], False, "out.pdf")
+        with pytest.raises(Overloaded):
+            runner.admit()
+    finally:
+        runner.shutdown()
+
+
+def test_job_download_answers_range_requests(client, runner, make_pdf):
+    job_id = _submit(client, [(make_pdf("a.pdf", 3), "a.pdf")]).get_json()["id"]
+    assert _wait(runner, job_id)["status"] == DONE
+    full = client.get(f"/jobs/{job_id}/download")
+    assert full.status_code == 200 and full.headers["Accept-Ranges"] == "bytes"
+
+    part = client.get(f"/jobs/{job_id}/download", headers={"Range": "bytes=-50"})
+    assert part.status_code == 206
+    assert part.data == full.data[-50:]
+    stale = client.get(f"/jobs/{job_id}/download", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert stale.status_code == 200 and stale.data == full.data
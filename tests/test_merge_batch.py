@@ -0,0 +1,71 @@
+import json
+import shutil
+import threading
+
+import pytest
+from pypdf import PdfReader
+
+import merge_batch
+from merge_batch import load_manifest, run_batch
+
+
+def _write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def test_manifest_formats_and_paths(tmp_path):
+    job = {"id": "q3", "inputs": ["cover.docx", "annex.pdf:1-3"], "output": "out/q3.pdf", "enumerate": True}
+    for name, text in [
+        ("list.json", json.dumps([job])),
+        ("wrapped.json", json.dumps({"jobs": [job]})),
+        ("lines.jsonl", json.dumps(job) + "\n\n" + json.dumps({**job, "id": None, "output": "b.pdf"})),
+    ]:
+        jobs = load_manifest(_write(tmp_path / name, text))
+        assert jobs[0].id == "q3" and jobs[0].enumerate
+        assert jobs[0].inputs == [tmp_path / "cover.docx", tmp_path / "annex.pdf"]
+        assert jobs[0].page_ranges == [None, "1-3"]
+        assert jobs[0].output == tmp_path / "out" / "q3.pdf"
+    assert jobs[1].id == "job2"
+
+
+@pytest.mark.parametrize("text, message", [
+    ('[{"inputs": ["a.pdf"], "output": "o.pdf", "colour": 1}]', "m.json job 1: unknown key\\(s\\) colour"),
+    ('{"inputs": ["a.pdf"], "output": "o.pdf"}\n{"inputs": [', "m.json line 2"),
+    ('[{"inputs": [], "output": "o.pdf"}]', "non-empty list"),
+    ('[{"inputs": ["a.pdf:3-1"], "output": "o.pdf"}]', "Invalid page range '3-1'"),
+    ('[{"inputs": ["a.pdf"], "output": "o.pdf"}, {"inputs": ["b.pdf"], "output": "o.pdf"}]', "same file"),
+    ("[]", "no jobs"),
+])
+def test_bad_manifests_name_the_problem(tmp_path, text, message):
+    with pytest.raises(ValueError, match=message):
+        load_manifest(_write(tmp_path / "m.json", text))
+
+
+def test_shared_documents_convert_once_and_failures_stay_per_job(tmp_path, make_pdf, monkeypatch):
+    source = make_pdf("source.pdf", 2)
+    for name in ("shared.docx", "own.docx"):
+        (tmp_path / name).write_bytes(b"placeholder")
+    calls = []
+    lock = threading.Lock()
+
+    def convert(docx, output_dir):
+        with lock:
+            calls.append(docx.name)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        return shutil.copy(source, output_dir / f"{docx.stem}.pdf")
+
+    monkeypatch.setattr(merge_batch, "convert_docx_to_pdf", convert)
+    manifest = _write(tmp_path / "m.json", json.dumps([
+        {"id": "one", "inputs": ["shared.docx", "source.pdf"], "output": "one.pdf"},
+        {"id": "two", "inputs": ["shared.docx", "own.docx"], "output": "two.pdf", "enumerate": True},
+        {"id": "bad", "inputs": ["shared.docx", "missing.pdf"], "output": "bad.pdf"},
+    ]))
+
+    results = run_batch(load_manifest(manifest), jobs=3)
+
+    assert sorted(calls) == ["own.docx", "shared.docx"]
+    assert [(r.id, r.ok) for r in results] == [("one", True), ("two", True), ("bad", False)]
+    assert "missing.pdf" in results[2].error
+    assert len(PdfReader(tmp_path / "two.pdf").pages) == 4
+    assert not (tmp_path / "bad.pdf").exists()
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+from pypdf import PdfReader
+
+import app as app_module
+import merge_cache
+from benchmark import make_table_docx
+from disk_cache import DiskCache
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A fresh, enabled result cache per test."""
+    cache = DiskCache(tmp_path / "merges", 64 * 1024 * 1024)
+    monkeypatch.setattr(merge_cache, "_result_cache", cache)
+    return cache
+
+
+def _merge(client, *paths, headers=None):
+    data = {"files": [(open(p, "rb"), p.name) for p in paths]}
+    return client.post("/merge", data=data, content_type="multipart/form-data", headers=headers)
+
+
+def test_cached_merge_has_etag_and_answers_304(client, cache, make_pdf):
+    a, b = make_pdf("a.pdf", 2), make_pdf("b.pdf", 3)
+    first = _merge(client, a, b)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Content-Location"] == f"/merges/{etag.strip(chr(34))}"
+
+    again = _merge(client, a, b, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+
+def test_cached_result_serves_byte_ranges(client, cache, make_pdf):
+    first = _merge(client, make_pdf("a.pdf", 2), make_pdf("b.pdf", 1))
+    location = first.headers["Content-Location"]
+
+    part = client.get(location, headers={"Range": "bytes=0-99"})
+    assert part.status_code == 206
+    assert part.data == first.data[:100]
+    assert part.headers["Content-Range"] == f"bytes 0-99/{len(first.data)}"
+    assert client.get(location, headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+
+def test_no_etag_when_the_cache_is_disabled(client, tmp_path, monkeypatch, make_pdf):
+    monkeypatch.setattr(merge_cache, "_result_cache", DiskCache(tmp_path / "off", 0))
+    a, b = make_pdf("a.pdf", 2), make_pdf("b.pdf", 3)
+    first = _merge(client, a, b)
+    assert first.status_code == 200
+    assert "ETag" not in first.headers and "Content-Location" not in first.headers
+
+    key = merge_cache.merge_key([merge_cache.file_sha256(a), merge_cache.file_sha256(b)])
+    assert _merge(client, a, b, headers={"If-None-Match": f'"{key}"'}).status_code == 200
+
+
+def test_fallback_conversions_are_not_cached(cache, tmp_path, make_pdf, monkeypatch):
+    docx = make_table_docx(tmp_path / "t.docx", 1)
+    pdf = make_pdf("a.pdf", 1)
+    # Pretend a better backend is installed than the one that will do the conversion.
+    best = SimpleNamespace(name="better-than-anything-here")
+    monkeypatch.setattr(merge_cache, "backend_registry", SimpleNamespace(available=lambda: [best]))
+
+    (tmp_path / "work1").mkdir(), (tmp_path / "work2").mkdir()
+    key, path = merge_cache.merge_cached([docx, pdf], tmp_path / "work1")
+    assert key is None and path.exists()
+    assert cache.stats()["entries"] == 0
+
+    monkeypatch.undo()
+    monkeypatch.setattr(merge_cache, "_result_cache", cache)
+    key, _ = merge_cache.merge_cached([docx, pdf], tmp_path / "work2")
+    assert key is not None and merge_cache.cached_result(key) is not None
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_result_never_overwrites_an_input_in_the_work_dir(tmp_path, monkeypatch, make_pdf, enabled):
+    monkeypatch.setattr(merge_cache, "_result_cache", DiskCache(tmp_path / "merges", 2**26 if enabled else 0))
+    work = tmp_path / "work"
+    work.mkdir()
+    first = make_pdf("merged.pdf", 2).rename(work / "merged.pdf")
+    original = first.read_bytes()
+
+    _, path = merge_cache.merge_cached([first, make_pdf("b.pdf", 1)], work)
+    assert first.read_bytes() == original
+    assert path != first and len(PdfReader(path).pages) == 3
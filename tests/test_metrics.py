@@ -0,0 +1,41 @@
+import threading
+
+from metrics import Histogram
+
+
+def test_nested_captures_each_get_their_block():
+    h = Histogram("test_nested_seconds", "test")
+    with h.capture() as outer:
+        h.observe(1.0, stage="a")
+        with h.capture() as inner:
+            h.observe(2.0, stage="b")
+        h.observe(3.0, stage="c")
+    h.observe(4.0, stage="d")
+
+    assert inner == [({"stage": "b"}, 2.0)]
+    assert [v for _, v in outer] == [1.0, 2.0, 3.0]
+    assert h.totals()[(("stage", "d"),)] == (4.0, 1)
+
+
+def test_captures_only_see_their_own_thread():
+    h = Histogram("test_threads_seconds", "test")
+    ready, done = threading.Event(), threading.Event()
+    results = {}
+
+    def other():
+        with h.capture() as observed:
+            ready.set()
+            h.observe(5.0)
+            done.wait(5)
+        results["other"] = observed
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    ready.wait(5)
+    with h.capture() as mine:
+        h.observe(6.0)
+        done.set()
+    thread.join(5)
+
+    assert mine == [({}, 6.0)]
+    assert results["other"] == [({}, 5.0)]
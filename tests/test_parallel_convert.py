@@ -0,0 +1,73 @@
+import io
+import shutil
+import threading
+import time
+
+import pytest
+from pypdf import PdfReader
+
+import pdf_pipeline
+
+
+@pytest.fixture
+def docs(tmp_path, make_pdf):
+    """Six placeholder .docx inputs; document i "converts" to a PDF with i + 1 pages."""
+    sources = []
+    for i in range(6):
+        make_pdf(f"src{i}.pdf", i + 1)
+        docx = tmp_path / f"doc{i}.docx"
+        docx.write_bytes(b"placeholder")
+        sources.append(docx)
+    return sources
+
+
+def _fake_converter(monkeypatch, convert):
+    def _convert(docx_path, output_dir=None, **_options):
+        output_dir.mkdir(parents=True, exist_ok=True)
+        return convert(int(docx_path.stem[3:]), docx_path, output_dir)
+
+    monkeypatch.setattr(pdf_pipeline, "convert_docx_to_pdf", _convert)
+
+
+def test_parallel_conversions_keep_input_order(docs, monkeypatch):
+    def convert(i, docx_path, output_dir):
+        time.sleep(0.02 * (6 - i))  # later inputs finish first
+        return shutil.copy(docx_path.with_name(f"src{i}.pdf"), output_dir / "out.pdf")
+
+    _fake_converter(monkeypatch, convert)
+    out = io.BytesIO()
+    assert pdf_pipeline.write_merged_pdf(docs, out, jobs=4) == 21
+    counts = []
+    for page in PdfReader(out).pages:
+        text = page.extract_text()
+        counts.append(int(text.split(" of ", 1)[1].split()[0]))
+    assert counts == [n for n in range(1, 7) for _ in range(n)]
+
+
+def test_jobs_sets_the_concurrency(docs, monkeypatch):
+    barrier = threading.Barrier(4, timeout=5)
+
+    def convert(i, docx_path, output_dir):
+        if i < 4:
+            barrier.wait()  # only passes if four conversions run at the same time
+        return shutil.copy(docx_path.with_name(f"src{i}.pdf"), output_dir / "out.pdf")
+
+    _fake_converter(monkeypatch, convert)
+    assert pdf_pipeline.write_merged_pdf(docs, io.BytesIO(), jobs=4) == 21
+
+
+def test_first_failure_cancels_conversions_not_yet_started(docs, monkeypatch):
+    started = []
+
+    def convert(i, docx_path, output_dir):
+        started.append(i)
+        if i == 0:
+            raise RuntimeError("doc0 is broken")
+        time.sleep(0.2)
+        return shutil.copy(docx_path.with_name(f"src{i}.pdf"), output_dir / "out.pdf")
+
+    _fake_converter(monkeypatch, convert)
+    with pytest.raises(RuntimeError, match="doc0 is broken"):
+        pdf_pipeline.write_merged_pdf(docs, io.BytesIO(), jobs=2)
+    # doc1 was running; the free worker may have taken doc2 before the failure was seen.
+    assert {0, 1} <= set(started) and len(started) <= 3
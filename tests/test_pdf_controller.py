@@ -0,0 +1,36 @@
+import sys
+
+import pytest
+from pypdf import PdfReader
+
+import pdf_controller
+
+
+def _main(monkeypatch, *argv) -> int:
+    monkeypatch.setattr(sys, "argv", ["pdf_controller.py", *map(str, argv)])
+    return pdf_controller.main()
+
+
+def test_profile_is_a_flag_and_keeps_every_input(monkeypatch, make_pdf, tmp_path):
+    a, b = make_pdf("a.pdf", 3), make_pdf("b.pdf", 2)
+    out = tmp_path / "out.pdf"
+    assert _main(monkeypatch, "--profile-dir", tmp_path / "prof", "--profile", a, b, "-o", out) == 0
+    assert len(PdfReader(out).pages) == 5
+    assert list((tmp_path / "prof").glob("*.pstats"))
+
+
+def test_profile_dir_that_is_a_file_is_a_usage_error(monkeypatch, make_pdf, tmp_path, capsys):
+    a = make_pdf("a.pdf")
+    with pytest.raises(SystemExit) as exc:
+        _main(monkeypatch, "--profile-dir", a, a, "-o", tmp_path / "out.pdf")
+    assert exc.value.code == 2
+    assert "not a directory" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("output", ["{tmp}", "{tmp}/a.pdf/out.pdf"])
+def test_unusable_output_path_is_a_usage_error(monkeypatch, make_pdf, tmp_path, capsys, output):
+    a = make_pdf("a.pdf")
+    with pytest.raises(SystemExit) as exc:
+        _main(monkeypatch, a, "-o", output.format(tmp=tmp_path))
+    assert exc.value.code == 2
+    assert "output file" in capsys.readouterr().err
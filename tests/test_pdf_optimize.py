@@ -0,0 +1,63 @@
+import io
+
+from pypdf import PdfReader, PdfWriter
+
+import metrics
+from pdf_optimize import dedupe_objects, optimize_pdf
+from pdf_pipeline import write_merged_pdf
+
+
+def _merged(paths, **options) -> bytes:
+    out = io.BytesIO()
+    write_merged_pdf(paths, out, **options)
+    return out.getvalue()
+
+
+def test_dedupe_shares_identical_objects_and_keeps_pages(make_pdf):
+    a = make_pdf("a.pdf", 3)
+    plain = _merged([a, a, a])
+    deduped = _merged([a, a, a], dedupe=True)
+    assert len(deduped) < len(plain)
+
+    before, after = PdfReader(io.BytesIO(plain)), PdfReader(io.BytesIO(deduped))
+    assert len(after.pages) == len(before.pages) == 9
+    assert [p.extract_text() for p in after.pages] == [p.extract_text() for p in before.pages]
+
+
+def test_dedupe_reaches_a_fixed_point(make_pdf):
+    writer = PdfWriter()
+    for _ in range(2):
+        writer.append(str(make_pdf("a.pdf", 2)))
+    assert dedupe_objects(writer).objects > 0
+    assert dedupe_objects(writer).objects == 0
+
+
+def test_optimize_writes_once_unless_asked_for_the_size_before(make_pdf):
+    writer = PdfWriter()
+    writer.append(str(make_pdf("a.pdf", 2)))
+    unoptimized = io.BytesIO()
+    writer.write(unoptimized)
+    writes = []
+    original = writer.write
+    writer.write = lambda stream: writes.append(stream) or original(stream)
+
+    result = optimize_pdf(writer, io.BytesIO(), "lossless")
+    assert result.bytes_before == 0 and len(writes) == 1
+
+    writer = PdfWriter()
+    writer.append(str(make_pdf("a.pdf", 2)))
+    assert optimize_pdf(writer, io.BytesIO(), "lossless", measure_before=True).bytes_before == len(
+        unoptimized.getvalue()
+    )
+
+
+def test_pipeline_reports_input_and_output_sizes(make_pdf):
+    a, b = make_pdf("a.pdf", 3), make_pdf("b.pdf", 2)
+    inputs_before = metrics.BYTES.get(stage="optimize", direction="inputs")
+    out_before = metrics.BYTES.get(stage="optimize", direction="out")
+    out = io.BytesIO()
+    write_merged_pdf([a, b], out, enumerate=True, page_ranges=["1", None], optimize="lossless")
+
+    inputs = metrics.BYTES.get(stage="optimize", direction="inputs") - inputs_before
+    assert inputs == a.stat().st_size + b.stat().st_size
+    assert metrics.BYTES.get(stage="optimize", direction="out") - out_before == len(out.getvalue())
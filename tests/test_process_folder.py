@@ -0,0 +1,50 @@
+import os
+
+from pypdf import PdfReader
+
+from add_page_numbers import MANIFEST_NAME, process_folder
+from benchmark import make_text_pdf
+
+
+def _folder(root):
+    (root / "sub").mkdir()
+    make_text_pdf(root / "a.pdf", 2)
+    make_text_pdf(root / "sub" / "b.pdf", 3)
+    make_text_pdf(root / "old_iloveVerum.pdf", 1)  # an earlier output: never numbered again
+    (root / "broken.pdf").write_bytes(b"not a pdf")
+    return root
+
+
+def test_batch_names_outputs_and_counts_failures(tmp_path):
+    root = _folder(tmp_path)
+    result = process_folder(root, recursive=True, jobs=2)
+
+    assert (result.numbered, result.failed, result.pages) == (2, 1, 5)
+    assert sorted(p.relative_to(root).as_posix() for p in root.rglob("*_iloveVerum.pdf")) == [
+        "a_iloveVerum.pdf", "old_iloveVerum.pdf", "sub/b_iloveVerum.pdf",
+    ]
+    assert "Pag. 3/3" in PdfReader(root / "sub" / "b_iloveVerum.pdf").pages[2].extract_text()
+    assert not list(root.rglob("*.part"))
+
+
+def test_subfolders_only_when_recursive(tmp_path):
+    root = _folder(tmp_path)
+    assert process_folder(root).numbered == 1
+    assert not (root / "sub" / "b_iloveVerum.pdf").exists()
+
+
+def test_incremental_run_skips_unchanged_inputs(tmp_path):
+    root = _folder(tmp_path)
+    (root / "broken.pdf").unlink()
+    assert process_folder(root, recursive=True, incremental=True).numbered == 2
+    assert (root / MANIFEST_NAME).exists()
+
+    again = process_folder(root, recursive=True, incremental=True)
+    assert (again.numbered, again.skipped) == (0, 2)
+
+    # Touched but identical: hashed, still skipped. Changed content: numbered again.
+    os.utime(root / "a.pdf", ns=(1, 1))
+    make_text_pdf(root / "sub" / "b.pdf", 4)
+    third = process_folder(root, recursive=True, incremental=True)
+    assert (third.numbered, third.skipped) == (1, 1)
+    assert len(PdfReader(root / "sub" / "b_iloveVerum.pdf").pages) == 4
@@ -0,0 +1,16 @@
+import socket
+
+from scheduler import _peer_closed
+
+
+def test_peer_closed_peeks_without_consuming():
+    ours, theirs = socket.socketpair()
+    try:
+        assert not _peer_closed(ours)
+        theirs.sendall(b"x")
+        assert not _peer_closed(ours)
+        assert ours.recv(1) == b"x"  # the peeked byte is still there
+        theirs.close()
+        assert _peer_closed(ours)
+    finally:
+        ours.close()
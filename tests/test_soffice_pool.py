@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+
+import pytest
+
+from scheduler import Deadline
+from soffice_pool import SofficeError, SofficePool
+
+# Stands in for LibreOffice: logs every start, "converts" by writing the PDF, and
+# hangs on documents named hang*.docx.
+FAKE_SOFFICE = """#!/bin/sh
+profile=$(printf '%s\\n' "$@" | sed -n 's/^-env:UserInstallation=file:\\/\\///p')
+case "$*" in
+  *--terminate_after_init*) echo "init $profile" >> "$SOFFICE_LOG"; exit 0 ;;
+esac
+for last in "$@"; do :; done
+while [ "$1" != "--outdir" ]; do shift; done
+echo "convert $profile" >> "$SOFFICE_LOG"
+case "$(basename "$last")" in hang*) exec sleep 30 ;; esac
+echo "%PDF-1.4" > "$2/$(basename "$last" .docx).pdf"
+"""
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    soffice = tmp_path / "soffice"
+    soffice.write_text(FAKE_SOFFICE)
+    soffice.chmod(0o755)
+    monkeypatch.setenv("SOFFICE_LOG", str(tmp_path / "log"))
+    pool = SofficePool(size=1, max_jobs=2, timeout=20, soffice=str(soffice))
+    pool.use_uno, pool.mode = False, "cold-start"  # exercise the subprocess path even if uno is installed
+    yield pool
+    pool.shutdown()
+
+
+def _log(tmp_path):
+    return [line.split() for line in (tmp_path / "log").read_text().splitlines()]
+
+
+def test_worker_is_recycled_after_max_jobs(pool, tmp_path):
+    for name in ("a", "b", "c"):
+        docx = tmp_path / f"{name}.docx"
+        docx.write_bytes(b"docx")
+        assert pool.convert(docx, tmp_path).read_text().startswith("%PDF")
+
+    log = _log(tmp_path)
+    assert [event for event, _ in log] == ["init", "convert", "convert", "init", "convert"]
+    first, second = log[0][1], log[3][1]
+    assert first != second and log[1][1] == log[2][1] == first and log[4][1] == second
+    assert not os.path.exists(first)  # the retired worker's profile is removed
+
+
+def test_cancel_kills_the_conversion_and_discards_the_worker(pool, tmp_path):
+    docx = tmp_path / "hang.docx"
+    docx.write_bytes(b"docx")
+    deadline = Deadline(None)
+    threading.Timer(0.5, deadline.cancel).start()
+
+    started = time.monotonic()
+    with pytest.raises(SofficeError, match="exit -9"):
+        pool.convert(docx, tmp_path, cancel=deadline)
+    assert time.monotonic() - started < 10
+    profile = _log(tmp_path)[0][1]
+    assert not os.path.exists(profile) and pool._created == 0
+    assert pool._idle.empty()
@@ -0,0 +1,46 @@
+import io
+import re
+
+import pytest
+from pypdf import PdfReader
+
+from streaming_merge import stream_merge
+
+
+def _xref_offsets(data: bytes) -> dict[int, int]:
+    """In-use entries of the (single, classic) xref table: object number -> offset."""
+    start = int(re.search(rb"startxref\s+(\d+)", data).group(1))
+    lines = data[start:].split(b"\n")
+    first, count = map(int, lines[1].split())
+    entries = {}
+    for num, line in enumerate(lines[2:2 + count], start=first):
+        offset, _gen, kind = line.split()
+        if kind == b"n":
+            entries[num] = int(offset)
+    return entries
+
+
+@pytest.mark.parametrize("numbered", [False, True])
+def test_duplicate_selections_get_every_object_written(make_pdf, numbered):
+    a, b = make_pdf("a.pdf", 3), make_pdf("b.pdf", 2)
+    out = io.BytesIO()
+    # "2,2" for a and "1-2,1" for b, as page ranges.
+    assert stream_merge([a, b], [[1, 1], [0, 1, 0]], out, enumerate=numbered) == 5
+    data = out.getvalue()
+
+    for num, offset in _xref_offsets(data).items():
+        assert offset > 0, f"object {num} is in use but was never written"
+        assert data[offset:].startswith(b"%d 0 obj" % num)
+
+    reader = PdfReader(io.BytesIO(data), strict=True)
+    texts = [page.extract_text() for page in reader.pages]
+    expected = ["page 2 of 3", "page 2 of 3", "page 1 of 2", "page 2 of 2", "page 1 of 2"]
+    assert [f"Synthetic {e}" in t for e, t in zip(expected, texts)] == [True] * 5
+    if numbered:
+        assert [f"Pag. {i}/5" in t for i, t in enumerate(texts, start=1)] == [True] * 5
+
+
+def test_progress_reports_merge_per_page_then_write(make_pdf):
+    calls = []
+    stream_merge([make_pdf("a.pdf", 2)], [[0, 1]], io.BytesIO(), progress=lambda *c: calls.append(c))
+    assert calls == [("merge", 1, 2), ("merge", 2, 2), ("write", 0, 1), ("write", 1, 1)]
@@ -0,0 +1,110 @@
+import hashlib
+import io
+
+import pytest
+from pypdf import PdfReader
+
+import app as app_module
+from blob_store import BlobStore
+from merge_jobs import JobRunner, JobStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = BlobStore(tmp_path / "blobs")
+    monkeypatch.setattr(app_module, "get_store", lambda: store)
+    return store
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def _announce(client, data: bytes):
+    return client.post("/uploads", json={"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)})
+
+
+def _chunk(client, upload_id: str, offset: int, data: bytes):
+    return client.patch(f"/uploads/{upload_id}", data=data, headers={"Upload-Offset": str(offset)})
+
+
+def test_interrupted_upload_resumes_from_the_server_offset(client, store, make_pdf):
+    data = make_pdf("a.pdf", 3).read_bytes()
+    half = len(data) // 2
+
+    started = _announce(client, data)
+    assert started.status_code == 201
+    upload_id = started.get_json()["upload_id"]
+    assert _chunk(client, upload_id, 0, data[:half]).get_json()["offset"] == half
+
+    # A retried chunk whose first attempt did arrive: refused, with the offset to use.
+    stale = _chunk(client, upload_id, 0, data[:half])
+    assert stale.status_code == 409
+    assert stale.get_json()["offset"] == half
+
+    # A client that lost track asks, then continues from there.
+    offset = client.get(f"/uploads/{upload_id}").get_json()["offset"]
+    done = _chunk(client, upload_id, offset, data[offset:]).get_json()
+    assert done["complete"] and done["blob_id"] == upload_id
+
+    again = _announce(client, data)
+    assert again.status_code == 200 and again.get_json()["complete"]
+
+    merged = client.post("/merge", data={"blob_ids": [upload_id, upload_id]}, content_type="multipart/form-data")
+    assert merged.status_code == 200
+    assert len(PdfReader(io.BytesIO(merged.data)).pages) == 6
+
+
+def test_blob_checks_do_not_count_as_cache_traffic(client, store, make_pdf):
+    data = make_pdf("a.pdf", 1).read_bytes()
+    upload_id = _announce(client, data).get_json()["upload_id"]
+    _chunk(client, upload_id, 0, data)
+    for _ in range(3):
+        client.get(f"/uploads/{upload_id}")
+        store.find("0" * 64)
+    assert (store.blobs.stats()["hits"], store.blobs.stats()["misses"]) == (0, 0)
+
+
+def test_size_must_be_a_number_not_a_bool(client, store):
+    response = client.post("/uploads", json={"sha256": "0" * 64, "size": True})
+    assert response.status_code == 400
+
+
+def test_upload_locks_are_dropped_when_the_session_ends(client, store, make_pdf):
+    data = make_pdf("a.pdf", 1).read_bytes()
+    upload_id = _announce(client, data).get_json()["upload_id"]
+    assert _chunk(client, upload_id, 5, data).status_code == 409
+    assert upload_id in store._upload_locks  # the session goes on
+
+    bad = bytearray(data)
+    bad[-20] ^= 1
+    assert _chunk(client, upload_id, 0, bytes(bad)).status_code == 422
+    assert store._upload_locks == {}
+
+    upload_id = _announce(client, data).get_json()["upload_id"]
+    assert _chunk(client, upload_id, 0, data).get_json()["complete"]
+    assert store._upload_locks == {}
+
+
+@pytest.mark.parametrize("route", ["/merge", "/jobs"])
+def test_blob_evicted_before_it_is_linked_is_a_conflict(client, store, make_pdf, tmp_path, monkeypatch, route):
+    data = make_pdf("a.pdf", 1).read_bytes()
+    upload_id = _announce(client, data).get_json()["upload_id"]
+    _chunk(client, upload_id, 0, data)
+    link = store.link
+
+    def evict_then_link(blob_id, dest):
+        store.find(blob_id).unlink()
+        return link(blob_id, dest)
+
+    monkeypatch.setattr(store, "link", evict_then_link)
+    runner = JobRunner(JobStore(tmp_path / "jobs"))
+    monkeypatch.setattr(app_module, "get_runner", lambda: runner)
+    try:
+        response = client.post(route, data={"blob_ids": [upload_id]}, content_type="multipart/form-data")
+    finally:
+        runner.shutdown()
+    assert response.status_code == 409
+    assert "no longer stored" in response.get_data(as_text=True)
+    assert not any(runner.store.root.glob("files/*"))
@@ -0,0 +1,30 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+
+from pdf_pipeline import write_merged_pdf
+
+
+@pytest.mark.parametrize("streaming", [False, True], ids=["in-memory", "streaming"])
+def test_single_pass_merge_numbers_and_reports_progress(make_pdf, streaming):
+    a, b = make_pdf("a.pdf", 3), make_pdf("b.pdf", 2)
+    calls = []
+    out = io.BytesIO()
+
+    pages = write_merged_pdf(
+        [a, b], out, enumerate=True, streaming=streaming, page_ranges=["1,3", None],
+        progress=lambda *call: calls.append(call),
+    )
+
+    assert pages == 4
+    texts = [page.extract_text() for page in PdfReader(out).pages]
+    assert len(texts) == 4
+    assert [f"Pag. {i}/4" in t for i, t in enumerate(texts, start=1)] == [True] * 4
+    assert "Synthetic page 3 of 3" in texts[1] and "Synthetic page 2 of 2" in texts[3]
+    assert calls == [
+        ("convert", 0, 0),
+        *[("merge", i, 4) for i in range(1, 5)],
+        ("write", 0, 1),
+        ("write", 1, 1),
+    ]